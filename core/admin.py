@@ -1,7 +1,10 @@
+from collections import defaultdict
+
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.html import format_html
-from .models import User, Importacao, ConfiguracaoPadrao, HistoricoPreco
+from . import bulk_updates
+from .models import User, Importacao, Lote, Cambio, ConfiguracaoPadrao, HistoricoPreco, ReavaliacaoCambio, PerfilRequisicao, QueryLenta, RelatorioCache, ExportacaoCache
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
@@ -46,6 +49,25 @@ class ConfiguracaoPadraoAdmin(admin.ModelAdmin):
         })
     )
 
+def _acao_status(status, descricao):
+    """Ação do admin que muda o status das importações selecionadas com um UPDATE por usuário.
+
+    A venda precisa de preço e fica na ação em massa da lista de importações.
+    """
+    @admin.action(description=f'Marcar selecionadas como "{descricao}"')
+    def acao(modeladmin, request, queryset):
+        pks_por_usuario = defaultdict(list)
+        for pk, user_id in queryset.values_list('pk', 'user_id'):
+            pks_por_usuario[user_id].append(pk)
+        usuarios = User.objects.in_bulk(list(pks_por_usuario))
+        alteradas = sum(
+            bulk_updates.alterar_status(usuarios[user_id], pks, status)
+            for user_id, pks in pks_por_usuario.items()
+        )
+        modeladmin.message_user(request, f'{alteradas} importações marcadas como "{descricao}".')
+    acao.__name__ = f'marcar_{status}'
+    return acao
+
 @admin.register(Importacao)
 class ImportacaoAdmin(admin.ModelAdmin):
     """Admin para importações"""
@@ -63,10 +85,15 @@ class ImportacaoAdmin(admin.ModelAdmin):
         'custo_eua_total', 'custo_eua_brl', 'frete_py_usd', 'frete_py_brl',
         'custo_total_py_usd', 'custo_total_py_brl', 'custo_total_quantidade_usd',
         'custo_total_quantidade_brl', 'lucro_unitario', 'lucro_total', 
-        'margem_percentual', 'created_at', 'updated_at'
+        'margem_percentual', 'data_importacao', 'created_at', 'updated_at'
     )
     ordering = ('-created_at',)
     date_hierarchy = 'data_importacao'
+    actions = [
+        _acao_status(status, descricao)
+        for status, descricao in Importacao.STATUS_CHOICES
+        if status != 'vendido'
+    ]
     
     fieldsets = (
         ('Produto', {
@@ -79,7 +106,7 @@ class ImportacaoAdmin(admin.ModelAdmin):
             )
         }),
         ('Conversão e Frete PY', {
-            'fields': ('cambio_usdt', 'frete_py_por_kg')
+            'fields': ('cambio_usdt', 'frete_py_usd_kg', 'kg_py_usd', 'lote')
         }),
         ('Status e Datas', {
             'fields': ('status', 'data_importacao')
@@ -142,6 +169,35 @@ class ImportacaoAdmin(admin.ModelAdmin):
         return '-'
     lucro_display.short_description = 'Lucro Total'
 
+@admin.register(Lote)
+class LoteAdmin(admin.ModelAdmin):
+    """Admin para lotes (remessas); salvar rateia de novo frete e taxas entre as importações"""
+    list_display = ('descricao', 'user', 'frete_total_usd', 'taxas_total_usd', 'criterio_rateio', 'created_at')
+    list_filter = ('criterio_rateio', 'created_at', 'user')
+    search_fields = ('descricao', 'user__username')
+    readonly_fields = ('created_at', 'updated_at')
+    ordering = ('-created_at',)
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        bulk_updates.ratear_lote(obj)
+
+@admin.register(Cambio)
+class CambioAdmin(admin.ModelAdmin):
+    """Admin para a série histórica do câmbio (carga em massa: manage.py importar_cambios)"""
+    list_display = ('data', 'cambio_usdt')
+    ordering = ('-data',)
+    date_hierarchy = 'data'
+
+@admin.register(ReavaliacaoCambio)
+class ReavaliacaoCambioAdmin(admin.ModelAdmin):
+    """Admin para o histórico de câmbios aplicados às importações em aberto"""
+    list_display = ('user', 'cambio_usdt', 'importacoes', 'unidades', 'impacto_brl', 'created_at')
+    list_filter = ('created_at', 'user')
+    search_fields = ('user__username',)
+    readonly_fields = ('created_at',)
+    ordering = ('-created_at',)
+
 @admin.register(HistoricoPreco)
 class HistoricoPrecoAdmin(admin.ModelAdmin):
     """Admin para histórico de preços"""
@@ -163,6 +219,42 @@ class HistoricoPrecoAdmin(admin.ModelAdmin):
         })
     )
 
+@admin.register(PerfilRequisicao)
+class PerfilRequisicaoAdmin(admin.ModelAdmin):
+    """Admin para perfis de requisição gravados pelo profiler"""
+    list_display = ('method', 'path', 'view_name', 'status_code', 'duracao_ms', 'total_queries', 'db_ms', 'user', 'created_at')
+    list_filter = ('view_name', 'method', 'created_at')
+    search_fields = ('path', 'view_name')
+    readonly_fields = ('created_at',)
+    ordering = ('-created_at',)
+
+@admin.register(QueryLenta)
+class QueryLentaAdmin(admin.ModelAdmin):
+    """Admin para o log de queries lentas"""
+    list_display = ('duracao_ms', 'view_name', 'user', 'created_at')
+    list_filter = ('view_name', 'created_at')
+    search_fields = ('sql', 'view_name', 'path')
+    readonly_fields = ('created_at',)
+    ordering = ('-created_at',)
+
+@admin.register(RelatorioCache)
+class RelatorioCacheAdmin(admin.ModelAdmin):
+    """Admin para os resultados de relatórios persistidos"""
+    list_display = ('user', 'tipo', 'versao', 'calculado_em')
+    list_filter = ('tipo', 'calculado_em')
+    search_fields = ('user__username',)
+    readonly_fields = ('calculado_em',)
+    exclude = ('dados',)
+
+@admin.register(ExportacaoCache)
+class ExportacaoCacheAdmin(admin.ModelAdmin):
+    """Admin para as exportações pré-geradas"""
+    list_display = ('user', 'nome', 'versao', 'gerado_em')
+    list_filter = ('nome', 'gerado_em')
+    search_fields = ('user__username',)
+    readonly_fields = ('gerado_em',)
+    exclude = ('conteudo',)
+
 # Customização do Admin Site
 admin.site.site_header = 'iPhone Import Manager'
 admin.site.site_title = 'iPhone Import Admin'
@@ -0,0 +1,38 @@
+"""Consultas do ORM (síncrono) a partir de views async.
+
+Com ASYNC_PARALLEL_QUERIES, cada consulta roda em um thread próprio, com a sua conexão, e
+asyncio.gather as executa ao mesmo tempo: com um banco remoto, as latências de rede deixam de
+se somar. Sem a opção (padrão com SQLite), as consultas usam o thread síncrono da requisição,
+como o async ORM do Django, e rodam uma de cada vez.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+
+def _isolada(funcao):
+    @wraps(funcao)
+    def executar(*args, **kwargs):
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            # Threads do executor não recebem request_finished; respeita CONN_MAX_AGE aqui
+            close_old_connections()
+    return executar
+
+
+def consultar(funcao, *args, **kwargs):
+    """Awaitable que executa `funcao(*args, **kwargs)` fora do event loop"""
+    if getattr(settings, 'ASYNC_PARALLEL_QUERIES', False):
+        return consultar_isolada(funcao, *args, **kwargs)
+    return sync_to_async(funcao)(*args, **kwargs)
+
+
+def consultar_isolada(funcao, *args, **kwargs):
+    """consultar em um thread do pool, devolvendo a conexão ao final (respeitando CONN_MAX_AGE).
+
+    Para respostas longas (SSE): o thread da requisição não fica segurando uma conexão aberta.
+    """
+    return sync_to_async(_isolada(funcao), thread_sensitive=False)(*args, **kwargs)
@@ -0,0 +1,246 @@
+"""Alterações em massa nas importações de um usuário com um único UPDATE.
+
+QuerySet.update não chama save() nem dispara sinais: `updated_at` é gravado explicitamente (a
+versão dos dados depende dele, ver core.versioning) e a invalidação e o aviso de core.signals
+são chamados uma vez por alteração. Os grupos persistidos seguem para a nova versão pela
+diferença das linhas alteradas (report_store.registrar_alteracoes), como nas escritas individuais.
+"""
+from decimal import Decimal
+from typing import NamedTuple
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Round
+from django.utils import timezone
+
+from . import price_history, report_store, signals
+from .models import Importacao, Lote, ReavaliacaoCambio
+from .report_data import CUSTO_TOTAL_PY_BRL, CUSTO_TOTAL_PY_USD, centavos
+
+# Base unitária do rateio de cada critério de Lote (a parcela da linha é base x quantidade)
+BASES_RATEIO = {
+    'peso': F('peso_kg'),
+    'valor': F('valor_eua_unitario'),
+}
+_UNITARIO = DecimalField(max_digits=10, decimal_places=2)
+
+# Status cujo custo ainda não foi realizado: são os reavaliados quando o câmbio padrão muda
+STATUS_EM_ABERTO = ['planejado', 'em_transito']
+
+# Limite de importações por ação (cada pk entra nas queries de diferença e no UPDATE)
+MAX_IMPORTACOES = 2000
+
+
+def _update(user, pks, **campos):
+    return Importacao.objects.filter(user=user, pk__in=pks).update(updated_at=timezone.now(), **campos)
+
+
+def _registrar(user, pks, escrever):
+    """registrar_alteracoes para escritas com QuerySet.update: `escrever()` retorna quantas
+    linhas alterou, e a invalidação/aviso de core.signals e a observação de preços acontecem uma
+    vez se alguma mudou"""
+    alteradas = []
+
+    def escrever_pks():
+        quantidade = escrever()
+        if quantidade:
+            signals.dados_alterados(user.pk)
+            # Os preços como ficaram depois do UPDATE, na mesma transação
+            price_history.observar(Importacao.objects.filter(user=user, pk__in=pks).only(*price_history.CAMPOS))
+        alteradas.append(quantidade)
+        return pks if quantidade else []
+
+    if pks:
+        report_store.registrar_alteracoes(user, pks, escrever_pks)
+    return sum(alteradas)
+
+
+def atualizar_importacoes(user, pks, **campos):
+    """Grava `campos` nas importações `pks` do usuário; retorna quantas foram alteradas"""
+    return _registrar(user, pks, lambda: _update(user, pks, **campos))
+
+
+def alterar_status(user, pks, status):
+    """Transição de status (ex.: em_transito -> recebido) das importações `pks`"""
+    return atualizar_importacoes(user, pks, status=status)
+
+
+def registrar_venda(user, pks, preco_venda_unitario, data_venda=None):
+    """Marca as importações `pks` como vendidas pelo mesmo preço unitário (BRL)"""
+    return atualizar_importacoes(
+        user, pks,
+        status='vendido',
+        preco_venda_unitario=preco_venda_unitario,
+        data_venda=data_venda or timezone.localdate(),
+    )
+
+
+def _parcela_unitaria(total, base, soma):
+    """Parte de `total` que cabe a uma unidade de base `base`, em centavos (calculada no banco)"""
+    return Round(Value(total) * base / Value(soma), 2, output_field=_UNITARIO)
+
+
+def _linhas_do_lote(lote):
+    """(pk, base x quantidade, quantidade) de cada importação do lote"""
+    return list(
+        Importacao.objects.filter(user_id=lote.user_id, lote=lote)
+        .annotate(_parcela=BASES_RATEIO[lote.criterio_rateio] * F('quantidade'))
+        .values_list('pk', '_parcela', 'quantidade')
+    )
+
+
+def candidatas_ao_lote(lote):
+    """Importações do usuário que podem receber os custos de `lote`: as em aberto e as que já
+    estão nele (recebidas e vendidas já têm o custo realizado)"""
+    candidatas = Q(status__in=STATUS_EM_ABERTO)
+    if lote.pk:
+        candidatas |= Q(lote=lote)
+    return Importacao.objects.filter(user_id=lote.user_id).filter(candidatas)
+
+
+def _ratear(lote, linhas):
+    """Um UPDATE calcula o rateio de todas as `linhas` do lote; retorna quantas foram rateadas"""
+    if not linhas:
+        return 0
+    base = BASES_RATEIO[lote.criterio_rateio]
+    soma = sum((Decimal(parcela) for _pk, parcela, _quantidade in linhas), Decimal('0'))
+    if not soma:
+        # Linhas sem peso/valor: divide igualmente por unidade
+        base, soma = Value(Decimal('1')), sum(quantidade for _pk, _parcela, quantidade in linhas)
+    pks = [pk for pk, _parcela, _quantidade in linhas]
+    rateadas = _update(
+        lote.user, pks,
+        frete_py_usd_kg=_parcela_unitaria(lote.frete_total_usd, base, soma),
+        kg_py_usd=Decimal('0.00'),
+        taxa_adm_fixa=_parcela_unitaria(lote.taxas_total_usd, base, soma),
+    )
+    _corrigir_arredondamento(lote, linhas)
+    return rateadas
+
+
+def _linha_do_resto(linhas, resto):
+    """(pk, quantidade) da linha que absorve `resto` centavos: a de maior parcela entre as que
+    podem recebê-lo inteiro por unidade; sem nenhuma, a de maior parcela"""
+    por_parcela = sorted(linhas, key=lambda linha: Decimal(linha[1]), reverse=True)
+    pk, _parcela, quantidade = next(
+        (linha for linha in por_parcela if resto % linha[2] == 0), por_parcela[0],
+    )
+    return pk, quantidade
+
+
+def _corrigir_arredondamento(lote, linhas):
+    """Leva a diferença entre os totais do lote e a soma das parcelas arredondadas para uma linha.
+
+    As parcelas são gravadas por unidade em centavos, então uma linha só absorve múltiplos da sua
+    quantidade em centavos: o total fecha exato sempre que alguma linha divide o resto (qualquer
+    linha de uma unidade). Um SELECT soma o rateado e só há UPDATE quando sobra diferença.
+    """
+    rateado = Importacao.objects.filter(user_id=lote.user_id, pk__in=[pk for pk, _p, _q in linhas]).aggregate(
+        frete=Sum(F('frete_py_usd_kg') * F('quantidade')),
+        taxas=Sum(F('taxa_adm_fixa') * F('quantidade')),
+    )
+    ajustes = {}
+    for campo, total, chave in (
+        ('frete_py_usd_kg', lote.frete_total_usd, 'frete'), ('taxa_adm_fixa', lote.taxas_total_usd, 'taxas'),
+    ):
+        resto = int((centavos(total) - centavos(rateado[chave])) * 100)
+        if resto:
+            pk, quantidade = _linha_do_resto(linhas, resto)
+            ajustes.setdefault(pk, {})[campo] = F(campo) + Decimal(int(resto / quantidade)) / 100
+    for pk, campos in ajustes.items():
+        _update(lote.user, [pk], **campos)
+
+
+def ratear_lote(lote):
+    """Rateia a fatura de frete e as taxas da remessa entre as importações do lote.
+
+    A parcela de cada linha é proporcional a base x quantidade (peso ou valor, conforme o
+    critério) e é gravada por unidade em frete_py_usd_kg e taxa_adm_fixa (kg_py_usd zera: a
+    fatura já é o frete inteiro). Um SELECT soma as bases e um UPDATE calcula todas as linhas de
+    uma vez, qualquer que seja o tamanho do lote; o resto do arredondamento em centavos vai para
+    uma linha (_corrigir_arredondamento). Retorna quantas importações foram rateadas.
+    """
+    linhas = _linhas_do_lote(lote)
+    return _registrar(lote.user, [pk for pk, _parcela, _quantidade in linhas], lambda: _ratear(lote, linhas))
+
+
+def definir_importacoes_do_lote(lote, pks):
+    """Faz do lote as importações `pks` do usuário (em aberto ou já nele, ver candidatas_ao_lote)
+    e rateia de novo as remessas afetadas.
+
+    As importações que saem mantêm o último rateio (viram custos por linha, editáveis); os lotes
+    de onde vieram as novas são rateados de novo entre as linhas que ficaram. Tudo entra numa
+    única diferença dos grupos. Retorna quantas importações ficaram no lote.
+    """
+    user = lote.user
+    atuais = set(Importacao.objects.filter(user=user, lote=lote).values_list('pk', flat=True))
+    # Só as em aberto entram: pks de importações recebidas ou vendidas são ignorados
+    novas = dict(candidatas_ao_lote(lote).filter(pk__in=pks).exclude(lote=lote).values_list('pk', 'lote_id'))
+    removidas = atuais - set(pks)
+    origens = [lote_id for lote_id in set(novas.values()) if lote_id is not None]
+    if origens:
+        origens = list(Lote.objects.filter(user=user, pk__in=origens))
+        for origem in origens:
+            origem.user = user
+        nas_origens = set(Importacao.objects.filter(user=user, lote__in=origens).values_list('pk', flat=True))
+    else:
+        nas_origens = set()
+
+    def escrever():
+        alteradas = 0
+        if removidas:
+            alteradas += _update(user, removidas, lote=None)
+        if novas:
+            alteradas += _update(user, list(novas), lote=lote)
+        for afetado in [*origens, lote]:
+            alteradas += _ratear(afetado, _linhas_do_lote(afetado))
+        return alteradas
+
+    _registrar(user, sorted(atuais | set(novas) | nas_origens), escrever)
+    return len((atuais - removidas) | set(novas))
+
+
+class ImpactoReavaliacao(NamedTuple):
+    """Prévia de uma reavaliação: importações em aberto com outro câmbio e a variação do custo"""
+    importacoes: int
+    unidades: int
+    investido_brl: Decimal
+    impacto_brl: Decimal
+
+
+def _em_aberto_com_outro_cambio(user, cambio):
+    return Importacao.objects.filter(user=user, status__in=STATUS_EM_ABERTO).exclude(cambio_usdt=cambio)
+
+
+def impacto_reavaliacao(user, cambio):
+    """Quanto muda o custo (BRL) das importações em aberto se passarem para `cambio` (uma query)"""
+    totais = _em_aberto_com_outro_cambio(user, cambio).aggregate(
+        importacoes=Count('id'),
+        unidades=Sum('quantidade'),
+        investido_brl=Sum(CUSTO_TOTAL_PY_BRL * F('quantidade')),
+        impacto_brl=Sum(CUSTO_TOTAL_PY_USD * F('quantidade') * (Value(cambio) - F('cambio_usdt'))),
+    )
+    return ImpactoReavaliacao(
+        totais['importacoes'], totais['unidades'] or 0,
+        centavos(totais['investido_brl']), centavos(totais['impacto_brl']),
+    )
+
+
+def reavaliar_cambio(user, cambio):
+    """Aplica `cambio` a todas as importações em aberto do usuário com um único UPDATE e registra
+    a reavaliação no histórico; retorna o ReavaliacaoCambio, ou None se não havia o que reavaliar.
+
+    O UPDATE filtra pelas mesmas condições da prévia, sem lista de pks (não há limite de
+    importações). As pks, travadas na mesma transação, só alimentam a diferença dos grupos.
+    """
+    with transaction.atomic():
+        impacto = impacto_reavaliacao(user, cambio)
+        if not impacto.importacoes:
+            return None
+        em_aberto = _em_aberto_com_outro_cambio(user, cambio)
+        pks = list(em_aberto.select_for_update().values_list('pk', flat=True))
+        _registrar(user, pks, lambda: em_aberto.update(updated_at=timezone.now(), cambio_usdt=cambio))
+        return ReavaliacaoCambio.objects.create(
+            user=user, cambio_usdt=cambio, importacoes=impacto.importacoes,
+            unidades=impacto.unidades, impacto_brl=impacto.impacto_brl,
+        )
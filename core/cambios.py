@@ -0,0 +1,160 @@
+"""Série histórica do câmbio USDT/BRL e avaliação das importações numa data.
+
+O câmbio vigente numa data é o da última cotação até ela (as-of): uma subquery escalar
+(data <= X ORDER BY data DESC LIMIT 1) que percorre o índice único de Cambio.data de trás para a
+frente e lê uma única linha. Correlacionada com data_importacao, avalia cada importação na sua
+própria data de compra, sem carregar as linhas em Python. A carteira inteira numa data sai de uma
+query só: o usuário com LEFT JOIN nas importações, agrupado por status, com a cotação da data como
+subquery escalar, então ela volta mesmo para quem não tem importações.
+"""
+import csv
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import NamedTuple, Optional
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum
+
+from .models import Cambio, Importacao, User
+from .report_data import CUSTO_TOTAL_PY_USD, centavos, custo_total_py_brl, custo_total_py_usd
+
+_CAMBIO = DecimalField(max_digits=10, decimal_places=4)
+_DECIMAL = DecimalField(max_digits=20, decimal_places=6)
+PRECISAO_CAMBIO = Decimal('0.0001')
+# Cotações por INSERT na carga do CSV
+TAMANHO_LOTE = 1000
+_FORMATOS_DATA = ('%Y-%m-%d', '%d/%m/%Y')
+
+
+def cambio_em(data):
+    """Câmbio vigente em `data`: uma data fixa ou uma referência a um campo (OuterRef/F)"""
+    return Subquery(
+        Cambio.objects.filter(data__lte=data).order_by('-data').values('cambio_usdt')[:1],
+        output_field=_CAMBIO,
+    )
+
+
+def cambio_na_compra():
+    """Câmbio vigente na data de compra de cada importação (as-of por linha)"""
+    return cambio_em(OuterRef('data_importacao'))
+
+
+def avaliar_importacoes(importacoes, data=None):
+    """Anota `cambio_na_data` e `custo_total_brl_na_data` (custo da quantidade inteira).
+
+    Com `data`, todas as importações são avaliadas pelo câmbio daquele dia; sem ela, cada uma
+    pelo câmbio do dia da compra (data_importacao). Sem cotação até a data, os dois ficam None.
+    """
+    cambio = cambio_em(data) if data is not None else cambio_na_compra()
+    return importacoes.annotate(
+        cambio_na_data=cambio,
+        custo_total_brl_na_data=ExpressionWrapper(
+            CUSTO_TOTAL_PY_USD * F('quantidade') * F('cambio_na_data'), output_field=_DECIMAL,
+        ),
+    )
+
+
+class AvaliacaoStatus(NamedTuple):
+    """Custo das importações de um status pelo câmbio registrado e pelo câmbio de uma data"""
+    status_key: str
+    status: str
+    importacoes: int
+    unidades: int
+    custo_usd: Decimal
+    custo_brl_registrado: Decimal
+    custo_brl_na_data: Optional[Decimal]
+
+    @property
+    def diferenca(self):
+        if self.custo_brl_na_data is None:
+            return None
+        return self.custo_brl_na_data - self.custo_brl_registrado
+
+
+def avaliar_carteira(user, data):
+    """(câmbio vigente em `data` ou None, linhas por status), numa única query.
+
+    A query parte do usuário com LEFT JOIN nas importações: sem importações ela ainda devolve uma
+    linha (status NULL) com a cotação, e o usuário vê o câmbio da data.
+    """
+    quantidade = F('importacao__quantidade')
+    linhas = (
+        User.objects.filter(pk=user.pk)
+        .annotate(cambio=cambio_em(data))
+        .values_list('importacao__status', 'cambio')
+        .annotate(
+            importacoes=Count('importacao'),
+            unidades=Sum(quantidade),
+            custo_usd=Sum(custo_total_py_usd('importacao__') * quantidade),
+            custo_brl=Sum(custo_total_py_brl('importacao__') * quantidade),
+            custo_brl_na_data=Sum(custo_total_py_usd('importacao__') * quantidade * F('cambio'), output_field=_DECIMAL),
+        )
+        .order_by()
+    )
+    por_status = {linha[0]: linha for linha in linhas}
+    cambio = next((linha[1] for linha in por_status.values()), None)
+    avaliacao = []
+    for chave, rotulo in Importacao.STATUS_CHOICES:
+        if chave in por_status:
+            _status, _cambio, importacoes, unidades, custo_usd, custo_brl, custo_na_data = por_status[chave]
+            avaliacao.append(AvaliacaoStatus(
+                chave, rotulo, importacoes, unidades, centavos(custo_usd), centavos(custo_brl),
+                centavos(custo_na_data) if custo_na_data is not None else None,
+            ))
+    return (Decimal(cambio).quantize(PRECISAO_CAMBIO) if cambio is not None else None), avaliacao
+
+
+def _data(valor):
+    for formato in _FORMATOS_DATA:
+        try:
+            return datetime.strptime(valor.strip(), formato).date()
+        except ValueError:
+            continue
+    raise ValueError(f'Data inválida: {valor!r}')
+
+
+def _cambio(valor):
+    valor = valor.strip()
+    if ',' in valor:
+        # Formato brasileiro: 5,5612 ou 1.234,5
+        valor = valor.replace('.', '').replace(',', '.')
+    try:
+        cambio = Decimal(valor)
+    except InvalidOperation:
+        raise ValueError(f'Câmbio inválido: {valor!r}')
+    if cambio <= 0:
+        raise ValueError(f'Câmbio inválido: {valor!r}')
+    return cambio
+
+
+def ler_csv(arquivo):
+    """Cotações {data: câmbio} de um CSV com colunas `data` e `cambio_usdt` (ou `cambio`).
+
+    Aceita datas ISO ou dd/mm/aaaa, vírgula ou ponto decimal e separador , ou ;. Datas repetidas
+    ficam com a última cotação do arquivo.
+    """
+    amostra = arquivo.read(2048)
+    arquivo.seek(0)
+    try:
+        dialeto = csv.Sniffer().sniff(amostra, delimiters=',;')
+    except csv.Error:
+        dialeto = csv.excel
+    cotacoes = {}
+    for numero, linha in enumerate(csv.DictReader(arquivo, dialect=dialeto), start=2):
+        try:
+            valor = linha.get('cambio_usdt') or linha.get('cambio') or ''
+            cotacoes[_data(linha.get('data') or '')] = _cambio(valor)
+        except ValueError as exc:
+            raise ValueError(f'Linha {numero}: {exc}')
+    return cotacoes
+
+
+def importar_cotacoes(cotacoes, tamanho_lote=TAMANHO_LOTE):
+    """Grava {data: câmbio} com bulk_create em lotes, substituindo as datas já existentes"""
+    Cambio.objects.bulk_create(
+        [Cambio(data=data, cambio_usdt=cambio) for data, cambio in sorted(cotacoes.items())],
+        batch_size=tamanho_lote,
+        update_conflicts=True,
+        unique_fields=['data'],
+        update_fields=['cambio_usdt'],
+    )
+    return len(cotacoes)
@@ -5,15 +5,19 @@ from crispy_forms.layout import Layout, Field, Fieldset, Div, Submit, HTML
 from crispy_forms.bootstrap import FormActions
 from decimal import Decimal
 
-from .models import User, Importacao, ConfiguracaoPadrao, HistoricoPreco
+from .bulk_updates import candidatas_ao_lote
+from .models import User, Importacao, Lote, ConfiguracaoPadrao, HistoricoPreco
 
 class ImportacaoForm(forms.ModelForm):
     """Formulário para importações com cálculos automáticos"""
     
+    # Cada campo de custo recalcula #custos-calculados (os formulários do lote recalculam pelo form inteiro)
+    calculo_por_campo = True
+    
     class Meta:
         model = Importacao
         fields = [
-            'modelo', 'capacidade_gb', 'grade', 'quantidade',
+            'modelo', 'capacidade_gb', 'grade', 'quantidade', 'peso_kg',
             'valor_eua_unitario', 'taxa_adm_percentual', 'taxa_adm_fixa',
             'frete_eua', 'pol_eua', 'cambio_usdt', 'frete_py_usd_kg', 
             'kg_py_usd', 'status', 'preco_venda_unitario', 'data_venda'
@@ -32,6 +36,11 @@ class ImportacaoForm(forms.ModelForm):
                 'class': 'form-control',
                 'min': '1'
             }),
+            'peso_kg': forms.NumberInput(attrs={
+                'class': 'form-control',
+                'step': '0.001',
+                'placeholder': '0.300'
+            }),
             'valor_eua_unitario': forms.NumberInput(attrs={
                 'class': 'form-control',
                 'step': '0.01',
@@ -118,13 +127,20 @@ class ImportacaoForm(forms.ModelForm):
         ]
         
         for field_name in htmx_fields:
-            if field_name in self.fields:
+            if self.calculo_por_campo and field_name in self.fields:
                 self.fields[field_name].widget.attrs.update({
                     'hx-post': '/htmx/calcular-custos/',
                     'hx-trigger': 'input delay:500ms',
                     'hx-target': '#custos-calculados',
                     'hx-include': 'form'
                 })
+        
+        # Sem peso informado (ex.: edição na lista) vale o peso atual ou o padrão do modelo
+        if 'peso_kg' in self.fields:
+            self.fields['peso_kg'].required = False
+    
+    def clean_peso_kg(self):
+        return self.cleaned_data['peso_kg'] or self.instance.peso_kg
     
     def get_initial_for_field(self, field, field_name):
         """Sobrescrever para formatar valores iniciais sem zeros extras"""
@@ -168,6 +184,133 @@ class ImportacaoForm(forms.ModelForm):
         
         return initial
 
+class ImportacaoLinhaForm(ImportacaoForm):
+    """Criação/edição na própria linha da lista, onde não existe o painel #custos-calculados"""
+    
+    calculo_por_campo = False
+
+# Limite de linhas de uma compra em lote (também o absolute_max do formset)
+MAX_LINHAS_LOTE = 200
+
+class LoteCabecalhoForm(ImportacaoForm):
+    """Campos compartilhados por todas as linhas de uma compra em lote (câmbio, fretes e taxas)"""
+    
+    calculo_por_campo = False
+    
+    class Meta(ImportacaoForm.Meta):
+        fields = [
+            'taxa_adm_percentual', 'taxa_adm_fixa', 'frete_eua', 'pol_eua',
+            'cambio_usdt', 'frete_py_usd_kg', 'kg_py_usd', 'status'
+        ]
+    
+    def aplicar(self, importacao):
+        """Copia os campos do cabeçalho para uma importação de uma linha do lote"""
+        for field_name in self._meta.fields:
+            setattr(importacao, field_name, self.cleaned_data[field_name])
+        return importacao
+
+class LinhaLoteForm(ImportacaoForm):
+    """Uma linha (modelo, capacidade, grade) de uma compra em lote"""
+    
+    calculo_por_campo = False
+    
+    class Meta(ImportacaoForm.Meta):
+        fields = ['modelo', 'capacidade_gb', 'grade', 'quantidade', 'valor_eua_unitario']
+
+LinhasLoteFormSet = forms.modelformset_factory(
+    Importacao,
+    form=LinhaLoteForm,
+    # min_num + extra: a tela abre com cinco linhas
+    extra=4,
+    min_num=1,
+    validate_min=True,
+    max_num=MAX_LINHAS_LOTE,
+    validate_max=True,
+    absolute_max=MAX_LINHAS_LOTE,
+)
+
+class SelecaoImportacoesField(forms.Field):
+    """Ids das importações marcadas na lista (checkboxes com o mesmo name)"""
+    
+    widget = forms.MultipleHiddenInput
+    
+    def to_python(self, value):
+        try:
+            return sorted({int(pk) for pk in value or []})
+        except (TypeError, ValueError):
+            raise forms.ValidationError('Seleção de importações inválida.')
+
+class AcaoEmMassaForm(forms.Form):
+    """Novo status (ou registro de venda) para várias importações da lista de uma vez"""
+    
+    selecionadas = SelecaoImportacoesField(required=False)
+    todas_do_filtro = forms.BooleanField(required=False)
+    status = forms.ChoiceField(choices=Importacao.STATUS_CHOICES)
+    preco_venda_unitario = forms.DecimalField(
+        required=False, max_digits=10, decimal_places=2, min_value=Decimal('0.01'),
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'placeholder': 'Preço de venda (BRL)'}),
+    )
+    data_venda = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+    )
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        if not (cleaned_data.get('selecionadas') or cleaned_data.get('todas_do_filtro')):
+            raise forms.ValidationError('Selecione ao menos uma importação.')
+        if cleaned_data.get('status') == 'vendido' and not cleaned_data.get('preco_venda_unitario'):
+            self.add_error('preco_venda_unitario', 'Informe o preço de venda unitário para registrar a venda.')
+        return cleaned_data
+
+class LoteForm(forms.ModelForm):
+    """Remessa: custos pagos por envio e as importações entre as quais são rateados"""
+    
+    importacoes = SelecaoImportacoesField(required=False)
+    
+    class Meta:
+        model = Lote
+        fields = ['descricao', 'frete_total_usd', 'taxas_total_usd', 'criterio_rateio']
+        widgets = {
+            'descricao': forms.TextInput(attrs={
+                'class': 'form-control',
+                'placeholder': 'Ex: Remessa março/1'
+            }),
+            'frete_total_usd': forms.NumberInput(attrs={
+                'class': 'form-control',
+                'step': '0.01',
+                'placeholder': '0.00'
+            }),
+            'taxas_total_usd': forms.NumberInput(attrs={
+                'class': 'form-control',
+                'step': '0.01',
+                'placeholder': '0.00'
+            }),
+            'criterio_rateio': forms.Select(attrs={'class': 'form-control'}),
+        }
+        labels = {
+            'descricao': 'Descrição',
+            'frete_total_usd': 'Fatura de Frete PY (USD)',
+            'taxas_total_usd': 'Taxas da Remessa (USD)',
+            'criterio_rateio': 'Ratear por',
+        }
+    
+    def clean_importacoes(self):
+        pks = self.cleaned_data['importacoes']
+        # Recebidas e vendidas já têm o custo realizado: só entram as em aberto ou já no lote
+        validas = set(candidatas_ao_lote(self.instance).filter(pk__in=pks).values_list('pk', flat=True))
+        if validas != set(pks):
+            raise forms.ValidationError('Selecione apenas importações planejadas, em trânsito ou já neste lote.')
+        return pks
+
+class AvaliacaoCambioForm(forms.Form):
+    """Data cuja cotação USDT/BRL avalia a carteira (vazio = hoje)"""
+    
+    data = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+    )
+
 class ConfiguracaoForm(forms.ModelForm):
     """Formulário para configurações padrão do usuário"""
     
@@ -0,0 +1,83 @@
+"""Medição por requisição do tempo gasto em banco, view e renderização de templates"""
+import contextvars
+import time
+
+_current_timing = contextvars.ContextVar('core_request_timing', default=None)
+
+
+def current_timing():
+    """Retorna o RequestTiming da requisição em andamento (ou None se a medição está desligada)"""
+    return _current_timing.get()
+
+
+class RequestTiming:
+    """Acumula os tempos (em segundos) de uma requisição"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.total = 0.0
+        self.db = 0.0
+        self.queries = 0
+        self.render = 0.0
+        self.render_db = 0.0  # queries disparadas durante a renderização (querysets lazy)
+        self._rendering = 0
+
+    def activate(self):
+        return _current_timing.set(self)
+
+    @staticmethod
+    def deactivate(token):
+        _current_timing.reset(token)
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start
+
+    def __call__(self, execute, sql, params, many, context):
+        """Execute wrapper: mede cada query executada na conexão"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.db += elapsed
+            if self._rendering:
+                self.render_db += elapsed
+
+    def track_render(self, render, *args, **kwargs):
+        """Executa `render` contabilizando o tempo de renderização"""
+        start = time.perf_counter()
+        self._rendering += 1
+        try:
+            return render(*args, **kwargs)
+        finally:
+            self._rendering -= 1
+            if not self._rendering:
+                self.render += time.perf_counter() - start
+
+    @property
+    def render_only(self):
+        """Renderização sem o tempo das queries executadas dentro dos templates"""
+        return max(self.render - self.render_db, 0.0)
+
+    @property
+    def view(self):
+        """Tempo restante: lógica da view e middlewares"""
+        return max(self.total - self.db - self.render_only, 0.0)
+
+    def as_dict(self):
+        return {
+            'total_ms': round(self.total * 1000, 2),
+            'db_ms': round(self.db * 1000, 2),
+            'queries': self.queries,
+            'view_ms': round(self.view * 1000, 2),
+            'render_ms': round(self.render_only * 1000, 2),
+        }
+
+    def server_timing_header(self):
+        return ', '.join([
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"',
+            f'view;dur={self.view * 1000:.1f}',
+            f'render;dur={self.render_only * 1000:.1f}',
+            f'total;dur={self.total * 1000:.1f}',
+        ])
@@ -0,0 +1,75 @@
+"""Avisos de alteração dos dados de cada usuário para o dashboard ao vivo (SSE).
+
+Pub/sub em memória do processo: cada conexão SSE aberta (core.views_async.dashboard_eventos)
+assina o usuário, e as escritas em Importacao/ConfiguracaoPadrao publicam após o commit
+(core.signals). O aviso só acorda a conexão, que compara a versão dos dados antes de enviar
+algo; escritas em outro processo (outro worker, comandos, QuerySet.update/bulk_create, que não
+disparam sinais) são percebidas pela consulta periódica da versão, o fallback do pub/sub.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+_assinaturas = defaultdict(set)
+_lock = threading.Lock()
+
+
+class Assinatura:
+    """Conexão interessada nas alterações de um usuário, presa ao event loop que a criou"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._loop = asyncio.get_running_loop()
+        self._evento = asyncio.Event()
+
+    def avisar(self):
+        """Acorda a conexão; pode ser chamado de qualquer thread"""
+        try:
+            self._loop.call_soon_threadsafe(self._evento.set)
+        except RuntimeError:
+            # Event loop já encerrado: a conexão terminou sem sair de assinar()
+            pass
+
+    async def aguardar(self, timeout):
+        """True se houve aviso desde a última espera, False se o tempo acabou antes.
+
+        Vários avisos seguidos (ex.: uma importação em lote) acordam a conexão uma vez só.
+        """
+        try:
+            await asyncio.wait_for(self._evento.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self._evento.clear()
+        return True
+
+
+@contextmanager
+def assinar(user_id):
+    """Assina as alterações de `user_id` enquanto o bloco estiver aberto (dentro de um event loop)"""
+    assinatura = Assinatura(user_id)
+    with _lock:
+        _assinaturas[user_id].add(assinatura)
+    try:
+        yield assinatura
+    finally:
+        with _lock:
+            _assinaturas[user_id].discard(assinatura)
+            if not _assinaturas[user_id]:
+                del _assinaturas[user_id]
+
+
+def publicar(user_id):
+    """Avisa as conexões deste processo que os dados de `user_id` mudaram"""
+    with _lock:
+        assinaturas = list(_assinaturas.get(user_id, ()))
+    for assinatura in assinaturas:
+        assinatura.avisar()
+
+
+def conexoes(user_id=None):
+    """Quantidade de conexões abertas neste processo (de um usuário ou no total)"""
+    with _lock:
+        if user_id is not None:
+            return len(_assinaturas.get(user_id, ()))
+        return sum(len(assinaturas) for assinaturas in _assinaturas.values())
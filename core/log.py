@@ -0,0 +1,126 @@
+"""Logging estruturado: handler assíncrono, saída JSON, amostragem por logger e correlation IDs.
+
+Configurado em production_settings.LOGGING. Os filtros e o formatter rodam no thread da
+requisição (onde o request_id está disponível); só a escrita no stream vai para o thread
+do QueueListener, de modo que a view nunca espera pelo stdout.
+"""
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+_request_id = contextvars.ContextVar('request_id', default='-')
+
+REQUEST_ID_VALIDO = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# Atributos padrão do LogRecord; o restante veio de `extra=` e vai para o JSON
+_ATRIBUTOS_PADRAO = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'request_id'}
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+def activate_request_id(valor=None):
+    """Define o correlation ID da requisição atual (reaproveita X-Request-ID se for válido)"""
+    if not valor or not REQUEST_ID_VALIDO.match(valor):
+        valor = uuid.uuid4().hex
+    return valor, _request_id.set(valor)
+
+
+def deactivate_request_id(token):
+    _request_id.reset(token)
+
+
+class RequestIdFilter(logging.Filter):
+    """Anexa o correlation ID da requisição a cada registro"""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Mantém apenas uma fração dos registros de cada logger.
+
+    `rates` mapeia nome de logger (ou prefixo, como em 'core.views') para a fração mantida;
+    vale o prefixo mais específico. WARNING ou acima nunca é descartado.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = sorted((rates or {}).items(), key=lambda item: len(item[0]), reverse=True)
+
+    def taxa(self, nome):
+        for prefixo, taxa in self.rates:
+            if nome == prefixo or nome.startswith(prefixo + '.'):
+                return taxa
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        taxa = self.taxa(record.name)
+        return taxa >= 1.0 or random.random() < taxa
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por registro, incluindo os campos passados em `extra=`"""
+
+    def format(self, record):
+        dados = {
+            'timestamp': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', '-'),
+        }
+        for chave, valor in vars(record).items():
+            if chave not in _ATRIBUTOS_PADRAO:
+                dados[chave] = valor
+        if record.exc_info:
+            dados['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(dados, default=str, ensure_ascii=False)
+
+
+class AsyncStreamHandler(QueueHandler):
+    """Enfileira os registros já formatados; um thread dedicado escreve no stream.
+
+    Se a fila encher (stdout travado), os registros são descartados em vez de bloquear a
+    requisição. O listener é (re)criado por processo, então funciona com workers do gunicorn.
+    """
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.destino = logging.StreamHandler(stream)
+        self.descartados = 0
+        self._listener = None
+        self._pid = None
+
+    def _garantir_listener(self):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._listener = QueueListener(self.queue, self.destino)
+            self._listener.start()
+
+    def enqueue(self, record):
+        self._garantir_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+    def close(self):
+        # Esvazia a fila antes de encerrar (chamado por logging.shutdown na saída)
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._listener = None
+            self._pid = None
+        self.destino.close()
+        super().close()
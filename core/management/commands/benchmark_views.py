@@ -0,0 +1,297 @@
+import json
+import os
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import timedelta
+from functools import partial
+from decimal import Decimal
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import User, Importacao, ConfiguracaoPadrao
+from core.report_renderers import TIPOS_WIDGETS
+
+DEFAULT_BASELINE = os.path.join('benchmarks', 'baseline.json')
+
+# (nome, método, url name, kwargs, dados POST)
+VIEWS = [
+    ('dashboard', 'get', 'core:dashboard', {}, None),
+    *((f'widget_{widget}', 'get', 'core:dashboard_widget', {'widget': widget}, None)
+      for widget in TIPOS_WIDGETS),
+    ('importacao_list', 'get', 'core:importacao_list', {}, None),
+    ('importacao_list_htmx', 'get', 'core:importacao_list', {}, {'grade': 'A', 'page': '2'}),
+    ('relatorios', 'get', 'core:relatorios', {}, None),
+    ('relatorio_rentabilidade', 'get', 'core:relatorio_rentabilidade', {}, None),
+    ('calcular_custos_htmx', 'post', 'core:calcular_custos_htmx', {}, {
+        'valor_eua_unitario': '450.00',
+        'taxa_adm_percentual': '0.5',
+        'taxa_adm_fixa': '1.90',
+        'frete_eua': '1.93',
+        'pol_eua': '10.00',
+        'cambio_usdt': '5.56',
+        'frete_py_usd_kg': '7.50',
+        'kg_py_usd': '0.00',
+        'quantidade': '3',
+    }),
+    ('export_relatorio_excel', 'get', 'core:export_relatorio_excel', {'tipo_relatorio': 'completo'}, None),
+    ('export_relatorio_pdf', 'get', 'core:export_relatorio_pdf', {'tipo_relatorio': 'completo'}, None),
+    ('export_relatorios_zip', 'get', 'core:export_relatorios_zip', {}, None),
+]
+
+# Headers extras de algumas medições (fragmentos HTMX)
+HEADERS = {
+    'importacao_list_htmx': {'HX-Request': 'true'},
+}
+
+# Métricas comparadas com o baseline e a folga relativa aceita para cada uma (0.25 = 25%).
+# Queries não têm folga: qualquer query a mais é regressão. --tolerance e --metric-tolerance
+# substituem estes valores.
+TOLERANCES = {'wall_ms': 0.25, 'queries': 0.0, 'peak_kb': 0.25, 'bytes': 0.25}
+METRICS = tuple(TOLERANCES)
+
+MODELOS = ['11', '12', '12 PRO', '13', '13 PRO', '13 PRO MAX', '14', '14 PRO', '14 PRO MAX', '15', '15 PRO', '15 PRO MAX']
+CAPACIDADES = [64, 128, 256, 512]
+GRADES = [choice[0] for choice in Importacao.GRADE_CHOICES]
+STATUS = [choice[0] for choice in Importacao.STATUS_CHOICES]
+
+
+class Command(BaseCommand):
+    help = (
+        'Executa as views principais contra bases geradas de tamanhos crescentes, '
+        'medindo tempo, queries, pico de memória e tamanho da resposta, e compara com um baseline JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000',
+                            help='Quantidades de importações a gerar, separadas por vírgula')
+        parser.add_argument('--views', default='',
+                            help='Restringe a execução a estas views (nomes separados por vírgula)')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Execuções cronometradas por view (usa a mediana)')
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                            help='Arquivo JSON de baseline para comparação')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Grava os resultados desta execução como novo baseline')
+        parser.add_argument('--output', default='',
+                            help='Grava os resultados desta execução neste arquivo JSON')
+        parser.add_argument('--tolerance', type=float, default=None,
+                            help='Folga relativa aceita para tempo, memória e tamanho (0.25 = 25%%); '
+                                 'queries continuam sem folga')
+        parser.add_argument('--metric-tolerance', action='append', default=[], metavar='METRICA=FOLGA',
+                            help=f'Folga de uma métrica ({", ".join(METRICS)}); pode ser repetido, '
+                                 'ex.: --metric-tolerance wall_ms=0.5 --metric-tolerance bytes=0')
+        parser.add_argument('--asgi', action='store_true',
+                            help='Usa o handler ASGI (AsyncClient); combine com ASYNC_VIEWS=True')
+        parser.add_argument('--latencia-ms', type=float, default=0,
+                            help='Latência simulada por query, como a de um banco remoto (ex.: 30)')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        selected = {name.strip() for name in options['views'].split(',') if name.strip()}
+        views = [view for view in VIEWS if not selected or view[0] in selected]
+        if not views:
+            raise CommandError(f"Nenhuma view encontrada para --views={options['views']}")
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        latencia = self.simular_latencia(options['latencia_ms'])
+        try:
+            results = self.run_benchmarks(sizes, views, options['repeat'], options['asgi'])
+        finally:
+            if latencia:
+                connection_created.disconnect(latencia)
+                if latencia.wrapper in connection.execute_wrappers:
+                    connection.execute_wrappers.remove(latencia.wrapper)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        payload = {
+            'meta': {
+                'generated_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'repeat': options['repeat'],
+                'asgi': options['asgi'],
+                'latencia_ms': options['latencia_ms'],
+            },
+            'results': results,
+        }
+
+        if options['output']:
+            self.write_json(options['output'], payload)
+
+        if options['save_baseline']:
+            self.write_json(options['baseline'], payload)
+            self.stdout.write(self.style.SUCCESS(f"Baseline gravado em {options['baseline']}"))
+            return
+
+        if not os.path.exists(options['baseline']):
+            self.stdout.write(self.style.WARNING(
+                f"Baseline {options['baseline']} não encontrado; use --save-baseline para criá-lo"
+            ))
+            return
+
+        with open(options['baseline'], encoding='utf-8') as fh:
+            baseline = json.load(fh)
+
+        regressions = self.compare(baseline.get('results', {}), results, self.tolerances(options))
+        if regressions:
+            for line in regressions:
+                self.stdout.write(self.style.ERROR(line))
+            raise CommandError(f'{len(regressions)} regressão(ões) de performance em relação ao baseline')
+
+        self.stdout.write(self.style.SUCCESS('Nenhuma regressão em relação ao baseline'))
+
+    def simular_latencia(self, latencia_ms):
+        """Atrasa cada query em todas as conexões (inclusive as abertas por outros threads)"""
+        if not latencia_ms:
+            return None
+
+        def wrapper(execute, sql, params, many, context):
+            time.sleep(latencia_ms / 1000)
+            return execute(sql, params, many, context)
+
+        def instalar(sender, connection, **kwargs):
+            connection.execute_wrappers.append(wrapper)
+
+        instalar.wrapper = wrapper
+        connection_created.connect(instalar, weak=False)
+        connection.execute_wrappers.append(wrapper)
+        return instalar
+
+    def run_benchmarks(self, sizes, views, repeat, asgi=False):
+        user = User.objects.create_user(username='benchmark', password='benchmark', role='user')
+        ConfiguracaoPadrao.objects.create(user=user)
+        client = (AsyncClient if asgi else Client)(raise_request_exception=False)
+        client.force_login(user)
+
+        results = {}
+        for size in sizes:
+            self.populate(user, size)
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== {size} importações =='))
+            results[str(size)] = {}
+            for name, method, url_name, kwargs, data in views:
+                measurement = self.measure(
+                    client, method, reverse(url_name, kwargs=kwargs), data, repeat, HEADERS.get(name),
+                )
+                results[str(size)][name] = measurement
+                self.stdout.write(
+                    f"{name:<26} status={measurement['status']:<4} "
+                    f"tempo={measurement['wall_ms']:>10.1f}ms queries={measurement['queries']:>6} "
+                    f"pico={measurement['peak_kb']:>10.1f}KB resposta={measurement['bytes']:>10}B"
+                )
+        return results
+
+    def populate(self, user, size):
+        """Recria as importações do usuário de benchmark com dados determinísticos"""
+        Importacao.objects.filter(user=user).delete()
+        rng = random.Random(size)
+        hoje = timezone.now().date()
+        batch = []
+        for _ in range(size):
+            status = rng.choice(STATUS)
+            vendido = status == 'vendido'
+            batch.append(Importacao(
+                user=user,
+                modelo=rng.choice(MODELOS),
+                capacidade_gb=rng.choice(CAPACIDADES),
+                grade=rng.choice(GRADES),
+                quantidade=rng.randint(1, 20),
+                valor_eua_unitario=Decimal(rng.randint(20000, 120000)) / 100,
+                cambio_usdt=Decimal(rng.randint(5000, 6000)) / 1000,
+                kg_py_usd=Decimal(rng.randint(0, 300)) / 100,
+                status=status,
+                preco_venda_unitario=Decimal(rng.randint(150000, 900000)) / 100 if vendido else None,
+                data_venda=hoje - timedelta(days=rng.randint(0, 365)) if vendido else None,
+            ))
+        Importacao.objects.bulk_create(batch, batch_size=2000)
+
+    def measure(self, client, method, url, data, repeat, headers=None):
+        request = partial(getattr(client, method), headers=headers)
+        if isinstance(client, AsyncClient):
+            request = async_to_sync(request)
+
+        timings = []
+        for _ in range(max(repeat, 1)):
+            start = time.perf_counter()
+            response = request(url, data) if data is not None else request(url)
+            self.consume(response)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        # Execução separada para queries e memória, pois o tracemalloc distorce o tempo
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                response = request(url, data) if data is not None else request(url)
+                size = self.consume(response)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'status': response.status_code,
+            'wall_ms': round(statistics.median(timings), 2),
+            'queries': len(queries.captured_queries),
+            'peak_kb': round(peak / 1024, 1),
+            'bytes': size,
+        }
+
+    def consume(self, response):
+        """Lê todo o corpo (inclusive respostas em streaming) e retorna o tamanho em bytes"""
+        if response.streaming:
+            return sum(len(chunk) for chunk in response.streaming_content)
+        return len(response.content)
+
+    def tolerances(self, options):
+        """Folga por métrica: TOLERANCES, depois --tolerance e por fim cada --metric-tolerance"""
+        tolerances = dict(TOLERANCES)
+        if options['tolerance'] is not None:
+            tolerances.update({metric: options['tolerance'] for metric in METRICS if metric != 'queries'})
+        for item in options['metric_tolerance']:
+            metric, _, value = item.partition('=')
+            if metric not in tolerances:
+                raise CommandError(f'Métrica desconhecida em --metric-tolerance: {metric!r}')
+            try:
+                tolerances[metric] = float(value)
+            except ValueError:
+                raise CommandError(f'Folga inválida em --metric-tolerance: {item!r}')
+        return tolerances
+
+    def compare(self, baseline, results, tolerances):
+        regressions = []
+        for size, views in results.items():
+            for name, current in views.items():
+                previous = baseline.get(size, {}).get(name)
+                if not previous:
+                    continue
+                if current['status'] != previous['status'] and current['status'] >= 400:
+                    regressions.append(
+                        f"[{size}] {name}: status {previous['status']} -> {current['status']}"
+                    )
+                for metric in METRICS:
+                    before, after = previous.get(metric), current.get(metric)
+                    if before is None:
+                        continue
+                    limit = before * (1 + tolerances[metric])
+                    if metric == 'wall_ms':
+                        # Ignora ruído de poucos milissegundos em views rápidas
+                        limit = max(limit, before + 5)
+                    if after > limit:
+                        regressions.append(f'[{size}] {name}: {metric} {before} -> {after}')
+        return regressions
+
+    def write_json(self, path, payload):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as fh:
+            json.dump(payload, fh, indent=2, sort_keys=True)
+            fh.write('\n')
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.cambios import TAMANHO_LOTE, importar_cotacoes, ler_csv
+
+
+class Command(BaseCommand):
+    help = (
+        'Carrega a série histórica do câmbio USDT/BRL de um CSV local (colunas data e cambio_usdt), '
+        'substituindo as cotações das datas que já existiam'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Caminho do CSV')
+        parser.add_argument('--tamanho-lote', type=int, default=TAMANHO_LOTE,
+                            help='Cotações por INSERT')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        try:
+            with open(options['arquivo'], newline='', encoding='utf-8-sig') as arquivo:
+                cotacoes = ler_csv(arquivo)
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        importar_cotacoes(cotacoes, options['tamanho_lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(cotacoes)} cotação(ões) carregada(s) em {time.perf_counter() - inicio:.1f}s'
+        ))
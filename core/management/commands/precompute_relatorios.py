@@ -0,0 +1,60 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.models import User
+from core.precompute import precomputar_usuario
+
+
+class Command(BaseCommand):
+    help = (
+        'Pré-calcula agregados do dashboard, relatórios e arquivos de exportação de todos os '
+        'usuários ativos, pulando os que não mudaram desde a última execução (para cron/jobs agendados)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Processos do pool (1 = executa no processo atual)')
+        parser.add_argument('--users', default='',
+                            help='Restringe a estes usernames (separados por vírgula)')
+        parser.add_argument('--sem-exportacoes', action='store_true',
+                            help='Calcula apenas os relatórios, sem gerar PDF/XLSX')
+        parser.add_argument('--forcar', action='store_true',
+                            help='Recalcula mesmo quem não mudou desde a última execução')
+
+    def handle(self, *args, **options):
+        usuarios = User.objects.filter(is_active=True).order_by('pk')
+        nomes = [nome.strip() for nome in options['users'].split(',') if nome.strip()]
+        if nomes:
+            usuarios = usuarios.filter(username__in=nomes)
+        ids = list(usuarios.values_list('pk', flat=True))
+        exportar = not options['sem_exportacoes']
+        forcar = options['forcar']
+
+        inicio = time.perf_counter()
+        if options['workers'] <= 1 or len(ids) <= 1:
+            resultados = [precomputar_usuario(user_id, exportar, forcar) for user_id in ids]
+        else:
+            resultados = self.em_paralelo(ids, options['workers'], exportar, forcar)
+
+        calculados = sum(1 for _user_id, calculado in resultados if calculado)
+        self.stdout.write(self.style.SUCCESS(
+            f'{calculados} usuário(s) recalculado(s), {len(resultados) - calculados} sem mudanças '
+            f'em {time.perf_counter() - inicio:.1f}s'
+        ))
+
+    def em_paralelo(self, ids, workers, exportar, forcar):
+        # Os processos filhos abrem suas próprias conexões; não podem herdar as do pai
+        connections.close_all()
+        resultados = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futuros = [pool.submit(precomputar_usuario, user_id, exportar, forcar) for user_id in ids]
+            for futuro in as_completed(futuros):
+                try:
+                    resultados.append(futuro.result())
+                except Exception as exc:
+                    self.stderr.write(self.style.ERROR(f'Falha ao pré-calcular: {exc}'))
+        return resultados
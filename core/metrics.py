@@ -0,0 +1,296 @@
+"""Métricas no formato texto do Prometheus, agregadas entre os workers do gunicorn.
+
+Cada processo mantém seus contadores em memória e grava periodicamente (e na saída) um
+snapshot em METRICS_DIR/metrics_<pid>_<uuid>.json; o endpoint /metrics soma os snapshots de
+todos os workers. O UUID por processo impede que um worker novo com o PID de um encerrado
+sobrescreva o arquivo dele, o que faria os contadores somados voltarem. Os snapshots de workers
+encerrados são consolidados em METRICS_DIR/metrics_encerrados.json, como no modo multiprocess do
+prometheus_client: os contadores continuam somando (semântica cumulativa) e os arquivos não se
+acumulam. Gauges só são exportados para processos ainda vivos.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem consolidação, os snapshots encerrados continuam somando
+    fcntl = None
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+DESCRICOES = {
+    'iphone_http_request_duration_seconds': ('histogram', 'Latência das requisições por view'),
+    'iphone_http_responses_total': ('counter', 'Respostas por view e código de status'),
+    'iphone_db_queries_total': ('counter', 'Queries SQL executadas por view'),
+    'iphone_db_query_duration_seconds_total': ('counter', 'Tempo total em queries SQL por view'),
+    'iphone_export_duration_seconds': ('histogram', 'Duração da geração de exportações PDF/Excel'),
+    'iphone_cache_requests_total': ('counter', 'Consultas a caches da aplicação por resultado (hit/miss)'),
+    'iphone_cache_hit_ratio': ('gauge', 'Proporção de hits por cache'),
+    'iphone_worker_memory_bytes': ('gauge', 'Memória residente de cada worker'),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_last_flush = 0.0
+# (pid, arquivo do snapshot): recriado quando o PID muda (fork)
+_processo = None
+
+ENCERRADOS = 'metrics_encerrados.json'
+
+
+def _key(labels):
+    return json.dumps(sorted(labels.items()))
+
+
+def inc(name, labels, value=1):
+    """Incrementa um contador"""
+    key = _key(labels)
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + value
+
+
+def observe(name, labels, value, buckets=LATENCY_BUCKETS):
+    """Registra uma observação em um histograma"""
+    key = _key(labels)
+    with _lock:
+        series = _histograms.setdefault(name, {})
+        hist = series.get(key)
+        if hist is None:
+            hist = series[key] = {'buckets': list(buckets), 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+        for i, limite in enumerate(hist['buckets']):
+            if value <= limite:
+                hist['counts'][i] += 1
+                break
+        hist['sum'] += value
+        hist['count'] += 1
+
+
+def record_cache(cache, hit):
+    """Registra uma consulta a um cache da aplicação"""
+    inc('iphone_cache_requests_total', {'cache': cache, 'result': 'hit' if hit else 'miss'})
+
+
+def worker_memory_bytes():
+    """RSS atual do processo (Linux) ou pico de RSS como aproximação"""
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def metrics_dir():
+    return getattr(settings, 'METRICS_DIR', '') or os.path.join(tempfile.gettempdir(), 'iphone-import-metrics')
+
+
+def _snapshot():
+    with _lock:
+        return {
+            'pid': os.getpid(),
+            'counters': {name: dict(series) for name, series in _counters.items()},
+            'histograms': {
+                name: {key: dict(hist, counts=list(hist['counts'])) for key, hist in series.items()}
+                for name, series in _histograms.items()
+            },
+            'memory': worker_memory_bytes(),
+        }
+
+
+def _arquivo(directory):
+    global _processo
+    pid = os.getpid()
+    if _processo is None or _processo[0] != pid:
+        _processo = (pid, f'metrics_{pid}_{uuid.uuid4().hex}.json')
+    return os.path.join(directory, _processo[1])
+
+
+def _gravar(path, dados):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(dados, fh)
+    os.replace(tmp_path, path)
+
+
+def flush(force=False):
+    """Grava o snapshot deste processo, no máximo a cada METRICS_FLUSH_INTERVAL segundos"""
+    global _last_flush
+    now = time.monotonic()
+    with _lock:
+        if not force and now - _last_flush < getattr(settings, 'METRICS_FLUSH_INTERVAL', 5):
+            return
+        _last_flush = now
+
+    directory = metrics_dir()
+    os.makedirs(directory, exist_ok=True)
+    _gravar(_arquivo(directory), _snapshot())
+
+
+def _flush_na_saida():
+    try:
+        flush(force=True)
+    except (ImproperlyConfigured, OSError):
+        # Settings não configurados (importado fora do projeto) ou METRICS_DIR inacessível
+        pass
+
+
+# Sem isso, o que o worker contou depois do último flush se perderia ao encerrar
+atexit.register(_flush_na_saida)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _somar(destino, snapshot):
+    """Soma os contadores e histogramas de `snapshot` em `destino` ({'counters', 'histograms'})"""
+    for name, series in snapshot.get('counters', {}).items():
+        target = destino['counters'].setdefault(name, {})
+        for key, value in series.items():
+            target[key] = target.get(key, 0) + value
+    for name, series in snapshot.get('histograms', {}).items():
+        target = destino['histograms'].setdefault(name, {})
+        for key, hist in series.items():
+            agregado = target.get(key)
+            if agregado is None:
+                target[key] = dict(hist, counts=list(hist['counts']))
+                continue
+            agregado['counts'] = [a + b for a, b in zip(agregado['counts'], hist['counts'])]
+            agregado['sum'] += hist['sum']
+            agregado['count'] += hist['count']
+
+
+def _ler(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _arquivos(directory):
+    return [
+        os.path.join(directory, filename) for filename in os.listdir(directory)
+        if filename.startswith('metrics_') and filename.endswith('.json')
+    ]
+
+
+def _consolidar_encerrados(directory):
+    """Soma os snapshots de processos encerrados em ENCERRADOS e remove os arquivos deles.
+
+    Chamado com o lock exclusivo do diretório: a soma e a remoção não podem ser vistas pela
+    metade por outro leitor, senão os contadores apareceriam em dobro ou voltariam.
+    """
+    encerrados = []
+    for path in _arquivos(directory):
+        snapshot = _ler(path)
+        if snapshot and snapshot.get('pid') and not _pid_alive(snapshot['pid']):
+            encerrados.append((path, snapshot))
+    if not encerrados:
+        return
+    caminho = os.path.join(directory, ENCERRADOS)
+    total = _ler(caminho) or {'counters': {}, 'histograms': {}}
+    for _path, snapshot in encerrados:
+        _somar(total, snapshot)
+    _gravar(caminho, total)
+    for path, _snapshot in encerrados:
+        os.remove(path)
+
+
+def _load_snapshots():
+    flush(force=True)
+    directory = metrics_dir()
+    if fcntl is None:
+        return [snapshot for snapshot in map(_ler, _arquivos(directory)) if snapshot]
+    with open(os.path.join(directory, '.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            _consolidar_encerrados(directory)
+            return [snapshot for snapshot in map(_ler, _arquivos(directory)) if snapshot]
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pares = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + pares + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus():
+    """Agrega os snapshots de todos os workers e gera o texto de exposição do Prometheus"""
+    agregado = {'counters': {}, 'histograms': {}}
+    memory = {}
+    for snapshot in _load_snapshots():
+        _somar(agregado, snapshot)
+        pid = snapshot.get('pid')
+        if pid and _pid_alive(pid):
+            memory[pid] = snapshot.get('memory', 0)
+    counters, histograms = agregado['counters'], agregado['histograms']
+
+    # Proporção de hits por cache, derivada dos contadores agregados
+    por_cache = {}
+    for key, value in counters.get('iphone_cache_requests_total', {}).items():
+        labels = dict(json.loads(key))
+        totais = por_cache.setdefault(labels['cache'], {'hit': 0, 'miss': 0})
+        totais[labels['result']] += value
+
+    lines = []
+
+    def header(name):
+        tipo, descricao = DESCRICOES.get(name, ('untyped', name))
+        lines.append(f'# HELP {name} {descricao}')
+        lines.append(f'# TYPE {name} {tipo}')
+
+    for name in sorted(counters):
+        header(name)
+        for key, value in sorted(counters[name].items()):
+            lines.append(f'{name}{_format_labels(json.loads(key))} {_format_value(value)}')
+
+    for name in sorted(histograms):
+        header(name)
+        for key, hist in sorted(histograms[name].items()):
+            labels = json.loads(key)
+            acumulado = 0
+            for limite, count in zip(hist['buckets'], hist['counts']):
+                acumulado += count
+                lines.append(f'{name}_bucket{_format_labels(labels + [["le", limite]])} {acumulado}')
+            lines.append(f'{name}_bucket{_format_labels(labels + [["le", "+Inf"]])} {hist["count"]}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(float(hist["sum"]))}')
+            lines.append(f'{name}_count{_format_labels(labels)} {hist["count"]}')
+
+    if por_cache:
+        header('iphone_cache_hit_ratio')
+        for cache, totais in sorted(por_cache.items()):
+            total = totais['hit'] + totais['miss']
+            lines.append(f'iphone_cache_hit_ratio{_format_labels([["cache", cache]])} {totais["hit"] / total if total else 0.0}')
+
+    header('iphone_worker_memory_bytes')
+    for pid, value in sorted(memory.items()):
+        lines.append(f'iphone_worker_memory_bytes{_format_labels([["pid", pid]])} {value}')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,269 @@
+"""Middlewares de desempenho e observabilidade.
+
+Sob ASGI, o Django troca de thread a cada transição entre middleware async e síncrono. O de
+correlation ID é async-capable. Os que medem SQL (queries lentas, métricas, Server-Timing,
+orçamento de queries) e o profiler continuam síncronos: connection.execute_wrapper só enxerga as
+queries do thread onde foi instalado, que é o thread síncrono da requisição. Como ficam em
+sequência na cadeia, os que estiverem ligados custam uma ida e volta entre threads por requisição
+async (o profiler, depois da autenticação, outra). Desligados, saem da cadeia (MiddlewareNotUsed).
+"""
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.urls import reverse
+
+from . import log, metrics
+from .instrumentation import RequestTiming
+from .profiling import profile_request
+from .slow_queries import SlowQueryCollector, salvar_queries_lentas
+
+logger = logging.getLogger('core.performance')
+
+# Limite de queries SQL por requisição para cada URL de core/urls.py.
+# Os limites incluem as queries de sessão/autenticação e não podem depender da
+# quantidade de importações do usuário: um loop com query por modelo/status/linha
+# estoura o orçamento nos testes.
+QUERY_BUDGETS = {
+    'login': 5,
+    'logout': 4,
+    'dashboard': 7,
+    'dashboard_widget': 10,
+    'dashboard_eventos': 5,
+    'importacao_list': 11,
+    'importacao_create': 6,
+    'importacao_lote': 6,
+    'importacao_lote_totais': 5,
+    'importacao_em_massa': 19,
+    'importacao_detail': 6,
+    'importacao_update': 7,
+    'importacao_delete': 6,
+    'lote_list': 6,
+    'lote_create': 30,
+    'lote_update': 30,
+    'calcular_custos_htmx': 5,
+    'relatorios': 11,
+    'relatorio_rentabilidade': 10,
+    'avaliacao_cambio': 6,
+    'export_relatorio_pdf': 11,
+    'export_relatorio_excel': 10,
+    'export_relatorios_zip': 10,
+    'admin_panel': 9,
+    'perfil_list': 6,
+    'perfil_detail': 6,
+    'query_lenta_list': 7,
+    'query_lenta_explain': 7,
+    'user_management': 10,
+    'user_create': 5,
+    'user_edit': 6,
+    'user_delete': 7,
+    'user_toggle_status': 7,
+    'configuracoes': 10,
+    'reavaliar_cambio': 24,
+    'metricas': 5,
+}
+
+
+# Views de exportação e o formato que cada uma gera (métrica de duração de exportações)
+EXPORT_VIEWS = {
+    'export_relatorio_pdf': 'pdf',
+    'export_relatorio_excel': 'excel',
+}
+
+
+class QueryCounter:
+    """Execute wrapper que conta as queries executadas e o tempo gasto nelas"""
+
+    def __init__(self):
+        self.count = 0
+        self.elapsed = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.elapsed += time.perf_counter() - start
+
+
+class QueryBudgetMiddleware:
+    """Em DEBUG, registra um aviso quando uma view ultrapassa seu orçamento de queries"""
+
+    def __init__(self, get_response):
+        if not (settings.DEBUG and getattr(settings, 'QUERY_BUDGET_WARNINGS', False)):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        budget = QUERY_BUDGETS.get(match.url_name) if match else None
+        if budget is not None and counter.count > budget:
+            logger.warning(
+                'Orçamento de queries excedido em %s (%s): %d queries, limite %d',
+                match.view_name, request.path, counter.count, budget
+            )
+        return response
+
+
+class ServerTimingMiddleware:
+    """Mede banco, view e renderização de cada requisição e publica no header Server-Timing"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SERVER_TIMING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = RequestTiming()
+        token = timing.activate()
+        try:
+            with connection.execute_wrapper(timing):
+                response = self.get_response(request)
+        finally:
+            RequestTiming.deactivate(token)
+        timing.finish()
+
+        response['Server-Timing'] = timing.server_timing_header()
+
+        match = request.resolver_match
+        dados = timing.as_dict()
+        dados.update({
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+        })
+        logger.info(
+            'request method=%s path=%s view=%s status=%s total_ms=%.1f db_ms=%.1f queries=%d view_ms=%.1f render_ms=%.1f',
+            dados['method'], dados['path'], dados['view'], dados['status'], dados['total_ms'],
+            dados['db_ms'], dados['queries'], dados['view_ms'], dados['render_ms'],
+            extra={'timing': dados}
+        )
+        return response
+
+
+class MetricsMiddleware:
+    """Alimenta as métricas Prometheus (latência, queries e exportações por view)"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        # Requisições sem rota (404) são agrupadas para não criar uma série por URL
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+
+        metrics.observe('iphone_http_request_duration_seconds', {'view': view, 'method': request.method}, duration)
+        metrics.inc('iphone_http_responses_total', {'view': view, 'status': response.status_code})
+        metrics.inc('iphone_db_queries_total', {'view': view}, counter.count)
+        metrics.inc('iphone_db_query_duration_seconds_total', {'view': view}, counter.elapsed)
+
+        formato = EXPORT_VIEWS.get(match.url_name) if match else None
+        if formato:
+            metrics.observe('iphone_export_duration_seconds', {
+                'formato': formato,
+                'tipo': match.kwargs.get('tipo_relatorio', ''),
+            }, duration)
+
+        metrics.flush()
+        return response
+
+
+class ProfilerMiddleware:
+    """Perfila a requisição quando um admin envia ?_profile=1 ou o header X-Profile: 1.
+
+    O perfil (funções mais custosas e SQL) fica disponível no painel administrativo.
+    Deve vir depois do AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILER_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        solicitado = '_profile' in request.GET or request.headers.get('X-Profile')
+        if not (solicitado and request.user.is_authenticated and request.user.role == 'admin'):
+            return self.get_response(request)
+
+        response, perfil = profile_request(self.get_response, request)
+        if perfil is not None:
+            response['X-Profile-Id'] = str(perfil.pk)
+            response['X-Profile-Url'] = reverse('core:perfil_detail', kwargs={'pk': perfil.pk})
+        return response
+
+
+class RequestIdMiddleware:
+    """Correlation ID por requisição: aceita X-Request-ID do proxy ou gera um novo.
+
+    O ID vai para todos os registros de log (core.log.RequestIdFilter) e para a resposta.
+    Async-capable: o ID é uma ContextVar, visível também nos threads de sync_to_async.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _ativar(self, request):
+        request_id, token = log.activate_request_id(request.headers.get('X-Request-ID'))
+        request.request_id = request_id
+        return request_id, token
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request_id, token = self._ativar(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            log.deactivate_request_id(token)
+        response['X-Request-ID'] = request_id
+        return response
+
+    async def __acall__(self, request):
+        request_id, token = self._ativar(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            log.deactivate_request_id(token)
+        response['X-Request-ID'] = request_id
+        return response
+
+
+class SlowQueryMiddleware:
+    """Grava em QueryLenta toda query acima de SLOW_QUERY_THRESHOLD_MS, com view, usuário e stack.
+
+    Fica no início da cadeia para que a própria gravação não entre nas métricas da view.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SLOW_QUERY_LOG_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        collector = SlowQueryCollector(getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 200))
+        with connection.execute_wrapper(collector):
+            response = self.get_response(request)
+        if collector.lentas:
+            salvar_queries_lentas(request, collector.lentas)
+        return response
@@ -0,0 +1,37 @@
+# Generated by Django 5.0 on 2026-10-19 11:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PerfilRequisicao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=500)),
+                ('view_name', models.CharField(blank=True, max_length=200)),
+                ('status_code', models.PositiveSmallIntegerField()),
+                ('duracao_ms', models.FloatField(help_text='Tempo total da requisição (ms)')),
+                ('total_queries', models.PositiveIntegerField(default=0)),
+                ('db_ms', models.FloatField(default=0, help_text='Tempo total em queries SQL (ms)')),
+                ('funcoes', models.JSONField(default=list, help_text='Funções com maior tempo acumulado')),
+                ('queries', models.JSONField(default=list, help_text='Queries SQL agrupadas por texto')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Perfil de Requisição',
+                'verbose_name_plural': 'Perfis de Requisição',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
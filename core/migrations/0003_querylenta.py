@@ -0,0 +1,34 @@
+# Generated by Django 5.0 on 2026-10-19 11:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_perfilrequisicao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryLenta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sql', models.TextField()),
+                ('params', models.JSONField(default=list, help_text='Parâmetros usados no EXPLAIN')),
+                ('duracao_ms', models.FloatField()),
+                ('view_name', models.CharField(blank=True, max_length=200)),
+                ('path', models.CharField(blank=True, max_length=500)),
+                ('stack', models.TextField(blank=True, help_text='Frames do projeto que originaram a query')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Query Lenta',
+                'verbose_name_plural': 'Queries Lentas',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
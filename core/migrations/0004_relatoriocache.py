@@ -0,0 +1,32 @@
+# Generated by Django 5.0 on 2026-10-19 11:51
+
+import core.serializers
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_querylenta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatorioCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=30)),
+                ('versao', models.CharField(help_text='Token de core.versioning.VersaoDados', max_length=40)),
+                ('dados', models.JSONField(decoder=core.serializers.RelatorioJSONDecoder, encoder=core.serializers.RelatorioJSONEncoder)),
+                ('calculado_em', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='relatorios_cache', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Relatório em Cache',
+                'verbose_name_plural': 'Relatórios em Cache',
+                'unique_together': {('user', 'tipo')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0 on 2026-10-19 12:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_relatoriocache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportacaoCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(help_text='Formato e tipo, ex.: pdf:completo', max_length=40)),
+                ('versao', models.CharField(help_text='Token de core.versioning.VersaoDados', max_length=40)),
+                ('conteudo', models.BinaryField()),
+                ('gerado_em', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exportacoes_cache', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Exportação em Cache',
+                'verbose_name_plural': 'Exportações em Cache',
+                'unique_together': {('user', 'nome')},
+            },
+        ),
+    ]
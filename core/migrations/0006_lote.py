@@ -0,0 +1,45 @@
+# Generated by Django 5.0 on 2026-10-19 13:09
+
+import django.core.validators
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_exportacaocache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importacao',
+            name='peso_kg',
+            field=models.DecimalField(decimal_places=3, default=Decimal('0.300'), help_text='Peso unitário (kg), base do rateio do frete por peso', max_digits=6, validators=[django.core.validators.MinValueValidator(Decimal('0.001'))]),
+        ),
+        migrations.CreateModel(
+            name='Lote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('descricao', models.CharField(help_text='Identificação da remessa (ex: Remessa março/1)', max_length=100)),
+                ('frete_total_usd', models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='Fatura de frete PY da remessa (USD)', max_digits=12, validators=[django.core.validators.MinValueValidator(Decimal('0.00'))])),
+                ('taxas_total_usd', models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='Taxas administrativas fixas da remessa (USD)', max_digits=12, validators=[django.core.validators.MinValueValidator(Decimal('0.00'))])),
+                ('criterio_rateio', models.CharField(choices=[('peso', 'Peso'), ('valor', 'Valor')], default='peso', help_text='Rateio pelo peso (peso unitário x quantidade) ou pelo valor EUA das linhas', max_length=5)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lotes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Lote',
+                'verbose_name_plural': 'Lotes',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='importacao',
+            name='lote',
+            field=models.ForeignKey(blank=True, help_text='Remessa cujo frete e taxas são rateados para esta importação', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='importacoes', to='core.lote'),
+        ),
+    ]
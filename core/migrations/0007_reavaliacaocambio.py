@@ -0,0 +1,32 @@
+# Generated by Django 5.0 on 2026-10-19 13:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_lote'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReavaliacaoCambio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cambio_usdt', models.DecimalField(decimal_places=4, help_text='Câmbio USDT aplicado', max_digits=10)),
+                ('importacoes', models.PositiveIntegerField(help_text='Importações reavaliadas')),
+                ('unidades', models.PositiveIntegerField(help_text='Unidades reavaliadas')),
+                ('impacto_brl', models.DecimalField(decimal_places=2, help_text='Variação do custo total (BRL) das importações reavaliadas', max_digits=14)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reavaliacoes_cambio', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Reavaliação de Câmbio',
+                'verbose_name_plural': 'Reavaliações de Câmbio',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.0 on 2026-10-19 13:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_reavaliacaocambio'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Cambio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField(unique=True)),
+                ('cambio_usdt', models.DecimalField(decimal_places=4, help_text='Cotação USDT/BRL', max_digits=10)),
+            ],
+            options={
+                'verbose_name': 'Câmbio',
+                'verbose_name_plural': 'Câmbios',
+                'ordering': ['-data'],
+            },
+        ),
+    ]
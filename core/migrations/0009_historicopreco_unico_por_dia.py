@@ -0,0 +1,37 @@
+# Generated by Django 5.0 on 2026-10-19 13:22
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def remover_repetidos(apps, schema_editor):
+    """Mantém só o último registro de cada produto por dia, como no upsert de price_history"""
+    HistoricoPreco = apps.get_model('core', 'HistoricoPreco')
+    ultimos = (
+        HistoricoPreco.objects.order_by()
+        .values('user', 'modelo', 'capacidade_gb', 'grade', 'data_registro')
+        .annotate(ultimo=Max('pk'))
+        .values_list('ultimo', flat=True)
+    )
+    HistoricoPreco.objects.exclude(pk__in=list(ultimos)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_cambio'),
+    ]
+
+    operations = [
+        migrations.RunPython(remover_repetidos, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='historicopreco',
+            name='data_registro',
+            field=models.DateField(default=django.utils.timezone.localdate),
+        ),
+        migrations.AddConstraint(
+            model_name='historicopreco',
+            constraint=models.UniqueConstraint(fields=('user', 'modelo', 'capacidade_gb', 'grade', 'data_registro'), name='historico_preco_unico_por_dia'),
+        ),
+    ]
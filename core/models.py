@@ -1,8 +1,11 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
 
+from .serializers import RelatorioJSONDecoder, RelatorioJSONEncoder
+
 class User(AbstractUser):
     """Modelo de usuário personalizado"""
     ROLE_CHOICES = [
@@ -53,6 +56,45 @@ class ConfiguracaoPadrao(models.Model):
     def __str__(self):
         return f"Configurações de {self.user.username}"
 
+class Lote(models.Model):
+    """Remessa que agrupa importações: a fatura de frete e as taxas são pagas por envio e
+    rateadas entre as linhas (core.bulk_updates.ratear_lote)"""
+    CRITERIO_CHOICES = [
+        ('peso', 'Peso'),
+        ('valor', 'Valor'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='lotes')
+    descricao = models.CharField(max_length=100, help_text="Identificação da remessa (ex: Remessa março/1)")
+    frete_total_usd = models.DecimalField(
+        max_digits=12, decimal_places=2,
+        default=Decimal('0.00'),
+        validators=[MinValueValidator(Decimal('0.00'))],
+        help_text="Fatura de frete PY da remessa (USD)"
+    )
+    taxas_total_usd = models.DecimalField(
+        max_digits=12, decimal_places=2,
+        default=Decimal('0.00'),
+        validators=[MinValueValidator(Decimal('0.00'))],
+        help_text="Taxas administrativas fixas da remessa (USD)"
+    )
+    criterio_rateio = models.CharField(
+        max_length=5,
+        choices=CRITERIO_CHOICES,
+        default='peso',
+        help_text="Rateio pelo peso (peso unitário x quantidade) ou pelo valor EUA das linhas"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Lote'
+        verbose_name_plural = 'Lotes'
+    
+    def __str__(self):
+        return self.descricao
+
 class Importacao(models.Model):
     """Modelo principal de importação baseado na planilha Excel"""
     STATUS_CHOICES = [
@@ -89,6 +131,18 @@ class Importacao(models.Model):
         validators=[MinValueValidator(1)],
         help_text="Quantidade de unidades"
     )
+    peso_kg = models.DecimalField(
+        max_digits=6, decimal_places=3,
+        default=Decimal('0.300'),
+        validators=[MinValueValidator(Decimal('0.001'))],
+        help_text="Peso unitário (kg), base do rateio do frete por peso"
+    )
+    lote = models.ForeignKey(
+        Lote, on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name='importacoes',
+        help_text="Remessa cujo frete e taxas são rateados para esta importação"
+    )
     
     # Custos EUA (baseados na planilha)
     valor_eua_unitario = models.DecimalField(
@@ -233,6 +287,49 @@ class Importacao(models.Model):
     def __str__(self):
         return f"iPhone {self.modelo} {self.capacidade_gb}GB - {self.grade} (x{self.quantidade})"
 
+class Cambio(models.Model):
+    """Cotação diária USDT/BRL (série histórica carregada por `manage.py importar_cambios`).
+
+    O câmbio vigente numa data é o da última cotação até ela (core.cambios.cambio_em); o índice
+    único em `data` atende essa busca.
+    """
+    data = models.DateField(unique=True)
+    cambio_usdt = models.DecimalField(
+        max_digits=10, decimal_places=4,
+        help_text="Cotação USDT/BRL"
+    )
+    
+    class Meta:
+        ordering = ['-data']
+        verbose_name = 'Câmbio'
+        verbose_name_plural = 'Câmbios'
+    
+    def __str__(self):
+        return f"{self.data:%d/%m/%Y} - {self.cambio_usdt}"
+
+class ReavaliacaoCambio(models.Model):
+    """Câmbio aplicado de uma vez às importações em aberto (core.bulk_updates.reavaliar_cambio)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reavaliacoes_cambio')
+    cambio_usdt = models.DecimalField(
+        max_digits=10, decimal_places=4,
+        help_text="Câmbio USDT aplicado"
+    )
+    importacoes = models.PositiveIntegerField(help_text="Importações reavaliadas")
+    unidades = models.PositiveIntegerField(help_text="Unidades reavaliadas")
+    impacto_brl = models.DecimalField(
+        max_digits=14, decimal_places=2,
+        help_text="Variação do custo total (BRL) das importações reavaliadas"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Reavaliação de Câmbio'
+        verbose_name_plural = 'Reavaliações de Câmbio'
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.cambio_usdt} ({self.importacoes} importações)"
+
 class HistoricoPreco(models.Model):
     """Histórico de preços para análise de tendências"""
     modelo = models.CharField(max_length=50)
@@ -240,13 +337,94 @@ class HistoricoPreco(models.Model):
     grade = models.CharField(max_length=2)
     preco_eua = models.DecimalField(max_digits=10, decimal_places=2)
     preco_venda_brl = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
-    data_registro = models.DateField(auto_now_add=True)
+    data_registro = models.DateField(default=timezone.localdate)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     
     class Meta:
         ordering = ['-data_registro']
+        # Uma observação por produto e dia (core.price_history grava com ignore_conflicts)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'modelo', 'capacidade_gb', 'grade', 'data_registro'],
+                name='historico_preco_unico_por_dia',
+            ),
+        ]
         verbose_name = 'Histórico de Preço'
         verbose_name_plural = 'Histórico de Preços'
     
     def __str__(self):
         return f"{self.modelo} {self.capacidade_gb}GB {self.grade} - ${self.preco_eua}"
+
+class PerfilRequisicao(models.Model):
+    """Perfil (cProfile + SQL) de uma requisição, solicitado por um administrador"""
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    view_name = models.CharField(max_length=200, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    duracao_ms = models.FloatField(help_text="Tempo total da requisição (ms)")
+    total_queries = models.PositiveIntegerField(default=0)
+    db_ms = models.FloatField(default=0, help_text="Tempo total em queries SQL (ms)")
+    funcoes = models.JSONField(default=list, help_text="Funções com maior tempo acumulado")
+    queries = models.JSONField(default=list, help_text="Queries SQL agrupadas por texto")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Perfil de Requisição'
+        verbose_name_plural = 'Perfis de Requisição'
+    
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duracao_ms:.0f} ms)"
+
+class QueryLenta(models.Model):
+    """Query SQL acima de SLOW_QUERY_THRESHOLD_MS (buffer circular de SLOW_QUERY_MAX_ENTRIES)"""
+    sql = models.TextField()
+    params = models.JSONField(default=list, help_text="Parâmetros usados no EXPLAIN")
+    duracao_ms = models.FloatField()
+    view_name = models.CharField(max_length=200, blank=True)
+    path = models.CharField(max_length=500, blank=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    stack = models.TextField(blank=True, help_text="Frames do projeto que originaram a query")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Query Lenta'
+        verbose_name_plural = 'Queries Lentas'
+    
+    def __str__(self):
+        return f"{self.duracao_ms:.0f} ms - {self.sql[:80]}"
+
+class RelatorioCache(models.Model):
+    """Resultado calculado de um tipo de relatório, válido enquanto a versão dos dados não mudar"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='relatorios_cache')
+    tipo = models.CharField(max_length=30)
+    versao = models.CharField(max_length=40, help_text="Token de core.versioning.VersaoDados")
+    dados = models.JSONField(encoder=RelatorioJSONEncoder, decoder=RelatorioJSONDecoder)
+    calculado_em = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['user', 'tipo']
+        verbose_name = 'Relatório em Cache'
+        verbose_name_plural = 'Relatórios em Cache'
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.tipo} ({self.versao})"
+
+
+class ExportacaoCache(models.Model):
+    """Arquivo de exportação (PDF/XLSX) pré-gerado, servido enquanto a versão dos dados não mudar"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='exportacoes_cache')
+    nome = models.CharField(max_length=40, help_text="Formato e tipo, ex.: pdf:completo")
+    versao = models.CharField(max_length=40, help_text="Token de core.versioning.VersaoDados")
+    conteudo = models.BinaryField()
+    gerado_em = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['user', 'nome']
+        verbose_name = 'Exportação em Cache'
+        verbose_name_plural = 'Exportações em Cache'
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.nome} ({self.versao})"
@@ -0,0 +1,42 @@
+"""Pré-cálculo de relatórios e exportações por usuário (usado por precompute_relatorios).
+
+Incremental: um usuário cuja versão dos dados já tem todos os resultados e arquivos gravados
+é pulado sem recalcular nada.
+"""
+from . import report_renderers, report_store
+from .models import ExportacaoCache, User
+from .versioning import versao_dados
+
+# Todos os tipos de relatório (dashboard, página de relatórios e exportações)
+TIPOS = list(report_store.TIPOS)
+
+
+def exportacoes_atualizadas(user, versao):
+    existentes = ExportacaoCache.objects.filter(
+        user=user, nome__in=report_renderers.EXPORTACOES, versao=versao.token,
+    ).count()
+    return existentes == len(report_renderers.EXPORTACOES)
+
+
+def precomputar_usuario(user_id, exportar=True, forcar=False):
+    """Calcula e grava os relatórios (e, se `exportar`, os arquivos) do usuário.
+
+    Retorna (user_id, calculado); calculado é False quando a versão atual já estava pronta.
+    """
+    user = User.objects.get(pk=user_id)
+    versao = versao_dados(user)
+    if not forcar and report_store.atualizados(user, TIPOS, versao) and (
+        not exportar or exportacoes_atualizadas(user, versao)
+    ):
+        return user_id, False
+
+    if forcar:
+        report_store.invalidar(user.pk)
+    dados = report_store.obter_relatorios(user, TIPOS, versao)
+    if exportar and report_renderers.EXPORT_AVAILABLE:
+        arquivos = {}
+        for nome in report_renderers.EXPORTACOES:
+            with report_renderers.exportacao(nome, dados) as arquivo:
+                arquivos[nome] = arquivo.read()
+        report_store.salvar_exportacoes(user, versao, arquivos)
+    return user_id, True
@@ -0,0 +1,120 @@
+"""Histórico de preços capturado automaticamente das importações.
+
+Cada escrita em importações (save, compra em lote, ações em massa, rateio de lote) registra uma
+observação de preço de (modelo, capacidade_gb, grade) por dia, com os preços gravados naquela
+escrita. As observações entram num buffer do processo depois do commit, já agrupadas por produto
+e dia, e são gravadas em lote com um único bulk_create. Sobre a restrição única de HistoricoPreco
+(usuário, produto e dia), o conflito atualiza os preços, então vale a última observação do dia:
+uma correção feita no mesmo dia substitui o preço anterior.
+
+O buffer é gravado em request_finished, que o servidor dispara depois de enviar a resposta, quando
+junta PRICE_HISTORY_BATCH_SIZE observações ou a mais antiga passa de PRICE_HISTORY_FLUSH_SECONDS
+(0 grava ao fim de cada requisição); o que restar é gravado na saída normal do processo. O
+formulário nunca espera por essas escritas. Um worker morto sem saída normal (SIGKILL, timeout do
+gunicorn) perde as observações ainda no buffer, no máximo PRICE_HISTORY_FLUSH_SECONDS delas; a
+próxima escrita no mesmo produto e dia volta a registrar o preço.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import DatabaseError, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import HistoricoPreco
+
+logger = logging.getLogger('core.performance')
+
+# Campos de Importacao lidos por observar (os chamadores com QuerySet usam .only(*CAMPOS))
+CAMPOS = ['user', 'modelo', 'capacidade_gb', 'grade', 'valor_eua_unitario', 'preco_venda_unitario']
+_UNICOS = ['user', 'modelo', 'capacidade_gb', 'grade', 'data_registro']
+
+_lock = threading.Lock()
+# (user_id, modelo, capacidade_gb, grade, dia) -> (preco_eua, preco_venda_brl) da última observação
+_pendentes = {}
+_primeira = None
+
+
+def observar(importacoes):
+    """Registra os preços atuais de `importacoes` (instâncias gravadas) para depois do commit"""
+    dia = timezone.localdate()
+    observacoes = {
+        (importacao.user_id, importacao.modelo, importacao.capacidade_gb, importacao.grade, dia):
+            (importacao.valor_eua_unitario, importacao.preco_venda_unitario)
+        for importacao in importacoes
+    }
+    if observacoes:
+        transaction.on_commit(lambda: _enfileirar(observacoes))
+
+
+def _enfileirar(observacoes):
+    global _primeira
+    with _lock:
+        if not _pendentes:
+            _primeira = time.monotonic()
+        _pendentes.update(observacoes)
+
+
+def pendentes():
+    """Quantidade de observações (produto e dia) ainda não gravadas neste processo"""
+    with _lock:
+        return len(_pendentes)
+
+
+def _devido():
+    with _lock:
+        if not _pendentes:
+            return False
+        return (
+            len(_pendentes) >= getattr(settings, 'PRICE_HISTORY_BATCH_SIZE', 500)
+            or time.monotonic() - _primeira >= getattr(settings, 'PRICE_HISTORY_FLUSH_SECONDS', 5)
+        )
+
+
+def _retirar():
+    global _primeira
+    with _lock:
+        observacoes = dict(_pendentes)
+        _pendentes.clear()
+        _primeira = None
+    return observacoes
+
+
+def flush():
+    """Grava as observações pendentes; retorna quantos registros foram enviados ao banco"""
+    observacoes = _retirar()
+    if not observacoes:
+        return 0
+    registros = [
+        HistoricoPreco(
+            user_id=user_id, modelo=modelo, capacidade_gb=capacidade_gb, grade=grade,
+            preco_eua=preco_eua, preco_venda_brl=preco_venda_brl, data_registro=dia,
+        )
+        for (user_id, modelo, capacidade_gb, grade, dia), (preco_eua, preco_venda_brl) in observacoes.items()
+    ]
+    try:
+        HistoricoPreco.objects.bulk_create(
+            registros,
+            batch_size=getattr(settings, 'PRICE_HISTORY_BATCH_SIZE', 500),
+            update_conflicts=True,
+            unique_fields=_UNICOS,
+            update_fields=['preco_eua', 'preco_venda_brl'],
+        )
+    except DatabaseError:
+        # O histórico nunca deve derrubar a requisição que terminou
+        logger.exception('Falha ao gravar o histórico de preços')
+        return 0
+    return len(registros)
+
+
+@receiver(request_finished)
+def _flush_se_devido(sender, **kwargs):
+    if _devido():
+        flush()
+
+
+atexit.register(flush)
@@ -0,0 +1,105 @@
+"""Profiler sob demanda: cProfile + captura de SQL de uma única requisição"""
+import cProfile
+import os
+import pstats
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from .models import PerfilRequisicao
+
+MAX_FUNCOES = 40
+MAX_QUERIES = 50
+MAX_SQL_CHARS = 2000
+
+
+class SQLCollector:
+    """Execute wrapper que agrupa as queries pelo texto SQL"""
+
+    def __init__(self):
+        self.queries = {}
+        self.total = 0
+        self.elapsed = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.total += 1
+            self.elapsed += elapsed
+            item = self.queries.setdefault(sql, {'sql': sql[:MAX_SQL_CHARS], 'count': 0, 'total_ms': 0.0})
+            item['count'] += 1
+            item['total_ms'] += elapsed * 1000
+
+    def top(self):
+        itens = sorted(self.queries.values(), key=lambda item: item['total_ms'], reverse=True)[:MAX_QUERIES]
+        return [dict(item, total_ms=round(item['total_ms'], 3)) for item in itens]
+
+
+def _nome_funcao(filename, line, func):
+    if filename == '~':
+        return func  # funções built-in
+    # Caminhos relativos ao projeto ficam mais legíveis no painel
+    base = str(settings.BASE_DIR)
+    if filename.startswith(base):
+        filename = os.path.relpath(filename, base)
+    return f'{filename}:{line}({func})'
+
+
+def top_funcoes(profiler):
+    stats = pstats.Stats(profiler)
+    funcoes = []
+    for (filename, line, func), (cc, nc, tt, ct, _callers) in stats.stats.items():
+        funcoes.append({
+            'funcao': _nome_funcao(filename, line, func),
+            'chamadas': nc,
+            'tempo_proprio_ms': round(tt * 1000, 3),
+            'tempo_acumulado_ms': round(ct * 1000, 3),
+        })
+    funcoes.sort(key=lambda item: item['tempo_acumulado_ms'], reverse=True)
+    return funcoes[:MAX_FUNCOES]
+
+
+def profile_request(get_response, request):
+    """Executa a requisição sob cProfile e grava um PerfilRequisicao.
+
+    Retorna (response, perfil); perfil é None se outro profiler já estiver ativo.
+    """
+    profiler = cProfile.Profile()
+    collector = SQLCollector()
+    start = time.perf_counter()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Outro profiler (sys.setprofile) já está ativo neste processo
+        return get_response(request), None
+    try:
+        with connection.execute_wrapper(collector):
+            response = get_response(request)
+    finally:
+        profiler.disable()
+    duracao = time.perf_counter() - start
+
+    match = request.resolver_match
+    perfil = PerfilRequisicao.objects.create(
+        user=request.user if request.user.is_authenticated else None,
+        method=request.method,
+        path=request.get_full_path()[:500],
+        view_name=match.view_name if match else '',
+        status_code=response.status_code,
+        duracao_ms=round(duracao * 1000, 2),
+        total_queries=collector.total,
+        db_ms=round(collector.elapsed * 1000, 2),
+        funcoes=top_funcoes(profiler),
+        queries=collector.top(),
+    )
+
+    # Mantém apenas os perfis mais recentes
+    limite = getattr(settings, 'PROFILER_MAX_PROFILES', 50)
+    antigos = PerfilRequisicao.objects.values_list('pk', flat=True)[limite:]
+    PerfilRequisicao.objects.filter(pk__in=list(antigos)).delete()
+
+    return response, perfil
@@ -0,0 +1,81 @@
+"""Pacote ZIP com todos os relatórios em PDF e Excel.
+
+Os arquivos pré-gerados para a versão dos dados (ExportacaoCache) entram no ZIP direto. Só os
+que faltam são renderizados: os dados são lidos uma vez (report_store) e compartilhados, e cada
+arquivo é renderizado em um thread do pool e entra no ZIP assim que fica pronto, enquanto a
+resposta já está sendo enviada. A renderização não acessa o banco, então os threads não abrem
+conexões.
+"""
+import io
+import shutil
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .report_renderers import TIPOS_EXCEL, TIPOS_PDF, exportacao, tipos_da_exportacao
+
+# (nome do arquivo no ZIP, exportação em report_renderers.EXPORTACOES)
+ARQUIVOS = [
+    *((f'relatorio_{tipo}.pdf', f'pdf:{tipo}') for tipo in TIPOS_PDF),
+    *((f'relatorio_{tipo}.xlsx', f'xlsx:{tipo}') for tipo in TIPOS_EXCEL),
+]
+
+
+def tipos_faltantes(prontas):
+    """Tipos de report_store necessários para renderizar as exportações fora de `prontas`"""
+    return sorted({
+        tipo
+        for _arquivo, nome in ARQUIVOS if nome not in prontas
+        for tipo in tipos_da_exportacao(nome)
+    })
+
+
+class _Saida:
+    """Destino do ZipFile que acumula os bytes escritos até o próximo `esvaziar()`.
+
+    Não tem seek/tell: o zipfile passa a gravar data descriptors, como exige o streaming.
+    """
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def esvaziar(self):
+        dados = b''.join(self._partes)
+        self._partes.clear()
+        return dados
+
+
+def gerar_zip(dados, prontas=None, max_workers=4):
+    """Gera o ZIP em blocos de bytes: primeiro as exportações `prontas` ({nome: conteúdo}), depois
+    cada relatório que falta, na ordem em que a renderização termina"""
+    prontas = prontas or {}
+    saida = _Saida()
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='relatorios-zip')
+    try:
+        futuros = {
+            executor.submit(exportacao, nome, dados): arquivo
+            for arquivo, nome in ARQUIVOS if nome not in prontas
+        }
+        with zipfile.ZipFile(saida, 'w', compression=zipfile.ZIP_DEFLATED) as pacote:
+            for arquivo, nome in ARQUIVOS:
+                if nome in prontas:
+                    _adicionar(pacote, arquivo, io.BytesIO(prontas[nome]))
+                    yield saida.esvaziar()
+            for futuro in as_completed(futuros):
+                _adicionar(pacote, futuros[futuro], futuro.result())
+                yield saida.esvaziar()
+        yield saida.esvaziar()
+    finally:
+        # Cliente desconectado: não renderiza o que ainda não começou
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _adicionar(pacote, nome, origem):
+    with origem, pacote.open(nome, 'w') as destino:
+        shutil.copyfileobj(origem, destino)
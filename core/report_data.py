@@ -0,0 +1,402 @@
+"""Dados dos relatórios em linhas tipadas e compactas.
+
+Todos os totais (geral, por modelo, por grade e por status) saem de uma única query agrupada por
+(modelo, grade, status); as linhas de detalhe saem de um values_list, sem instanciar Importacao.
+Os custos são calculados no banco com as mesmas fórmulas das properties de Importacao, e os
+valores monetários são arredondados para centavos, de modo que página, PDF e Excel coincidam.
+
+Os grupos guardam os totais com 6 casas e só os relatórios arredondam para centavos: assim, somar
+e subtrair a contribuição de uma importação (aplicar_delta) dá o mesmo resultado da query agrupada.
+"""
+from datetime import datetime
+from decimal import Decimal
+from functools import cached_property
+from typing import NamedTuple, Optional
+
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, Q, Sum, Value, When
+
+from .models import Importacao, Lote
+
+CENTAVOS = Decimal('0.01')
+PRECISAO_GRUPOS = Decimal('0.000001')
+# Linhas de detalhe usadas nas prévias (página de relatórios e PDF completo)
+LIMITE_RECENTES = 20
+_DECIMAL = DecimalField(max_digits=20, decimal_places=6)
+
+# Espelho, em SQL, das properties de Importacao (custo_eua_total, custo_eua_brl, ...).
+# `prefixo` aplica as fórmulas a importações relacionadas (ex.: 'importacoes__' a partir de Lote).
+def custo_eua_total(prefixo=''):
+    return ExpressionWrapper(
+        (F(f'{prefixo}valor_eua_unitario') + F(f'{prefixo}taxa_adm_fixa') + F(f'{prefixo}frete_eua') + F(f'{prefixo}pol_eua'))
+        * (Value(Decimal('1')) + F(f'{prefixo}taxa_adm_percentual')),
+        output_field=_DECIMAL,
+    )
+
+
+def custo_total_py_usd(prefixo=''):
+    return ExpressionWrapper(
+        custo_eua_total(prefixo) + F(f'{prefixo}frete_py_usd_kg') + F(f'{prefixo}kg_py_usd'), output_field=_DECIMAL,
+    )
+
+
+def custo_total_py_brl(prefixo=''):
+    return ExpressionWrapper(custo_total_py_usd(prefixo) * F(f'{prefixo}cambio_usdt'), output_field=_DECIMAL)
+
+
+CUSTO_EUA_TOTAL = custo_eua_total()
+CUSTO_EUA_BRL = ExpressionWrapper(CUSTO_EUA_TOTAL * F('cambio_usdt'), output_field=_DECIMAL)
+CUSTO_TOTAL_PY_USD = custo_total_py_usd()
+CUSTO_TOTAL_PY_BRL = custo_total_py_brl()
+
+# Mesma regra de lucro_unitario: só há venda quando o preço foi informado (e não é zero)
+_VENDIDO = Q(preco_venda_unitario__gt=0)
+
+
+def centavos(valor):
+    return Decimal(valor or 0).quantize(CENTAVOS)
+
+
+def _preciso(valor):
+    return Decimal(valor or 0).quantize(PRECISAO_GRUPOS)
+
+
+def percentual(parte, total):
+    return (parte / total * 100).quantize(CENTAVOS) if total > 0 else Decimal('0.00')
+
+
+class Grupo(NamedTuple):
+    """Totais de uma combinação (modelo, grade, status), com PRECISAO_GRUPOS casas"""
+    modelo: str
+    grade: str
+    status: str
+    importacoes: int
+    unidades: int
+    investido_usd: Decimal
+    investido_brl: Decimal
+    soma_custo_unitario_brl: Decimal
+    vendido: Decimal
+    lucro: Decimal
+
+
+class EstatisticasGerais(NamedTuple):
+    total_importacoes: int
+    total_unidades: int
+    total_investido_usd: Decimal
+    total_investido_brl: Decimal
+    valor_medio_unitario: Decimal
+    modelos_unicos: int
+    grades_unicas: int
+
+
+_CAMPOS_RENTABILIDADE = [
+    ('total_importacoes', int),
+    ('total_unidades', int),
+    ('total_investido', Decimal),
+    ('total_vendido', Decimal),
+    ('lucro_total', Decimal),
+    ('margem_media', Decimal),
+]
+RentabilidadeModelo = NamedTuple('RentabilidadeModelo', [('modelo', str)] + _CAMPOS_RENTABILIDADE)
+RentabilidadeGrade = NamedTuple('RentabilidadeGrade', [('grade', str)] + _CAMPOS_RENTABILIDADE)
+
+
+class StatusLinha(NamedTuple):
+    status_key: str
+    status: str
+    count: int
+    total_unidades: int
+    total_valor: Decimal
+    valor_medio: Decimal
+
+
+class CustoLinha(NamedTuple):
+    """Comparação EUA vs Paraguay de uma importação"""
+    modelo: str
+    capacidade: int
+    grade: str
+    custo_eua: Decimal
+    custo_py: Decimal
+    diferenca: Decimal
+    percentual_diferenca: Decimal
+
+
+class Detalhe(NamedTuple):
+    pk: int
+    modelo: str
+    capacidade_gb: int
+    grade: str
+    quantidade: int
+    status: str
+    valor_eua_unitario: Decimal
+    custo_eua_brl: Decimal
+    custo_total_py_brl: Decimal
+    preco_venda_unitario: Optional[Decimal]
+    created_at: datetime
+
+    @property
+    def status_display(self):
+        return STATUS_DISPLAY[self.status]
+
+    @property
+    def lucro_unitario(self):
+        if self.preco_venda_unitario:
+            return self.preco_venda_unitario - self.custo_total_py_brl
+        return None
+
+    @property
+    def lucro_total(self):
+        lucro = self.lucro_unitario
+        return lucro * self.quantidade if lucro is not None else None
+
+
+class Modelo(NamedTuple):
+    """Modelo com ao menos uma importação (sugestões do filtro da lista de importações)"""
+    modelo: str
+
+
+class Venda(NamedTuple):
+    """ROI e markup de uma importação vendida"""
+    pk: int
+    modelo: str
+    capacidade_gb: int
+    grade: str
+    quantidade: int
+    custo_total_py_brl: Decimal
+    preco_venda_unitario: Decimal
+    lucro_total: Decimal
+    roi: Decimal
+    markup: Decimal
+
+
+class LoteResumo(NamedTuple):
+    """Totais de uma remessa: custos da fatura e o que foi rateado para as linhas"""
+    pk: int
+    descricao: str
+    criterio_rateio: str
+    frete_total_usd: Decimal
+    taxas_total_usd: Decimal
+    importacoes: int
+    unidades: int
+    peso_kg: Decimal
+    frete_rateado_usd: Decimal
+    taxas_rateadas_usd: Decimal
+    investido_usd: Decimal
+    investido_brl: Decimal
+    vendido: Decimal
+    lucro: Decimal
+
+    @property
+    def criterio_display(self):
+        return CRITERIO_DISPLAY[self.criterio_rateio]
+
+
+STATUS_DISPLAY = dict(Importacao.STATUS_CHOICES)
+CRITERIO_DISPLAY = dict(Lote.CRITERIO_CHOICES)
+
+
+class DadosRelatorio:
+    """Fonte única dos relatórios de um usuário: cada query roda no máximo uma vez por instância"""
+
+    def __init__(self, user, grupos=None):
+        self.user = user
+        if grupos is not None:
+            # Grupos já persistidos (core.report_store): os totais saem deles sem consultar o banco
+            self.__dict__['grupos'] = grupos
+
+    def _importacoes(self):
+        return Importacao.objects.filter(user=self.user)
+
+    def _grupos(self, queryset):
+        linhas = (
+            queryset
+            .order_by()
+            .values_list('modelo', 'grade', 'status')
+            .annotate(
+                importacoes=Count('id'),
+                unidades=Sum('quantidade'),
+                investido_usd=Sum(CUSTO_TOTAL_PY_USD * F('quantidade')),
+                investido_brl=Sum(CUSTO_TOTAL_PY_BRL * F('quantidade')),
+                soma_custo_unitario_brl=Sum(CUSTO_TOTAL_PY_BRL),
+                vendido=Sum(Case(When(_VENDIDO, then=F('preco_venda_unitario') * F('quantidade')), output_field=_DECIMAL)),
+                lucro=Sum(Case(
+                    When(_VENDIDO, then=(F('preco_venda_unitario') - CUSTO_TOTAL_PY_BRL) * F('quantidade')),
+                    output_field=_DECIMAL,
+                )),
+            )
+        )
+        return [
+            Grupo(modelo, grade, status, importacoes, unidades, *map(_preciso, valores))
+            for modelo, grade, status, importacoes, unidades, *valores in linhas
+        ]
+
+    @cached_property
+    def grupos(self):
+        return self._grupos(self._importacoes())
+
+    def grupos_das_importacoes(self, pks):
+        """Contribuição das importações `pks` para os grupos (lista vazia se nenhuma existe)"""
+        return self._grupos(self._importacoes().filter(pk__in=pks)) if pks else []
+
+    def geral(self):
+        total = sum(grupo.importacoes for grupo in self.grupos)
+        soma_custo_unitario = sum(grupo.soma_custo_unitario_brl for grupo in self.grupos)
+        return EstatisticasGerais(
+            total_importacoes=total,
+            total_unidades=sum(grupo.unidades for grupo in self.grupos),
+            total_investido_usd=centavos(sum(grupo.investido_usd for grupo in self.grupos)),
+            total_investido_brl=centavos(sum(grupo.investido_brl for grupo in self.grupos)),
+            valor_medio_unitario=centavos(soma_custo_unitario / total) if total else Decimal('0.00'),
+            modelos_unicos=len({grupo.modelo for grupo in self.grupos}),
+            grades_unicas=len({grupo.grade for grupo in self.grupos}),
+        )
+
+    def modelos(self):
+        """Modelos importados em ordem alfabética, tirados da mesma query agrupada dos totais"""
+        return [Modelo(modelo) for modelo in sorted({grupo.modelo for grupo in self.grupos})]
+
+    def _rentabilidade_por(self, campo, linha):
+        acumulado = {}
+        for grupo in self.grupos:
+            chave = getattr(grupo, campo)
+            totais = acumulado.setdefault(chave, [0, 0, Decimal('0.00'), Decimal('0.00'), Decimal('0.00')])
+            totais[0] += grupo.importacoes
+            totais[1] += grupo.unidades
+            totais[2] += grupo.investido_brl
+            # Como antes: venda e lucro só contam para importações com status "vendido"
+            if grupo.status == 'vendido':
+                totais[3] += grupo.vendido
+                totais[4] += grupo.lucro
+        linhas = []
+        for chave, (importacoes, unidades, investido, vendido, lucro) in acumulado.items():
+            investido, lucro = centavos(investido), centavos(lucro)
+            linhas.append(linha(
+                chave, importacoes, unidades, investido, centavos(vendido), lucro, percentual(lucro, investido),
+            ))
+        return sorted(linhas, key=lambda item: item.margem_media, reverse=True)
+
+    def rentabilidade_por_modelo(self):
+        return self._rentabilidade_por('modelo', RentabilidadeModelo)
+
+    def rentabilidade_por_grade(self):
+        return self._rentabilidade_por('grade', RentabilidadeGrade)
+
+    def status(self):
+        """Totais por status na ordem de STATUS_CHOICES"""
+        acumulado = {}
+        for grupo in self.grupos:
+            totais = acumulado.setdefault(grupo.status, [0, 0, Decimal('0.00')])
+            totais[0] += grupo.importacoes
+            totais[1] += grupo.unidades
+            totais[2] += grupo.investido_brl
+        linhas = []
+        for chave, rotulo in Importacao.STATUS_CHOICES:
+            if chave in acumulado:
+                count, unidades, valor = acumulado[chave]
+                linhas.append(StatusLinha(chave, rotulo, count, unidades, centavos(valor), centavos(valor / count)))
+        return linhas
+
+    def _linhas_detalhe(self, queryset):
+        linhas = queryset.annotate(
+            _custo_eua_brl=CUSTO_EUA_BRL,
+            _custo_total_py_brl=CUSTO_TOTAL_PY_BRL,
+        ).values_list(
+            'pk', 'modelo', 'capacidade_gb', 'grade', 'quantidade', 'status', 'valor_eua_unitario',
+            '_custo_eua_brl', '_custo_total_py_brl', 'preco_venda_unitario', 'created_at',
+        )
+        return [
+            Detalhe(pk, modelo, capacidade, grade, quantidade, status, valor_eua,
+                    centavos(custo_eua), centavos(custo_py), preco, created_at)
+            for pk, modelo, capacidade, grade, quantidade, status, valor_eua, custo_eua, custo_py, preco, created_at in linhas
+        ]
+
+    @cached_property
+    def detalhes(self):
+        """Todas as importações, da mais recente para a mais antiga"""
+        return self._linhas_detalhe(self._importacoes())
+
+    @cached_property
+    def _recentes(self):
+        if 'detalhes' in self.__dict__:
+            return self.detalhes[:LIMITE_RECENTES]
+        return self._linhas_detalhe(self._importacoes()[:LIMITE_RECENTES])
+
+    def recentes(self):
+        """As LIMITE_RECENTES importações mais recentes (prévias da página e do PDF completo)"""
+        return self._recentes
+
+    def custos(self):
+        """Comparação EUA vs Paraguay das 10 importações mais recentes"""
+        return [
+            CustoLinha(
+                imp.modelo, imp.capacidade_gb, imp.grade, imp.custo_eua_brl, imp.custo_total_py_brl,
+                imp.custo_total_py_brl - imp.custo_eua_brl,
+                percentual(imp.custo_total_py_brl - imp.custo_eua_brl, imp.custo_eua_brl),
+            )
+            for imp in self.recentes()[:10]
+        ]
+
+    def vendas(self):
+        """ROI e markup de cada importação vendida, do maior ROI para o menor"""
+        vendas = []
+        for imp in self._linhas_detalhe(self._importacoes().filter(_VENDIDO)):
+            lucro = imp.lucro_unitario
+            if not lucro:
+                continue
+            vendas.append(Venda(
+                imp.pk, imp.modelo, imp.capacidade_gb, imp.grade, imp.quantidade, imp.custo_total_py_brl,
+                imp.preco_venda_unitario, lucro * imp.quantidade,
+                roi=percentual(lucro, imp.custo_total_py_brl),
+                markup=percentual(imp.preco_venda_unitario - imp.custo_total_py_brl, imp.custo_total_py_brl),
+            ))
+        return sorted(vendas, key=lambda item: item.roi, reverse=True)
+
+    def lotes(self):
+        """Totais de cada remessa (inclusive as ainda sem importações) numa única query agrupada"""
+        linhas = (
+            Lote.objects.filter(user=self.user)
+            .values_list('pk', 'descricao', 'criterio_rateio', 'frete_total_usd', 'taxas_total_usd')
+            .annotate(
+                total_importacoes=Count('importacoes'),
+                unidades=Sum('importacoes__quantidade'),
+                peso=Sum(F('importacoes__peso_kg') * F('importacoes__quantidade'), output_field=_DECIMAL),
+                frete_rateado=Sum(
+                    (F('importacoes__frete_py_usd_kg') + F('importacoes__kg_py_usd')) * F('importacoes__quantidade'),
+                    output_field=_DECIMAL,
+                ),
+                taxas_rateadas=Sum(F('importacoes__taxa_adm_fixa') * F('importacoes__quantidade'), output_field=_DECIMAL),
+                investido_usd=Sum(custo_total_py_usd('importacoes__') * F('importacoes__quantidade')),
+                investido_brl=Sum(custo_total_py_brl('importacoes__') * F('importacoes__quantidade')),
+                vendido=Sum(Case(
+                    When(importacoes__preco_venda_unitario__gt=0,
+                         then=F('importacoes__preco_venda_unitario') * F('importacoes__quantidade')),
+                    output_field=_DECIMAL,
+                )),
+                lucro=Sum(Case(
+                    When(importacoes__preco_venda_unitario__gt=0,
+                         then=(F('importacoes__preco_venda_unitario') - custo_total_py_brl('importacoes__'))
+                         * F('importacoes__quantidade')),
+                    output_field=_DECIMAL,
+                )),
+            )
+            .order_by('-created_at')
+        )
+        return [
+            LoteResumo(pk, descricao, criterio, frete, taxas, importacoes, unidades or 0,
+                       Decimal(peso or 0).quantize(Decimal('0.001')), *map(centavos, valores))
+            for pk, descricao, criterio, frete, taxas, importacoes, unidades, peso, *valores in linhas
+        ]
+
+
+def aplicar_delta(grupos, removidos=(), incluidos=()):
+    """Grupos após descontar as contribuições `removidos` e somar as `incluidos`.
+
+    As contribuições são listas de DadosRelatorio.grupos_das_importacoes (as importações antes
+    e depois de uma escrita); grupos que ficam sem importações desaparecem.
+    """
+    totais = {grupo[:3]: list(grupo[3:]) for grupo in grupos}
+    for sinal, contribuicoes in ((-1, removidos), (1, incluidos)):
+        for contribuicao in contribuicoes:
+            acumulado = totais.setdefault(contribuicao[:3], [0] * (len(Grupo._fields) - 3))
+            for indice, valor in enumerate(contribuicao[3:]):
+                acumulado[indice] += sinal * valor
+    return [Grupo(*chave, *valores) for chave, valores in totais.items() if valores[0] > 0]
@@ -0,0 +1,470 @@
+"""Renderização dos relatórios (página HTML, PDF e Excel) a partir dos mesmos resultados.
+
+Cada saída recebe o dict devolvido por report_store.obter_relatorios, com linhas tipadas de
+core.report_data; nenhuma delas consulta o banco, então página e exportações não divergem.
+"""
+import io
+import tempfile
+from functools import cache
+
+REPORTLAB_AVAILABLE = False
+XLSXWRITER_AVAILABLE = False
+
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import BaseDocTemplate, Frame, LongTable, PageTemplate, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib import colors
+    REPORTLAB_AVAILABLE = True
+except ImportError:
+    pass
+
+try:
+    import xlsxwriter
+    XLSXWRITER_AVAILABLE = True
+except ImportError:
+    pass
+
+# Exportações exigem reportlab (PDF) e xlsxwriter (Excel)
+EXPORT_AVAILABLE = REPORTLAB_AVAILABLE and XLSXWRITER_AVAILABLE
+
+# PDFs até este tamanho ficam em memória; acima disso o arquivo temporário vai para o disco
+PDF_MEMORIA_MAX = 5 * 1024 * 1024
+# Linhas por tabela do PDF: tabelas menores mantêm o custo de quebra de página linear
+LINHAS_POR_BLOCO = 250
+
+# Tipos de report_store necessários para cada página/exportação
+# Widgets do dashboard, carregados um a um via HTMX ('recentes' lê as importações na view)
+TIPOS_WIDGETS = {
+    'totais': ['geral'],
+    'lucro': ['rentabilidade'],
+    'status': ['status'],
+    'modelos_populares': ['rentabilidade'],
+    'recentes': [],
+}
+TIPOS_PAGINA = ['rentabilidade', 'status', 'custos', 'grade', 'geral', 'recentes']
+TIPOS_RENTABILIDADE = ['vendas', 'geral']
+TIPOS_PDF = {
+    'rentabilidade': ['rentabilidade'],
+    'status': ['status'],
+    'completo': ['geral', 'detalhes'],
+}
+TIPOS_EXCEL = {
+    'rentabilidade': ['rentabilidade'],
+    'grade': ['grade'],
+    'status': ['status'],
+    'completo': ['geral', 'rentabilidade', 'grade', 'status', 'detalhes'],
+}
+
+# Todas as exportações, identificadas por "formato:tipo" (ex.: 'pdf:completo')
+EXPORTACOES = [f'pdf:{tipo}' for tipo in TIPOS_PDF] + [f'xlsx:{tipo}' for tipo in TIPOS_EXCEL]
+
+
+def tipos_da_exportacao(nome):
+    formato, tipo_relatorio = nome.split(':')
+    return (TIPOS_PDF if formato == 'pdf' else TIPOS_EXCEL).get(tipo_relatorio, [])
+
+
+def contexto_widget(widget, dados):
+    """Contexto de dashboard/widgets/<widget>.html (as importações recentes são lidas pela view)"""
+    if widget == 'totais':
+        geral = dados['geral']
+        return {
+            'total_importacoes': geral.total_importacoes,
+            'total_investido_usd': geral.total_investido_usd,
+            'total_investido_brl': geral.total_investido_brl,
+        }
+    if widget == 'lucro':
+        # Lucro apenas das importações vendidas, como na rentabilidade por modelo
+        return {'lucro_total': sum(item.lucro_total for item in dados['rentabilidade'])}
+    if widget == 'status':
+        return {'status_stats': {
+            item.status_key: {'count': item.count, 'valor_total': item.total_valor, 'display': item.status}
+            for item in dados['status']
+        }}
+    if widget == 'modelos_populares':
+        populares = sorted(dados['rentabilidade'], key=lambda item: item.total_importacoes, reverse=True)[:5]
+        return {'modelos_populares': [
+            {'modelo': item.modelo, 'count': item.total_importacoes, 'total_unidades': item.total_unidades}
+            for item in populares
+        ]}
+    return {}
+
+
+def contexto_relatorios(dados):
+    """Contexto de relatorios/index.html"""
+    rentabilidade_modelo = dados['rentabilidade']
+    return {
+        'rentabilidade_modelo': rentabilidade_modelo,
+        'rentabilidade_totals': {
+            'total_investido': sum(item.total_investido for item in rentabilidade_modelo),
+            'total_vendido': sum(item.total_vendido for item in rentabilidade_modelo),
+            'total_lucro': sum(item.lucro_total for item in rentabilidade_modelo),
+        },
+        'performance_metrics': {
+            'modelos_lucrativos': len([item for item in rentabilidade_modelo if item.lucro_total > 0]),
+            'modelos_prejuizo': len([item for item in rentabilidade_modelo if item.lucro_total < 0]),
+            'melhor_modelo': max(rentabilidade_modelo, key=lambda x: x.margem_media) if rentabilidade_modelo else None,
+            'pior_modelo': min(rentabilidade_modelo, key=lambda x: x.margem_media) if rentabilidade_modelo else None,
+        },
+        'status_report': dados['status'],
+        'analise_custos': dados['custos'],
+        'performance_grade': dados['grade'],
+        'estatisticas_gerais': dados['geral'],
+        'importacoes_recentes': dados['recentes'][:10],
+    }
+
+
+def contexto_rentabilidade(dados):
+    """Contexto de relatorios/rentabilidade_detalhada.html"""
+    return {
+        'rentabilidade_detalhada': dados['vendas'],
+        'total_importacoes': dados['geral'].total_importacoes,
+        'importacoes_vendidas': len(dados['vendas']),
+    }
+
+
+@cache
+def _estilos():
+    """Estilos do PDF, montados uma vez por processo"""
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=18,
+        spaceAfter=30,
+        alignment=1  # Center alignment
+    )
+    base = [
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ]
+    return {
+        'titulo': title_style,
+        'subtitulo': styles['Heading2'],
+        'resumo': TableStyle(base),
+        'destaque': TableStyle(base + [
+            ('FONTSIZE', (0, 0), (-1, 0), 14),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ]),
+        'detalhe': TableStyle(base + [
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('FONTSIZE', (0, 1), (-1, -1), 8),
+        ]),
+    }
+
+
+# Larguras fixas (pt) para que os blocos da tabela de detalhes fiquem alinhados entre si
+LARGURAS_DETALHE = [110, 65, 45, 40, 85, 100]
+
+
+def _tabelas(cabecalho, linhas, estilo, larguras=None):
+    """LongTables de até LINHAS_POR_BLOCO linhas, repetindo o cabeçalho a cada página"""
+    bloco = [cabecalho]
+    vazia = True
+    for linha in linhas:
+        vazia = False
+        bloco.append(linha)
+        if len(bloco) > LINHAS_POR_BLOCO:
+            yield LongTable(bloco, colWidths=larguras, repeatRows=1, style=estilo)
+            bloco = [cabecalho]
+    if len(bloco) > 1 or vazia:
+        yield LongTable(bloco, colWidths=larguras, repeatRows=1, style=estilo)
+
+
+def _flowables(tipo_relatorio, dados, estilos):
+    if tipo_relatorio == 'rentabilidade':
+        yield Paragraph("Relatório de Rentabilidade por Modelo", estilos['titulo'])
+        yield Spacer(1, 12)
+        yield from _tabelas(
+            ['Modelo', 'Importações', 'Investido (R$)', 'Lucro (R$)', 'Margem (%)'],
+            (
+                [
+                    item.modelo,
+                    str(item.total_importacoes),
+                    f"R$ {item.total_investido:,.2f}",
+                    f"R$ {item.lucro_total:,.2f}",
+                    f"{item.margem_media:.1f}%"
+                ]
+                for item in dados['rentabilidade']
+            ),
+            estilos['destaque'],
+        )
+
+    elif tipo_relatorio == 'status':
+        yield Paragraph("Relatório de Status das Importações", estilos['titulo'])
+        yield Spacer(1, 12)
+        yield from _tabelas(
+            ['Status', 'Importações', 'Unidades', 'Valor Total (R$)'],
+            (
+                [item.status, str(item.count), str(item.total_unidades), f"R$ {item.total_valor:,.2f}"]
+                for item in dados['status']
+            ),
+            estilos['destaque'],
+        )
+
+    elif tipo_relatorio == 'completo':
+        yield Paragraph("Relatório Completo de Importações", estilos['titulo'])
+        yield Spacer(1, 12)
+
+        geral = dados['geral']
+        yield from _tabelas(
+            ['Métrica', 'Valor'],
+            [
+                ['Total de Importações', str(geral.total_importacoes)],
+                ['Total de Unidades', str(geral.total_unidades)],
+                ['Total Investido', f"R$ {geral.total_investido_brl:,.2f}"]
+            ],
+            estilos['resumo'],
+        )
+        yield Spacer(1, 20)
+
+        yield Paragraph("Detalhes das Importações", estilos['subtitulo'])
+        yield Spacer(1, 12)
+        yield from _tabelas(
+            ['Modelo', 'Capacidade', 'Grade', 'Qtd', 'Status', 'Custo Unit. (R$)'],
+            (
+                [
+                    imp.modelo,
+                    f"{imp.capacidade_gb}GB",
+                    imp.grade,
+                    str(imp.quantidade),
+                    imp.status_display,
+                    f"R$ {imp.custo_total_py_brl:,.2f}"
+                ]
+                for imp in dados['detalhes']
+            ),
+            estilos['detalhe'],
+            LARGURAS_DETALHE,
+        )
+
+
+if REPORTLAB_AVAILABLE:
+    class _DocumentoIncremental(BaseDocTemplate):
+        """Documento A4 paginado a partir de um iterador de flowables.
+
+        BaseDocTemplate.build exige a lista inteira de flowables. Aqui cada flowable só é puxado
+        do iterador depois que o anterior foi desenhado (handle_flowable), então só o bloco da
+        página atual existe em memória, qualquer que seja o número de linhas.
+        """
+
+        def __init__(self, destino):
+            super().__init__(destino, pagesize=A4)
+            quadro = Frame(self.leftMargin, self.bottomMargin, self.width, self.height, id='normal')
+            self.addPageTemplates([PageTemplate(id='normal', frames=[quadro], pagesize=A4)])
+
+        def construir(self, flowables):
+            self._startBuild()
+            self.canv._doctemplate = self
+            try:
+                pendentes = []
+                for flowable in flowables:
+                    pendentes.append(flowable)
+                    # Um bloco que não cabe na página é dividido e o resto volta para `pendentes`
+                    while pendentes:
+                        self.clean_hanging()
+                        self.handle_flowable(pendentes)
+            finally:
+                del self.canv._doctemplate
+            self._endBuild()
+
+
+def render_pdf(tipo_relatorio, dados, destino):
+    """Escreve em `destino` o PDF do relatório `tipo_relatorio` (chaves de TIPOS_PDF)"""
+    _DocumentoIncremental(destino).construir(_flowables(tipo_relatorio, dados, _estilos()))
+
+
+def pdf_temporario(tipo_relatorio, dados):
+    """PDF em um arquivo temporário (em memória até PDF_MEMORIA_MAX), posicionado no início"""
+    arquivo = tempfile.SpooledTemporaryFile(max_size=PDF_MEMORIA_MAX)
+    render_pdf(tipo_relatorio, dados, arquivo)
+    arquivo.seek(0)
+    return arquivo
+
+
+def exportacao(nome, dados):
+    """Arquivo da exportação `nome` ('pdf:<tipo>' ou 'xlsx:<tipo>'), posicionado no início"""
+    formato, tipo_relatorio = nome.split(':')
+    if formato == 'pdf':
+        return pdf_temporario(tipo_relatorio, dados)
+    return io.BytesIO(render_xlsx(tipo_relatorio, dados))
+
+
+def _formatos_xlsx(workbook):
+    return {
+        'header': workbook.add_format({
+            'bold': True,
+            'bg_color': '#D7E4BC',
+            'border': 1
+        }),
+        'currency': workbook.add_format({
+            'num_format': 'R$ #,##0.00',
+            'border': 1
+        }),
+        'percent': workbook.add_format({
+            'num_format': '0.0%',
+            'border': 1
+        }),
+        'number': workbook.add_format({
+            'border': 1
+        }),
+    }
+
+
+def _cabecalho(worksheet, headers, formatos):
+    for col, header in enumerate(headers):
+        worksheet.write(0, col, header, formatos['header'])
+
+
+def _grafico(workbook, tipo, titulo, nome_aba, total, series, subtipo=None):
+    """Gráfico nativo do Excel apontando para as células já escritas (linhas 1..total da aba).
+
+    `series` é uma lista de (coluna do valor, nome da série); a coluna 0 traz as categorias.
+    """
+    opcoes = {'type': tipo}
+    if subtipo:
+        opcoes['subtype'] = subtipo
+    chart = workbook.add_chart(opcoes)
+    for coluna, nome in series:
+        chart.add_series({
+            'name': nome,
+            'categories': [nome_aba, 1, 0, total, 0],
+            'values': [nome_aba, 1, coluna, total, coluna],
+        })
+    chart.set_title({'name': titulo})
+    if tipo != 'pie':
+        chart.set_legend({'position': 'bottom'})
+    return chart
+
+
+def _aba_rentabilidade(workbook, formatos, nome_aba, campo, linhas):
+    """Rentabilidade por modelo ou por grade (`campo`), com gráfico de investido x lucro"""
+    worksheet = workbook.add_worksheet(nome_aba)
+    _cabecalho(worksheet, [
+        campo.capitalize(), 'Total Importações', 'Total Unidades', 'Total Investido (R$)',
+        'Total Vendido (R$)', 'Lucro Total (R$)', 'Margem Média (%)',
+    ], formatos)
+
+    for row, item in enumerate(linhas, 1):
+        worksheet.write(row, 0, item[0], formatos['number'])
+        worksheet.write(row, 1, item.total_importacoes, formatos['number'])
+        worksheet.write(row, 2, item.total_unidades, formatos['number'])
+        worksheet.write(row, 3, float(item.total_investido), formatos['currency'])
+        worksheet.write(row, 4, float(item.total_vendido), formatos['currency'])
+        worksheet.write(row, 5, float(item.lucro_total), formatos['currency'])
+        worksheet.write(row, 6, float(item.margem_media) / 100, formatos['percent'])
+
+    worksheet.set_column('A:A', 15)
+    worksheet.set_column('B:C', 12)
+    worksheet.set_column('D:F', 18)
+    worksheet.set_column('G:G', 15)
+
+    if linhas:
+        chart = _grafico(workbook, 'column', f'Investido x Lucro por {campo}', nome_aba, len(linhas), [
+            (3, 'Total Investido (R$)'), (5, 'Lucro Total (R$)'),
+        ])
+        worksheet.insert_chart('I2', chart, {'x_scale': 1.4, 'y_scale': 1.2})
+
+
+def _aba_status(workbook, formatos, linhas):
+    nome_aba = 'Status das Importações'
+    worksheet = workbook.add_worksheet(nome_aba)
+    _cabecalho(worksheet, ['Status', 'Importações', 'Unidades', 'Valor Total (R$)', 'Valor Médio (R$)'], formatos)
+
+    for row, item in enumerate(linhas, 1):
+        worksheet.write(row, 0, item.status, formatos['number'])
+        worksheet.write(row, 1, item.count, formatos['number'])
+        worksheet.write(row, 2, item.total_unidades, formatos['number'])
+        worksheet.write(row, 3, float(item.total_valor), formatos['currency'])
+        worksheet.write(row, 4, float(item.valor_medio), formatos['currency'])
+
+    worksheet.set_column('A:A', 15)
+    worksheet.set_column('B:C', 12)
+    worksheet.set_column('D:E', 18)
+
+    if linhas:
+        chart = _grafico(workbook, 'pie', 'Valor por status', nome_aba, len(linhas), [(3, 'Valor Total (R$)')])
+        worksheet.insert_chart('G2', chart)
+
+
+def _aba_resumo(workbook, formatos, geral):
+    summary_sheet = workbook.add_worksheet('Resumo')
+    summary_data = [
+        ['Métrica', 'Valor'],
+        ['Total de Importações', geral.total_importacoes],
+        ['Total de Unidades', geral.total_unidades],
+        ['Total Investido (R$)', float(geral.total_investido_brl)],
+        ['Modelos Únicos', geral.modelos_unicos],
+        ['Grades Únicas', geral.grades_unicas]
+    ]
+
+    for row, (metric, value) in enumerate(summary_data):
+        if row == 0:
+            summary_sheet.write(row, 0, metric, formatos['header'])
+            summary_sheet.write(row, 1, value, formatos['header'])
+        else:
+            summary_sheet.write(row, 0, metric, formatos['number'])
+            if 'Investido' in metric:
+                summary_sheet.write(row, 1, value, formatos['currency'])
+            else:
+                summary_sheet.write(row, 1, value, formatos['number'])
+
+    summary_sheet.set_column('A:A', 20)
+    summary_sheet.set_column('B:B', 15)
+
+
+def _aba_detalhes(workbook, formatos, linhas):
+    detail_sheet = workbook.add_worksheet('Detalhes das Importações')
+    _cabecalho(detail_sheet, [
+        'Modelo', 'Capacidade (GB)', 'Grade', 'Quantidade', 'Status',
+        'Valor EUA (USD)', 'Custo Total EUA (R$)', 'Custo Total PY (R$)',
+        'Preço Venda (R$)', 'Lucro (R$)', 'Data Criação'
+    ], formatos)
+
+    number_format, currency_format = formatos['number'], formatos['currency']
+    for row, imp in enumerate(linhas, 1):
+        detail_sheet.write(row, 0, imp.modelo, number_format)
+        detail_sheet.write(row, 1, imp.capacidade_gb, number_format)
+        detail_sheet.write(row, 2, imp.grade, number_format)
+        detail_sheet.write(row, 3, imp.quantidade, number_format)
+        detail_sheet.write(row, 4, imp.status_display, number_format)
+        detail_sheet.write(row, 5, float(imp.valor_eua_unitario), currency_format)
+        detail_sheet.write(row, 6, float(imp.custo_eua_brl), currency_format)
+        detail_sheet.write(row, 7, float(imp.custo_total_py_brl), currency_format)
+        detail_sheet.write(row, 8, float(imp.preco_venda_unitario or 0), currency_format)
+        detail_sheet.write(row, 9, float(imp.lucro_unitario or 0), currency_format)
+        detail_sheet.write(row, 10, imp.created_at.strftime('%d/%m/%Y %H:%M'), number_format)
+
+    detail_sheet.set_column('A:A', 15)
+    detail_sheet.set_column('B:E', 12)
+    detail_sheet.set_column('F:J', 18)
+    detail_sheet.set_column('K:K', 16)
+
+
+def render_xlsx(tipo_relatorio, dados):
+    """Planilha do relatório `tipo_relatorio` (chaves de TIPOS_EXCEL).
+
+    Os gráficos são nativos do Excel (xlsxwriter): referenciam as células da própria aba e
+    não custam renderização no servidor.
+    """
+    buffer = io.BytesIO()
+    workbook = xlsxwriter.Workbook(buffer)
+    formatos = _formatos_xlsx(workbook)
+
+    if tipo_relatorio == 'completo':
+        _aba_resumo(workbook, formatos, dados['geral'])
+    if tipo_relatorio in ('rentabilidade', 'completo'):
+        _aba_rentabilidade(workbook, formatos, 'Rentabilidade por Modelo', 'modelo', dados['rentabilidade'])
+    if tipo_relatorio in ('grade', 'completo'):
+        _aba_rentabilidade(workbook, formatos, 'Rentabilidade por Grade', 'grade', dados['grade'])
+    if tipo_relatorio in ('status', 'completo'):
+        _aba_status(workbook, formatos, dados['status'])
+    if tipo_relatorio == 'completo':
+        _aba_detalhes(workbook, formatos, dados['detalhes'])
+
+    workbook.close()
+    return buffer.getvalue()
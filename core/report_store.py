@@ -0,0 +1,175 @@
+"""Resultados de relatórios persistidos por versão dos dados.
+
+Cada tipo de relatório é calculado uma vez e gravado em RelatorioCache junto com o token da
+versão dos dados (core.versioning). A página de relatórios e as exportações PDF/Excel leem o
+mesmo resultado; quando a versão muda, os tipos pedidos são recalculados na próxima leitura
+por core.report_data.DadosRelatorio.
+
+Os totais por grupo (tipo 'grupos') também são persistidos. Os tipos derivados deles são
+recalculados sem consultar as importações, e as escritas feitas por registrar_alteracoes levam os
+grupos para a nova versão somando apenas a diferença das importações alteradas.
+"""
+from django.db import transaction
+
+from . import metrics
+from .models import ExportacaoCache, RelatorioCache
+from .report_data import (
+    CustoLinha, DadosRelatorio, Detalhe, EstatisticasGerais, Grupo, Modelo, RentabilidadeGrade,
+    RentabilidadeModelo, StatusLinha, Venda, aplicar_delta,
+)
+from .versioning import versao_dados
+
+# Tipo de relatório -> (método de DadosRelatorio, tipo da linha, se o resultado é uma lista de linhas).
+# As linhas são NamedTuples: no JSON viram listas compactas e são reconstruídas na leitura.
+TIPOS = {
+    'geral': ('geral', EstatisticasGerais, False),
+    'rentabilidade': ('rentabilidade_por_modelo', RentabilidadeModelo, True),
+    'grade': ('rentabilidade_por_grade', RentabilidadeGrade, True),
+    'status': ('status', StatusLinha, True),
+    'custos': ('custos', CustoLinha, True),
+    'recentes': ('recentes', Detalhe, True),
+    'detalhes': ('detalhes', Detalhe, True),
+    'vendas': ('vendas', Venda, True),
+    'modelos': ('modelos', Modelo, True),
+    'grupos': ('grupos', Grupo, True),
+}
+
+
+def calcular(dados, tipo):
+    """Resultado de `tipo` a partir de um DadosRelatorio (as queries são compartilhadas entre tipos)"""
+    resultado = getattr(dados, TIPOS[tipo][0])
+    return resultado() if callable(resultado) else resultado
+
+
+def _decodificar(tipo, dados):
+    _metodo, linha, lista = TIPOS[tipo]
+    return [linha(*item) for item in dados] if lista else linha(*dados)
+
+
+def obter_relatorios(user, tipos, versao=None):
+    """Resultados dos `tipos` pedidos para o usuário, recalculando apenas os desatualizados.
+
+    `versao` (core.versioning.VersaoDados) evita recalcular a versão quando a view já a tem.
+    """
+    if not tipos:
+        return {}
+    versao = versao or versao_dados(user)
+    token = versao.token
+    # Os grupos vêm na mesma query: se estiverem atualizados, os totais faltantes saem deles
+    resultados = {
+        cache.tipo: _decodificar(cache.tipo, cache.dados)
+        for cache in RelatorioCache.objects.filter(user=user, tipo__in=[*tipos, 'grupos'], versao=token)
+    }
+    for tipo in tipos:
+        metrics.record_cache('relatorios', tipo in resultados)
+
+    faltando = [tipo for tipo in tipos if tipo not in resultados]
+    if faltando:
+        dados = DadosRelatorio(user, grupos=resultados.get('grupos'))
+        calculados = {tipo: calcular(dados, tipo) for tipo in faltando}
+        if 'grupos' not in resultados and 'grupos' in dados.__dict__:
+            calculados['grupos'] = dados.grupos
+        _salvar(user, token, calculados)
+        resultados.update(calculados)
+
+    return {tipo: resultados[tipo] for tipo in tipos}
+
+
+def _salvar(user, token, resultados):
+    RelatorioCache.objects.bulk_create(
+        [RelatorioCache(user=user, tipo=tipo, versao=token, dados=dados) for tipo, dados in resultados.items()],
+        update_conflicts=True,
+        unique_fields=['user', 'tipo'],
+        update_fields=['versao', 'dados', 'calculado_em'],
+    )
+
+
+def obter_relatorio(user, tipo, versao=None):
+    return obter_relatorios(user, [tipo], versao)[tipo]
+
+
+def atualizados(user, tipos, versao):
+    """True se todos os `tipos` já estão calculados para a versão atual"""
+    existentes = RelatorioCache.objects.filter(user=user, tipo__in=tipos, versao=versao.token).count()
+    return existentes == len(set(tipos))
+
+
+def obter_exportacao(user, nome, versao):
+    """Conteúdo pré-gerado da exportação `nome` (ex.: 'pdf:completo') para a versão, ou None"""
+    conteudo = (
+        ExportacaoCache.objects.filter(user=user, nome=nome, versao=versao.token)
+        .values_list('conteudo', flat=True).first()
+    )
+    metrics.record_cache('exportacoes', conteudo is not None)
+    return bytes(conteudo) if conteudo is not None else None
+
+
+def obter_exportacoes(user, nomes, versao):
+    """{nome: conteúdo} das exportações `nomes` já geradas para a versão, numa única query"""
+    prontas = {
+        nome: bytes(conteudo)
+        for nome, conteudo in ExportacaoCache.objects.filter(
+            user=user, nome__in=nomes, versao=versao.token,
+        ).values_list('nome', 'conteudo')
+    }
+    for nome in nomes:
+        metrics.record_cache('exportacoes', nome in prontas)
+    return prontas
+
+
+def salvar_exportacoes(user, versao, arquivos):
+    """Grava as exportações geradas (`arquivos`: nome -> bytes) para a versão"""
+    ExportacaoCache.objects.bulk_create(
+        [
+            ExportacaoCache(user=user, nome=nome, versao=versao.token, conteudo=conteudo)
+            for nome, conteudo in arquivos.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['user', 'nome'],
+        update_fields=['versao', 'conteudo', 'gerado_em'],
+    )
+
+
+def registrar_alteracoes(user, pks, escrever):
+    """Executa `escrever()`, que cria, altera ou exclui importações do usuário, e leva os grupos
+    persistidos para a nova versão dos dados somando só a diferença dessas importações.
+
+    `pks` são as importações existentes que a escrita altera ou exclui (vazio numa criação);
+    `escrever` retorna a lista de importações gravadas (instâncias ou pks, quando a escrita é
+    um QuerySet.update). Retorna (importações, grupos da nova versão), com grupos None quando
+    não havia grupos atualizados para aproveitar (a próxima leitura reagrega, como antes).
+    """
+    with transaction.atomic():
+        # O lock serializa escritas concorrentes do mesmo usuário sobre os mesmos grupos
+        base = (
+            RelatorioCache.objects.select_for_update()
+            .filter(user=user, tipo='grupos', versao=versao_dados(user).token)
+            .values_list('dados', flat=True).first()
+        )
+        dados = DadosRelatorio(user)
+        antes = dados.grupos_das_importacoes(pks) if base is not None else []
+        importacoes = escrever()
+        if base is None:
+            return importacoes, None
+        depois = dados.grupos_das_importacoes([getattr(importacao, 'pk', importacao) for importacao in importacoes])
+        grupos = aplicar_delta(_decodificar('grupos', base), antes, depois)
+        _salvar(user, versao_dados(user).token, {'grupos': grupos})
+    return importacoes, grupos
+
+
+def registrar_alteracao(user, pk, escrever):
+    """registrar_alteracoes para uma importação: `pk` é None na criação e `escrever` retorna a
+    importação gravada, ou None na exclusão. Retorna (importação, grupos da nova versão).
+    """
+    def escrever_lista():
+        importacao = escrever()
+        return [importacao] if importacao else []
+
+    importacoes, grupos = registrar_alteracoes(user, [pk] if pk else [], escrever_lista)
+    return (importacoes[0] if importacoes else None), grupos
+
+
+def invalidar(user_id):
+    """Descarta os resultados do usuário (chamado a cada escrita em Importacao/ConfiguracaoPadrao)"""
+    RelatorioCache.objects.filter(user_id=user_id).delete()
+    ExportacaoCache.objects.filter(user_id=user_id).delete()
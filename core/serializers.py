@@ -0,0 +1,33 @@
+"""JSON que preserva Decimal e datetime, para resultados de relatórios persistidos"""
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+class RelatorioJSONEncoder(DjangoJSONEncoder):
+    """Marca Decimal e datetime para que voltem com o mesmo tipo na leitura"""
+
+    def default(self, o):
+        if isinstance(o, Decimal):
+            return {'$d': str(o)}
+        if isinstance(o, datetime):
+            return {'$dt': o.isoformat()}
+        return super().default(o)
+
+
+def _decodificar(obj):
+    if len(obj) == 1:
+        if '$d' in obj:
+            return Decimal(obj['$d'])
+        if '$dt' in obj:
+            return datetime.fromisoformat(obj['$dt'])
+    return obj
+
+
+class RelatorioJSONDecoder(json.JSONDecoder):
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('object_hook', _decodificar)
+        super().__init__(*args, **kwargs)
@@ -0,0 +1,29 @@
+"""Invalidação dos relatórios persistidos e aviso aos dashboards abertos a cada escrita nos dados do usuário"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import live, price_history, report_store
+from .models import ConfiguracaoPadrao, Importacao
+
+
+def dados_alterados(user_id):
+    """Descarta os relatórios do usuário e avisa os dashboards abertos após o commit.
+
+    Chamado pelos sinais abaixo; escritas que não disparam sinais (bulk_create,
+    QuerySet.update) chamam diretamente.
+    """
+    report_store.invalidar(user_id)
+    # Só depois do commit: a conexão avisada precisa enxergar a nova versão dos dados
+    transaction.on_commit(lambda: live.publicar(user_id))
+
+
+@receiver([post_save, post_delete], sender=Importacao)
+@receiver([post_save, post_delete], sender=ConfiguracaoPadrao)
+def invalidar_relatorios(sender, instance, **kwargs):
+    dados_alterados(instance.user_id)
+
+
+@receiver(post_save, sender=Importacao)
+def observar_preco(sender, instance, **kwargs):
+    price_history.observar([instance])
@@ -0,0 +1,96 @@
+"""Log de queries lentas: captura via execute wrapper e EXPLAIN sob demanda"""
+import logging
+import os
+import time
+import traceback
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+
+from .models import QueryLenta
+
+logger = logging.getLogger('core.performance')
+
+MAX_FRAMES = 8
+
+
+def _stack_do_projeto():
+    """Últimos frames da pilha que pertencem ao código do projeto (sem Django e bibliotecas)"""
+    base = str(settings.BASE_DIR)
+    frames = []
+    for frame in traceback.extract_stack():
+        filename = frame.filename
+        if not filename.startswith(base) or 'site-packages' in filename or filename == __file__:
+            continue
+        frames.append(f'{os.path.relpath(filename, base)}:{frame.lineno} em {frame.name}')
+    return frames[-MAX_FRAMES:]
+
+
+def _params_serializaveis(params):
+    if params is None:
+        return []
+    if isinstance(params, dict):
+        params = list(params.values())
+    return [p if p is None or isinstance(p, (str, int, float, bool)) else str(p) for p in params]
+
+
+class SlowQueryCollector:
+    """Execute wrapper que guarda as queries acima do limite (em ms)"""
+
+    def __init__(self, limite_ms):
+        self.limite = limite_ms / 1000
+        self.lentas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            if elapsed >= self.limite:
+                self.lentas.append({
+                    'sql': sql,
+                    # executemany: os parâmetros de cada linha não servem para o EXPLAIN
+                    'params': [] if many else _params_serializaveis(params),
+                    'duracao_ms': round(elapsed * 1000, 3),
+                    'stack': '\n'.join(_stack_do_projeto()),
+                })
+
+
+def salvar_queries_lentas(request, lentas):
+    """Grava as queries lentas da requisição e descarta as mais antigas (buffer circular)"""
+    match = request.resolver_match
+    user = getattr(request, 'user', None)
+    registros = [
+        QueryLenta(
+            user=user if user is not None and user.is_authenticated else None,
+            view_name=match.view_name if match else '',
+            path=request.get_full_path()[:500],
+            **lenta,
+        )
+        for lenta in lentas
+    ]
+    try:
+        QueryLenta.objects.bulk_create(registros)
+        limite = getattr(settings, 'SLOW_QUERY_MAX_ENTRIES', 500)
+        antigas = QueryLenta.objects.values_list('pk', flat=True)[limite:]
+        QueryLenta.objects.filter(pk__in=list(antigas)).delete()
+    except DatabaseError:
+        # O log nunca deve derrubar a requisição
+        logger.exception('Falha ao gravar queries lentas')
+
+
+def explain(query_lenta):
+    """Plano de execução da query no banco atual (sem executá-la), se SLOW_QUERY_EXPLAIN_ENABLED"""
+    if not getattr(settings, 'SLOW_QUERY_EXPLAIN_ENABLED', False):
+        raise ValueError('EXPLAIN desabilitado (SLOW_QUERY_EXPLAIN_ENABLED=False).')
+    if not query_lenta.sql.lstrip().upper().startswith('SELECT'):
+        raise ValueError('EXPLAIN disponível apenas para consultas SELECT.')
+    prefixo = connection.ops.explain_query_prefix()
+    with connection.cursor() as cursor:
+        cursor.execute(f'{prefixo} {query_lenta.sql}', query_lenta.params)
+        linhas = cursor.fetchall()
+    return '\n'.join(
+        linha[0] if len(linha) == 1 else ' '.join(str(coluna) for coluna in linha)
+        for linha in linhas
+    )
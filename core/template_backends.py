@@ -0,0 +1,29 @@
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates as BaseDjangoTemplates
+from django.template.backends.django import Template as BaseTemplate
+from django.template.backends.django import reraise
+
+from .instrumentation import current_timing
+
+
+class Template(BaseTemplate):
+    """Template que reporta o tempo de renderização ao RequestTiming ativo"""
+
+    def render(self, context=None, request=None):
+        timing = current_timing()
+        if timing is None:
+            return super().render(context, request)
+        return timing.track_render(super().render, context, request)
+
+
+class DjangoTemplates(BaseDjangoTemplates):
+    """Backend padrão do Django com medição de renderização para o Server-Timing"""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -1,3 +1,1563 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages import get_messages
+from django.contrib.messages.storage import default_storage
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .log import AsyncStreamHandler, JsonFormatter, RequestIdFilter, SamplingFilter
+from .middleware import QUERY_BUDGETS
+from . import async_db, bulk_updates, cambios, live, metrics, precompute, price_history, report_bundle, report_renderers, report_store, views_async
+from .versioning import versao_dados
+from .report_data import DadosRelatorio, Detalhe, EstatisticasGerais
+from .models import (
+    User, Importacao, Lote, Cambio, ConfiguracaoPadrao, ExportacaoCache, HistoricoPreco, PerfilRequisicao, QueryLenta,
+    ReavaliacaoCambio, RelatorioCache,
+)
+from .urls import urlpatterns
+
+
+def criar_importacoes(user, quantidade, inicio=0):
+    """Cria importações com modelos, grades e status variados (um modelo distinto por linha)"""
+    grades = [choice[0] for choice in Importacao.GRADE_CHOICES]
+    status = [choice[0] for choice in Importacao.STATUS_CHOICES]
+    importacoes = []
+    for i in range(inicio, inicio + quantidade):
+        vendido = status[i % len(status)] == 'vendido'
+        importacoes.append(Importacao(
+            user=user,
+            modelo=f'MODELO {i}',
+            capacidade_gb=128,
+            grade=grades[i % len(grades)],
+            quantidade=1 + i % 5,
+            valor_eua_unitario=Decimal('400.00') + i,
+            status=status[i % len(status)],
+            preco_venda_unitario=Decimal('4000.00') if vendido else None,
+        ))
+    Importacao.objects.bulk_create(importacoes)
+
+
+class QueryBudgetTests(TestCase):
+    """Garante que nenhuma view tem número de queries proporcional ao volume de dados"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='senha', role='admin')
+        ConfiguracaoPadrao.objects.create(user=cls.admin)
+        cls.outro = User.objects.create_user(username='outro', password='senha', role='user')
+        cls.perfil = PerfilRequisicao.objects.create(
+            user=cls.admin, method='GET', path='/', status_code=200, duracao_ms=1, db_ms=0,
+        )
+        cls.query_lenta = QueryLenta.objects.create(
+            sql='SELECT "core_importacao"."id" FROM "core_importacao" WHERE "core_importacao"."user_id" = %s',
+            params=[cls.admin.pk], duracao_ms=250,
+        )
+        cls.lote = Lote.objects.create(user=cls.admin, descricao='Remessa')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def requisicoes(self):
+        importacao = Importacao.objects.filter(user=self.admin).first()
+        return [
+            ('login', 'get', {}, None),
+            ('logout', 'post', {}, None),
+            ('dashboard', 'get', {}, None),
+            ('dashboard_widget', 'get', {'widget': 'status'}, None),
+            ('dashboard_eventos', 'get', {}, None),
+            ('importacao_list', 'get', {}, None),
+            ('importacao_create', 'get', {}, None),
+            ('importacao_lote', 'get', {}, None),
+            ('importacao_lote_totais', 'post', {}, None),
+            ('importacao_em_massa', 'post', {}, {'selecionadas': [importacao.pk], 'status': 'recebido'}),
+            ('importacao_detail', 'get', {'pk': importacao.pk}, None),
+            ('importacao_update', 'get', {'pk': importacao.pk}, None),
+            ('importacao_delete', 'get', {'pk': importacao.pk}, None),
+            ('lote_list', 'get', {}, None),
+            ('lote_create', 'get', {}, None),
+            ('lote_update', 'get', {'pk': self.lote.pk}, None),
+            ('calcular_custos_htmx', 'post', {}, {'valor_eua_unitario': '500', 'quantidade': '2'}),
+            ('relatorios', 'get', {}, None),
+            ('relatorio_rentabilidade', 'get', {}, None),
+            ('avaliacao_cambio', 'get', {}, None),
+            ('export_relatorio_pdf', 'get', {'tipo_relatorio': 'completo'}, None),
+            ('export_relatorio_excel', 'get', {'tipo_relatorio': 'completo'}, None),
+            ('export_relatorios_zip', 'get', {}, None),
+            ('admin_panel', 'get', {}, None),
+            ('perfil_list', 'get', {}, None),
+            ('perfil_detail', 'get', {'pk': self.perfil.pk}, None),
+            ('query_lenta_list', 'get', {}, None),
+            ('query_lenta_explain', 'get', {'pk': self.query_lenta.pk}, None),
+            ('user_management', 'get', {}, None),
+            ('user_create', 'get', {}, None),
+            ('user_edit', 'get', {'user_id': self.outro.pk}, None),
+            ('user_delete', 'get', {'user_id': self.outro.pk}, None),
+            ('user_toggle_status', 'get', {'user_id': self.outro.pk}, None),
+            ('configuracoes', 'get', {}, None),
+            ('reavaliar_cambio', 'post', {}, None),
+            ('metricas', 'get', {}, None),
+        ]
+
+    def medir(self):
+        contagens = {}
+        for url_name, method, kwargs, data in self.requisicoes():
+            self.client.force_login(self.admin)
+            url = reverse(f'core:{url_name}', kwargs=kwargs)
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(self.client, method)(url, data or {})
+            self.assertLess(response.status_code, 500, url_name)
+            contagens[url_name] = len(queries.captured_queries)
+        return contagens
+
+    def test_todas_as_urls_tem_orcamento(self):
+        criar_importacoes(self.admin, 1)
+        nomes = {pattern.name for pattern in urlpatterns}
+        self.assertEqual(nomes - set(QUERY_BUDGETS), set())
+        self.assertEqual({url_name for url_name, *_ in self.requisicoes()}, nomes)
+
+    def test_queries_dentro_do_orcamento_e_independentes_do_volume(self):
+        criar_importacoes(self.admin, 3)
+        pequeno = self.medir()
+
+        criar_importacoes(self.admin, 40, inicio=3)
+        grande = self.medir()
+
+        for url_name, limite in QUERY_BUDGETS.items():
+            with self.subTest(url_name=url_name):
+                self.assertLessEqual(grande[url_name], limite)
+                self.assertEqual(pequeno[url_name], grande[url_name])
+
+
+class QueryBudgetMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='usuario', password='senha')
+
+    @override_settings(DEBUG=True, QUERY_BUDGET_WARNINGS=True)
+    def test_avisa_quando_view_excede_orcamento(self):
+        self.client.force_login(self.user)
+        with mock.patch.dict(QUERY_BUDGETS, {'dashboard': 0}):
+            with self.assertLogs('core.performance', level='WARNING') as logs:
+                self.client.get(reverse('core:dashboard'))
+        self.assertIn('core:dashboard', logs.output[0])
+
+
+class ServerTimingMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='usuario', password='senha')
+
+    @override_settings(SERVER_TIMING_ENABLED=True)
+    def test_header_separa_banco_view_e_renderizacao(self):
+        self.client.force_login(self.user)
+        with self.assertLogs('core.performance', level='INFO') as logs:
+            response = self.client.get(reverse('core:dashboard'))
+        header = response['Server-Timing']
+        for metrica in ('db;dur=', 'view;dur=', 'render;dur=', 'total;dur='):
+            self.assertIn(metrica, header)
+        self.assertIn('view=core:dashboard', logs.output[0])
+
+    def test_desligado_por_padrao(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('core:dashboard'))
+        self.assertNotIn('Server-Timing', response)
+
+
+class MetricsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='senha', role='admin')
+        cls.user = User.objects.create_user(username='usuario', password='senha')
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        override = override_settings(METRICS_DIR=diretorio.name, METRICS_TOKEN='segredo')
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_acesso_restrito_a_admins_ou_token(self):
+        url = reverse('core:metricas')
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.logout()
+
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertEqual(response.status_code, 200)
+
+    def test_exporta_latencia_e_queries_por_view(self):
+        self.client.force_login(self.admin)
+        self.client.get(reverse('core:dashboard'))
+        conteudo = self.client.get(reverse('core:metricas')).content.decode()
+
+        self.assertIn('# TYPE iphone_http_request_duration_seconds histogram', conteudo)
+        self.assertIn('iphone_http_request_duration_seconds_count{method="GET",view="core:dashboard"}', conteudo)
+        self.assertIn('iphone_db_queries_total{view="core:dashboard"}', conteudo)
+        self.assertIn('iphone_worker_memory_bytes{pid=', conteudo)
+
+    def test_snapshot_de_worker_encerrado_e_consolidado_sem_voltar_contadores(self):
+        encerrado = subprocess.Popen([sys.executable, '-c', 'pass'])
+        encerrado.wait()
+        diretorio = metrics.metrics_dir()
+        os.makedirs(diretorio, exist_ok=True)
+        chave = metrics._key({'view': 'core:dashboard'})
+        for sufixo in ('a', 'b'):
+            # Dois workers encerrados com o mesmo PID não se sobrescrevem
+            with open(os.path.join(diretorio, f'metrics_{encerrado.pid}_{sufixo}.json'), 'w') as fh:
+                json.dump({'pid': encerrado.pid, 'counters': {'iphone_db_queries_total': {chave: 7}}, 'histograms': {}}, fh)
+
+        def total():
+            linha = next(
+                linha for linha in metrics.render_prometheus().splitlines()
+                if linha.startswith('iphone_db_queries_total{view="core:dashboard"}')
+            )
+            return int(linha.split()[-1])
+
+        antes = total()
+        self.assertGreaterEqual(antes, 14)
+        self.assertEqual(
+            sorted(nome for nome in os.listdir(diretorio) if nome.startswith(f'metrics_{encerrado.pid}_')), [],
+        )
+        self.assertIn(metrics.ENCERRADOS, os.listdir(diretorio))
+        self.assertEqual(total(), antes)
+
+
+@override_settings(PROFILER_ENABLED=True)
+class ProfilerMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='senha', role='admin')
+        cls.user = User.objects.create_user(username='usuario', password='senha')
+
+    def test_admin_grava_perfil_com_funcoes_e_queries(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('core:dashboard'), {'_profile': '1'})
+
+        perfil = PerfilRequisicao.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual(perfil.view_name, 'core:dashboard')
+        self.assertGreater(perfil.total_queries, 0)
+        self.assertTrue(perfil.funcoes)
+        self.assertTrue(perfil.queries)
+        self.assertEqual(self.client.get(response['X-Profile-Url']).status_code, 200)
+
+    def test_usuario_comum_nao_e_perfilado(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('core:dashboard'), {'_profile': '1'})
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(PerfilRequisicao.objects.exists())
+
+    @override_settings(PROFILER_MAX_PROFILES=2)
+    def test_mantem_apenas_perfis_recentes(self):
+        self.client.force_login(self.admin)
+        for _ in range(3):
+            self.client.get(reverse('core:dashboard'), HTTP_X_PROFILE='1')
+        self.assertEqual(PerfilRequisicao.objects.count(), 2)
+
+
+@override_settings(SLOW_QUERY_LOG_ENABLED=True, SLOW_QUERY_EXPLAIN_ENABLED=True, SLOW_QUERY_THRESHOLD_MS=0)
+class SlowQueryLogTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='senha', role='admin')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_registra_view_usuario_e_stack(self):
+        self.client.get(reverse('core:dashboard_widget', kwargs={'widget': 'status'}))
+
+        query = QueryLenta.objects.filter(view_name='core:dashboard_widget', sql__contains='core_importacao').first()
+        self.assertIsNotNone(query)
+        self.assertEqual(query.user, self.admin)
+        self.assertIn('core/views.py', query.stack)
+
+    @override_settings(SLOW_QUERY_MAX_ENTRIES=3)
+    def test_buffer_circular_mantem_apenas_as_mais_recentes(self):
+        self.client.get(reverse('core:dashboard'))
+        self.client.get(reverse('core:importacao_list'))
+        self.assertEqual(QueryLenta.objects.count(), 3)
+        self.assertEqual(QueryLenta.objects.first().view_name, 'core:importacao_list')
+
+    def test_explain_sob_demanda(self):
+        self.client.get(reverse('core:importacao_list'))
+        query = QueryLenta.objects.filter(sql__startswith='SELECT', sql__contains='core_importacao').first()
+
+        response = self.client.get(reverse('core:query_lenta_explain', kwargs={'pk': query.pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'core_importacao')
+        self.assertNotContains(response, 'bg-red-50')
+
+    @override_settings(SLOW_QUERY_EXPLAIN_ENABLED=False)
+    def test_explain_exige_opt_in(self):
+        query = QueryLenta.objects.create(sql='SELECT 1', params=[], duracao_ms=500)
+        sqls = []
+
+        def registrar(execute, sql, params, many, context):
+            sqls.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(registrar):
+            response = self.client.get(reverse('core:query_lenta_explain', kwargs={'pk': query.pk}))
+        self.assertContains(response, 'EXPLAIN desabilitado')
+        self.assertFalse([sql for sql in sqls if 'EXPLAIN' in sql])
+
+    def test_explain_recusa_comandos_que_nao_sao_select(self):
+        query = QueryLenta.objects.create(sql='DELETE FROM core_importacao', duracao_ms=500)
+        response = self.client.get(reverse('core:query_lenta_explain', kwargs={'pk': query.pk}))
+        self.assertContains(response, 'apenas para consultas SELECT')
+        self.assertEqual(Importacao.objects.count(), 0)
+
+
+class StructuredLoggingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='usuario', password='senha')
+
+    def test_request_id_reaproveitado_ou_gerado(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('core:dashboard'), HTTP_X_REQUEST_ID='abc-123')
+        self.assertEqual(response['X-Request-ID'], 'abc-123')
+
+        response = self.client.get(reverse('core:dashboard'), HTTP_X_REQUEST_ID='inválido; rm -rf')
+        self.assertRegex(response['X-Request-ID'], r'^[0-9a-f]{32}$')
+
+    def test_request_id_sem_trocar_de_thread_sob_asgi(self):
+        from django.http import HttpResponse
+        from .log import current_request_id
+        from .middleware import RequestIdMiddleware
+
+        async def view(request):
+            return HttpResponse(current_request_id())
+
+        middleware = RequestIdMiddleware(view)
+        request = AsyncRequestFactory().get('/', headers={'X-Request-ID': 'abc-123'})
+        response = async_to_sync(middleware)(request)
+        self.assertEqual(response['X-Request-ID'], 'abc-123')
+        self.assertEqual(response.content, b'abc-123')
+
+    def test_handler_assincrono_grava_json_com_request_id_e_extras(self):
+        stream = io.StringIO()
+        handler = AsyncStreamHandler(stream)
+        handler.setFormatter(JsonFormatter())
+        handler.addFilter(RequestIdFilter())
+        logger = logging.getLogger('core.views')
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        self.addCleanup(logger.setLevel, logger.level)
+        logger.setLevel(logging.DEBUG)
+
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('core:calcular_custos_htmx'), {'valor_eua_unitario': '500', 'quantidade': '2'})
+        handler.close()
+
+        registro = json.loads(stream.getvalue().splitlines()[0])
+        self.assertEqual(registro['level'], 'DEBUG')
+        self.assertEqual(registro['request_id'], response['X-Request-ID'])
+        self.assertEqual(registro['calculo']['quantidade'], 2)
+
+    def test_calculo_htmx_nao_escreve_no_stdout(self):
+        self.client.force_login(self.user)
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            self.client.post(reverse('core:calcular_custos_htmx'), {'valor_eua_unitario': '500'})
+        self.assertEqual(stdout.getvalue(), '')
+
+    def test_amostragem_por_logger_preserva_warnings(self):
+        filtro = SamplingFilter({'core': 1.0, 'core.views': 0.0})
+
+        def registro(nome, nivel):
+            return logging.makeLogRecord({'name': nome, 'levelno': nivel})
+
+        self.assertFalse(filtro.filter(registro('core.views', logging.DEBUG)))
+        self.assertTrue(filtro.filter(registro('core.views', logging.WARNING)))
+        self.assertTrue(filtro.filter(registro('core.middleware', logging.INFO)))
+        self.assertTrue(filtro.filter(registro('django.request', logging.INFO)))
+
+
+class ConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='usuario', password='senha')
+        ConfiguracaoPadrao.objects.create(user=cls.user)
+        criar_importacoes(cls.user, 3)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def revalidar(self, url_name, **kwargs):
+        url = reverse(f'core:{url_name}', kwargs=kwargs)
+        primeira = self.client.get(url)
+        self.assertEqual(primeira.status_code, 200)
+        self.assertIn('no-cache', primeira['Cache-Control'])
+        return url, self.client.get(url, HTTP_IF_NONE_MATCH=primeira['ETag'])
+
+    def test_304_quando_nada_mudou(self):
+        for url_name, kwargs in [
+            ('dashboard', {}),
+            ('dashboard_widget', {'widget': 'totais'}),
+            ('importacao_list', {}),
+            ('relatorios', {}),
+            ('relatorio_rentabilidade', {}),
+            ('export_relatorio_pdf', {'tipo_relatorio': 'completo'}),
+            ('export_relatorio_excel', {'tipo_relatorio': 'completo'}),
+            ('export_relatorios_zip', {}),
+        ]:
+            with self.subTest(url_name=url_name):
+                _url, response = self.revalidar(url_name, **kwargs)
+                self.assertEqual(response.status_code, 304)
+
+    def test_200_apos_editar_excluir_ou_mudar_configuracao(self):
+        url, _response = self.revalidar('dashboard')
+        etag = self.client.get(url)['ETag']
+
+        importacao = Importacao.objects.filter(user=self.user).first()
+        importacao.quantidade += 1
+        importacao.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response['ETag']
+        Importacao.objects.filter(user=self.user).last().delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response['ETag']
+        configuracao = ConfiguracaoPadrao.objects.get(user=self.user)
+        configuracao.cambio_usdt_padrao += 1
+        configuracao.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_diferente_por_usuario(self):
+        etag = self.client.get(reverse('core:dashboard'))['ETag']
+        outro = User.objects.create_user(username='outro', password='senha')
+        self.client.force_login(outro)
+        response = self.client.get(reverse('core:dashboard'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_mensagens_pendentes_forcam_renderizacao(self):
+        etag = self.client.get(reverse('core:dashboard'))['ETag']
+        # Usuário comum é redirecionado ao dashboard com "Acesso negado."
+        response = self.client.get(reverse('core:admin_panel'), follow=True, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Acesso negado.')
+
+
+class DashboardWidgetsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='usuario', password='senha')
+        criar_importacoes(cls.user, 5)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_pagina_sai_sem_calcular_os_agregados(self):
+        with mock.patch.object(report_store, 'obter_relatorios') as obter_relatorios:
+            response = self.client.get(reverse('core:dashboard'))
+        obter_relatorios.assert_not_called()
+        for widget in report_renderers.TIPOS_WIDGETS:
+            self.assertContains(response, f'hx-get="{reverse("core:dashboard_widget", kwargs={"widget": widget})}"')
+
+    def test_cada_widget_le_apenas_os_proprios_tipos(self):
+        for widget, tipos in report_renderers.TIPOS_WIDGETS.items():
+            with self.subTest(widget=widget), mock.patch.object(
+                report_store, 'obter_relatorios', wraps=report_store.obter_relatorios,
+            ) as obter_relatorios:
+                response = self.client.get(reverse('core:dashboard_widget', kwargs={'widget': widget}))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(obter_relatorios.call_args.args[1], tipos)
+                self.assertNotContains(response, '<html')
+
+        recentes = self.client.get(reverse('core:dashboard_widget', kwargs={'widget': 'recentes'}))
+        self.assertEqual(len(recentes.context['importacoes_recentes']), 5)
+
+    def test_widget_inexistente(self):
+        response = self.client.get(reverse('core:dashboard_widget', kwargs={'widget': 'nada'}))
+        self.assertEqual(response.status_code, 404)
+
+
+class ImportacaoListTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='usuario', password='senha')
+        criar_importacoes(cls.user, 45)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_htmx_recebe_apenas_a_tabela(self):
+        url = reverse('core:importacao_list')
+        with mock.patch.object(report_store, 'obter_relatorios') as obter_relatorios:
+            response = self.client.get(url, {'modelo': 'MODELO', 'page': 2}, HTTP_HX_REQUEST='true')
+        obter_relatorios.assert_not_called()
+        self.assertTemplateUsed(response, 'partials/importacoes_tabela.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        self.assertIn('HX-Request', response['Vary'])
+        self.assertContains(response, 'hx-get="?modelo=MODELO&amp;page=1"')
+
+        restauracao = self.client.get(url, HTTP_HX_REQUEST='true', HTTP_HX_HISTORY_RESTORE_REQUEST='true')
+        self.assertTemplateUsed(restauracao, 'base.html')
+        # Mesma URL, representações diferentes: o ETag do fragmento não revalida a página inteira
+        self.assertNotEqual(response['ETag'], restauracao['ETag'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=restauracao['ETag']).status_code, 304)
+
+    def test_sugestoes_de_modelo_persistidas_por_versao(self):
+        url = reverse('core:importacao_list')
+        response = self.client.get(url)
+        modelos = sorted(set(Importacao.objects.filter(user=self.user).values_list('modelo', flat=True)))
+        self.assertEqual(response.context['modelos_disponiveis'], modelos)
+        self.assertContains(response, '<datalist id="modelos-disponiveis">')
+
+        with mock.patch.object(report_store, 'DadosRelatorio') as dados_relatorio:
+            self.client.get(url)
+        dados_relatorio.assert_not_called()
+
+
+class EdicaoNaListaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='usuario', password='senha')
+        criar_importacoes(cls.user, 12)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        # Grupos persistidos para a versão atual, como deixa qualquer leitura de relatório
+        report_store.obter_relatorios(self.user, ['geral'])
+
+    def dados_formulario(self, **campos):
+        return {
+            'modelo': '15 PRO', 'capacidade_gb': 256, 'grade': 'A', 'quantidade': 3,
+            'valor_eua_unitario': '899.99', 'taxa_adm_percentual': '0.005', 'taxa_adm_fixa': '1.90',
+            'frete_eua': '1.93', 'pol_eua': '10.00', 'cambio_usdt': '5.4321', 'frete_py_usd_kg': '7.50',
+            'kg_py_usd': '0.35', 'status': 'vendido', 'preco_venda_unitario': '7100.00', **campos,
+        }
+
+    def grupos_persistidos(self):
+        cache = RelatorioCache.objects.get(user=self.user, tipo='grupos')
+        self.assertEqual(cache.versao, versao_dados(self.user).token)
+        return sorted(report_store._decodificar('grupos', cache.dados))
+
+    def assertGruposIguaisAoAgregado(self):
+        self.assertEqual(self.grupos_persistidos(), sorted(DadosRelatorio(self.user).grupos))
+
+    def test_editar_na_lista_devolve_a_linha_e_os_totais_sem_reagregar(self):
+        importacao = Importacao.objects.filter(user=self.user, status='vendido').first()
+        url = reverse('core:importacao_update', kwargs={'pk': importacao.pk})
+        formulario = self.client.get(url, HTTP_HX_REQUEST='true')
+        self.assertTemplateUsed(formulario, 'partials/importacao_linha_form.html')
+        # A lista não tem o painel #custos-calculados: os campos não disparam o recálculo por campo
+        self.assertNotContains(formulario, 'custos-calculados')
+        self.assertContains(self.client.get(url), 'hx-target="#custos-calculados"')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                url, self.dados_formulario(modelo=importacao.modelo, status='recebido'), HTTP_HX_REQUEST='true',
+            )
+        agregacoes = [query['sql'] for query in queries.captured_queries if 'GROUP BY' in query['sql']]
+        # Só as contribuições da linha (antes e depois), nunca a carteira inteira
+        self.assertEqual(len(agregacoes), 2)
+        self.assertTrue(all('"core_importacao"."id" IN' in sql for sql in agregacoes))
+        self.assertContains(response, f'id="importacao-{importacao.pk}"')
+        self.assertContains(response, 'id="totais-importacoes"')
+        self.assertContains(response, 'hx-swap-oob="true"')
+        self.assertGruposIguaisAoAgregado()
+        self.assertEqual(
+            response.context['total_investido_brl'],
+            report_store.obter_relatorio(self.user, 'geral').total_investido_brl,
+        )
+
+    def test_criar_e_excluir_na_lista(self):
+        response = self.client.post(reverse('core:importacao_create'), self.dados_formulario(), HTTP_HX_REQUEST='true')
+        nova = Importacao.objects.get(user=self.user, modelo='15 PRO')
+        self.assertContains(response, f'id="importacao-{nova.pk}"')
+        self.assertEqual(response.context['total_importacoes'], 13)
+        self.assertGruposIguaisAoAgregado()
+
+        response = self.client.post(reverse('core:importacao_delete', kwargs={'pk': nova.pk}), HTTP_HX_REQUEST='true')
+        self.assertNotContains(response, '<tr')
+        self.assertEqual(response.context['total_importacoes'], 12)
+        self.assertGruposIguaisAoAgregado()
+
+    def test_formulario_invalido_volta_com_erros_e_sem_htmx_redireciona(self):
+        importacao = Importacao.objects.filter(user=self.user).first()
+        url = reverse('core:importacao_update', kwargs={'pk': importacao.pk})
+        response = self.client.post(url, self.dados_formulario(quantidade=0), HTTP_HX_REQUEST='true')
+        self.assertTemplateUsed(response, 'partials/importacao_linha_form.html')
+        self.assertTrue(response.context['form'].errors)
+
+        response = self.client.post(url, self.dados_formulario())
+        self.assertRedirects(response, reverse('core:importacao_detail', kwargs={'pk': importacao.pk}))
+        self.assertGruposIguaisAoAgregado()
+
+    def test_sem_grupos_atualizados_recalcula_como_antes(self):
+        RelatorioCache.objects.filter(user=self.user).delete()
+        importacao = Importacao.objects.filter(user=self.user).first()
+        response = self.client.post(
+            reverse('core:importacao_delete', kwargs={'pk': importacao.pk}), HTTP_HX_REQUEST='true',
+        )
+        self.assertEqual(response.context['total_importacoes'], 11)
+        self.assertGruposIguaisAoAgregado()
+
+
+class CompraEmLoteTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='usuario', password='senha')
+        ConfiguracaoPadrao.objects.create(user=cls.user, cambio_usdt_padrao=Decimal('5.4321'))
+        criar_importacoes(cls.user, 4)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        report_store.obter_relatorios(self.user, ['geral'])
+
+    def dados_lote(self, linhas, total_forms=5, **cabecalho):
+        dados = {
+            'taxa_adm_percentual': '0.005', 'taxa_adm_fixa': '1.90', 'frete_eua': '1.93', 'pol_eua': '10.00',
+            'cambio_usdt': '5.4321', 'frete_py_usd_kg': '7.50', 'kg_py_usd': '0.35', 'status': 'em_transito',
+            'linhas-TOTAL_FORMS': str(total_forms), 'linhas-INITIAL_FORMS': '0',
+            'linhas-MIN_NUM_FORMS': '1', 'linhas-MAX_NUM_FORMS': '200', **cabecalho,
+        }
+        for indice, linha in enumerate(linhas):
+            dados.update({f'linhas-{indice}-{campo}': valor for campo, valor in linha.items()})
+        return dados
+
+    def linha(self, modelo, quantidade=2, valor='700.00'):
+        return {'modelo': modelo, 'capacidade_gb': 256, 'grade': 'A', 'quantidade': quantidade, 'valor_eua_unitario': valor}
+
+    def test_pagina_traz_linhas_vazias_e_cabecalho_com_os_padroes(self):
+        response = self.client.get(reverse('core:importacao_lote'))
+        self.assertEqual(len(response.context['linhas'].forms), 5)
+        self.assertEqual(response.context['cabecalho']['cambio_usdt'].value(), '5.43')
+        self.assertContains(response, 'linhas-__prefix__-modelo')
+
+    def test_lote_gravado_com_um_unico_insert_e_grupos_pelo_delta(self):
+        linhas = [self.linha(f'LOTE {i}', quantidade=i + 1) for i in range(3)]
+        sqls = []
+
+        def registrar(execute, sql, params, many, context):
+            sqls.append(sql)
+            return execute(sql, params, many, context)
+
+        # execute_wrapper em vez de CaptureQueriesContext: o request_started do client zera connection.queries
+        with connection.execute_wrapper(registrar):
+            response = self.client.post(reverse('core:importacao_lote'), self.dados_lote(linhas))
+        self.assertRedirects(response, reverse('core:importacao_list'))
+        self.assertEqual(len([sql for sql in sqls if sql.startswith('INSERT INTO "core_importacao"')]), 1)
+        criadas = Importacao.objects.filter(user=self.user, modelo__startswith='LOTE').order_by('modelo')
+        self.assertEqual([importacao.quantidade for importacao in criadas], [1, 2, 3])
+        self.assertTrue(all(
+            importacao.cambio_usdt == Decimal('5.4321') and importacao.status == 'em_transito' for importacao in criadas
+        ))
+
+        cache = RelatorioCache.objects.get(user=self.user, tipo='grupos')
+        self.assertEqual(cache.versao, versao_dados(self.user).token)
+        self.assertEqual(sorted(report_store._decodificar('grupos', cache.dados)), sorted(DadosRelatorio(self.user).grupos))
+
+    def test_linha_invalida_nao_grava_nenhuma(self):
+        linhas = [self.linha('LOTE 0'), self.linha('LOTE 1', quantidade=0)]
+        response = self.client.post(reverse('core:importacao_lote'), self.dados_lote(linhas))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['linhas'].forms[1].errors)
+        self.assertFalse(Importacao.objects.filter(modelo__startswith='LOTE').exists())
+        # Os totais da tela continuam mostrando as linhas válidas
+        self.assertEqual(response.context['total_linhas'], 1)
+
+        response = self.client.post(reverse('core:importacao_lote'), self.dados_lote([]))
+        self.assertTrue(response.context['linhas'].non_form_errors())
+
+    def test_totais_do_lote_inteiro(self):
+        linhas = [self.linha('LOTE 0', quantidade=2), self.linha('LOTE 1', quantidade=3)]
+        response = self.client.post(reverse('core:importacao_lote_totais'), self.dados_lote(linhas))
+        self.assertTemplateUsed(response, 'partials/lote_totais.html')
+        esperado = Importacao(
+            quantidade=5, valor_eua_unitario=Decimal('700.00'), taxa_adm_percentual=Decimal('0.005'),
+            taxa_adm_fixa=Decimal('1.90'), frete_eua=Decimal('1.93'), pol_eua=Decimal('10.00'),
+            cambio_usdt=Decimal('5.4321'), frete_py_usd_kg=Decimal('7.50'), kg_py_usd=Decimal('0.35'),
+        )
+        self.assertEqual(response.context['total_unidades'], 5)
+        self.assertEqual(response.context['total_brl'], esperado.custo_total_quantidade_brl)
+
+    def test_lote_avisa_dashboards_uma_vez(self):
+        with mock.patch.object(live, 'publicar') as publicar:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('core:importacao_lote'), self.dados_lote([self.linha('LOTE 0'), self.linha('LOTE 1')]))
+        publicar.assert_called_once_with(self.user.pk)
+
+
+class AcaoEmMassaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='usuario', password='senha')
+        cls.outro = User.objects.create_user(username='outro', password='senha')
+        criar_importacoes(cls.user, 20)
+        criar_importacoes(cls.outro, 4)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        report_store.obter_relatorios(self.user, ['geral'])
+
+    def postar(self, **dados):
+        sqls = []
+
+        def registrar(execute, sql, params, many, context):
+            sqls.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(registrar):
+            response = self.client.post(reverse('core:importacao_em_massa'), dados)
+        self.updates = [sql for sql in sqls if sql.startswith('UPDATE "core_importacao"')]
+        return response
+
+    def assertGruposIguaisAoAgregado(self):
+        cache = RelatorioCache.objects.get(user=self.user, tipo='grupos')
+        self.assertEqual(cache.versao, versao_dados(self.user).token)
+        self.assertEqual(sorted(report_store._decodificar('grupos', cache.dados)), sorted(DadosRelatorio(self.user).grupos))
+
+    def test_venda_das_selecionadas_em_um_unico_update(self):
+        pks = list(Importacao.objects.filter(user=self.user, status='recebido').values_list('pk', flat=True))
+        estranha = Importacao.objects.filter(user=self.outro, status='recebido').first()
+        versao = versao_dados(self.user).token
+
+        response = self.postar(
+            selecionadas=[*pks, estranha.pk], status='vendido',
+            preco_venda_unitario='6500.00', data_venda='2026-09-30',
+        )
+        self.assertRedirects(response, reverse('core:importacao_list'), fetch_redirect_response=False)
+        self.assertEqual(len(self.updates), 1)
+        vendidas = Importacao.objects.filter(pk__in=pks)
+        self.assertTrue(all(
+            importacao.status == 'vendido' and importacao.preco_venda_unitario == Decimal('6500.00')
+            and str(importacao.data_venda) == '2026-09-30'
+            for importacao in vendidas
+        ))
+        # Importações de outro usuário ficam de fora; updated_at gravado muda a versão dos dados
+        estranha.refresh_from_db()
+        self.assertEqual(estranha.status, 'recebido')
+        self.assertNotEqual(versao_dados(self.user).token, versao)
+        self.assertGruposIguaisAoAgregado()
+
+    def test_todas_do_filtro_mantem_os_filtros_no_retorno(self):
+        em_transito = Importacao.objects.filter(user=self.user, status='em_transito').count()
+        response = self.postar(todas_do_filtro='on', filtro_status='em_transito', status='recebido')
+        self.assertRedirects(response, reverse('core:importacao_list') + '?status=em_transito', fetch_redirect_response=False)
+        self.assertEqual(len(self.updates), 1)
+        self.assertFalse(Importacao.objects.filter(user=self.user, status='em_transito').exists())
+        self.assertTrue(Importacao.objects.filter(user=self.outro, status='em_transito').exists())
+        mensagens = [str(mensagem) for mensagem in get_messages(response.wsgi_request)]
+        self.assertEqual(mensagens, [f'{em_transito} importações atualizadas com sucesso!'])
+        self.assertGruposIguaisAoAgregado()
+
+    def test_venda_sem_preco_ou_sem_selecao_nao_altera_nada(self):
+        pk = Importacao.objects.filter(user=self.user, status='recebido').first().pk
+        for dados in ({'selecionadas': [pk], 'status': 'vendido'}, {'status': 'recebido'}):
+            with self.subTest(dados=dados):
+                response = self.postar(**dados)
+                self.assertEqual(self.updates, [])
+                self.assertTrue(any(mensagem.level_tag == 'error' for mensagem in get_messages(response.wsgi_request)))
+
+    def test_acao_do_admin_por_usuario(self):
+        admin_user = User.objects.create_superuser(username='admin', password='senha', email='admin@exemplo.com')
+        self.client.force_login(admin_user)
+        pks = list(Importacao.objects.filter(status='planejado').values_list('pk', flat=True))
+        self.client.post(reverse('admin:core_importacao_changelist'), {
+            'action': 'marcar_em_transito', '_selected_action': pks,
+        })
+        self.assertEqual(Importacao.objects.filter(pk__in=pks, status='em_transito').count(), len(pks))
+        self.assertEqual({importacao.user_id for importacao in Importacao.objects.filter(pk__in=pks)}, {self.user.pk, self.outro.pk})
+        self.assertGruposIguaisAoAgregado()
+
+
+class LoteTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='usuario', password='senha')
+        criar_importacoes(cls.user, 12)
+        # Três linhas ainda não recebidas: 2 x 0,200 kg, 1 x 0,600 kg e 3 x 0,200 kg
+        cls.linhas = list(Importacao.objects.filter(user=cls.user, status='planejado').order_by('pk'))
+        for importacao, quantidade, peso in zip(cls.linhas, (2, 1, 3), ('0.200', '0.600', '0.200')):
+            importacao.quantidade, importacao.peso_kg = quantidade, Decimal(peso)
+            importacao.save()
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        report_store.obter_relatorios(self.user, ['geral'])
+
+    def postar(self, url, **dados):
+        sqls = []
+
+        def registrar(execute, sql, params, many, context):
+            sqls.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(registrar):
+            response = self.client.post(url, dados)
+        self.updates = [sql for sql in sqls if sql.startswith('UPDATE "core_importacao"')]
+        return response
+
+    def assertGruposIguaisAoAgregado(self):
+        cache = RelatorioCache.objects.get(user=self.user, tipo='grupos')
+        self.assertEqual(cache.versao, versao_dados(self.user).token)
+        self.assertEqual(sorted(report_store._decodificar('grupos', cache.dados)), sorted(DadosRelatorio(self.user).grupos))
+
+    def test_rateio_por_peso_em_um_unico_update(self):
+        response = self.postar(
+            reverse('core:lote_create'),
+            descricao='Remessa 1', frete_total_usd='160.00', taxas_total_usd='32.00', criterio_rateio='peso',
+            importacoes=[importacao.pk for importacao in self.linhas],
+        )
+        self.assertRedirects(response, reverse('core:lote_list'), fetch_redirect_response=False)
+        # Um UPDATE leva as linhas para o lote e outro rateia todas elas
+        self.assertEqual(len(self.updates), 2)
+        lote = Lote.objects.get(user=self.user)
+        linhas = Importacao.objects.filter(lote=lote).order_by('pk')
+        # Peso total 1,6 kg: USD 100 por kg de frete e USD 20 por kg de taxas
+        self.assertEqual([linha.frete_py_usd_kg for linha in linhas], [Decimal('20.00'), Decimal('60.00'), Decimal('20.00')])
+        self.assertEqual([linha.taxa_adm_fixa for linha in linhas], [Decimal('4.00'), Decimal('12.00'), Decimal('4.00')])
+        self.assertTrue(all(linha.kg_py_usd == 0 for linha in linhas))
+        self.assertGruposIguaisAoAgregado()
+
+    def test_rateio_por_valor_e_relatorio_do_lote(self):
+        lote = Lote.objects.create(
+            user=self.user, descricao='Remessa 2', frete_total_usd=Decimal('99.99'), taxas_total_usd=Decimal('33.33'),
+            criterio_rateio='valor',
+        )
+        bulk_updates.definir_importacoes_do_lote(lote, [importacao.pk for importacao in self.linhas])
+        linhas = list(Importacao.objects.filter(lote=lote))
+        soma = sum(linha.valor_eua_unitario * linha.quantidade for linha in linhas)
+        for linha in linhas:
+            esperado = (Decimal('99.99') * linha.valor_eua_unitario / soma).quantize(Decimal('0.01'))
+            # Só a linha que recebe o resto do arredondamento se afasta da parcela proporcional
+            self.assertAlmostEqual(linha.frete_py_usd_kg, esperado, delta=Decimal('0.05'))
+        # O rateado fecha exatamente com a fatura e as taxas do lote
+        self.assertEqual(sum(linha.frete_py_usd_kg * linha.quantidade for linha in linhas), Decimal('99.99'))
+        self.assertEqual(sum(linha.taxa_adm_fixa * linha.quantidade for linha in linhas), Decimal('33.33'))
+
+        with self.assertNumQueries(1):
+            resumo, = DadosRelatorio(self.user).lotes()
+        self.assertEqual((resumo.descricao, resumo.importacoes, resumo.unidades), ('Remessa 2', 3, 6))
+        self.assertEqual(resumo.peso_kg, Decimal('1.600'))
+        self.assertEqual(resumo.frete_rateado_usd, Decimal('99.99'))
+        investido = sum(linha.custo_total_quantidade_brl for linha in linhas)
+        self.assertEqual(resumo.investido_brl, investido.quantize(Decimal('0.01')))
+        self.assertGruposIguaisAoAgregado()
+
+    def test_mover_importacao_rateia_de_novo_o_lote_de_origem(self):
+        origem = Lote.objects.create(user=self.user, descricao='Origem', frete_total_usd=Decimal('160.00'))
+        destino = Lote.objects.create(user=self.user, descricao='Destino', frete_total_usd=Decimal('10.00'))
+        bulk_updates.definir_importacoes_do_lote(origem, [importacao.pk for importacao in self.linhas])
+
+        movida = self.linhas[1]
+        response = self.postar(
+            reverse('core:lote_update', kwargs={'pk': destino.pk}),
+            descricao='Destino', frete_total_usd='10.00', taxas_total_usd='0', criterio_rateio='peso',
+            importacoes=[movida.pk],
+        )
+        self.assertEqual(response.status_code, 302)
+        movida.refresh_from_db()
+        self.assertEqual((movida.lote_id, movida.frete_py_usd_kg), (destino.pk, Decimal('10.00')))
+        # As que ficaram (1 kg no total) dividem a fatura inteira da origem
+        ficaram = Importacao.objects.filter(lote=origem).order_by('pk')
+        self.assertEqual([linha.frete_py_usd_kg for linha in ficaram], [Decimal('32.00'), Decimal('32.00')])
+        self.assertGruposIguaisAoAgregado()
+
+    def test_importacoes_recebidas_ou_vendidas_nao_entram_no_lote(self):
+        fechada = Importacao.objects.filter(user=self.user, status__in=['recebido', 'vendido']).first()
+        custos = (fechada.frete_py_usd_kg, fechada.taxa_adm_fixa)
+        response = self.postar(
+            reverse('core:lote_create'),
+            descricao='Remessa 3', frete_total_usd='50.00', taxas_total_usd='0', criterio_rateio='peso',
+            importacoes=[self.linhas[0].pk, fechada.pk],
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Lote.objects.filter(user=self.user).exists())
+        self.assertEqual(self.updates, [])
+
+        # Direto pela função, a recebida ou vendida é ignorada e mantém os custos
+        lote = Lote.objects.create(user=self.user, descricao='Remessa 3', frete_total_usd=Decimal('50.00'))
+        self.assertEqual(bulk_updates.definir_importacoes_do_lote(lote, [self.linhas[0].pk, fechada.pk]), 1)
+        fechada.refresh_from_db()
+        self.assertEqual((fechada.lote_id, fechada.frete_py_usd_kg, fechada.taxa_adm_fixa), (None, *custos))
+
+    def test_lote_de_outro_usuario_nao_e_acessivel(self):
+        outro = User.objects.create_user(username='outro', password='senha')
+        lote = Lote.objects.create(user=outro, descricao='Alheio')
+        response = self.client.get(reverse('core:lote_update', kwargs={'pk': lote.pk}))
+        self.assertEqual(response.status_code, 404)
+
+
+class ReavaliacaoCambioTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='usuario', password='senha')
+        ConfiguracaoPadrao.objects.create(user=cls.user, cambio_usdt_padrao=Decimal('5.8000'))
+        criar_importacoes(cls.user, 20)
+        outro = User.objects.create_user(username='outro', password='senha')
+        criar_importacoes(outro, 4)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        report_store.obter_relatorios(self.user, ['geral'])
+
+    def em_aberto(self):
+        return Importacao.objects.filter(user=self.user, status__in=bulk_updates.STATUS_EM_ABERTO)
+
+    def test_previa_igual_a_diferenca_calculada_pelas_importacoes(self):
+        abertas = list(self.em_aberto())
+        impacto = sum(
+            importacao.custo_total_quantidade_usd * (Decimal('5.8000') - importacao.cambio_usdt) for importacao in abertas
+        )
+        with self.assertNumQueries(1):
+            previa = bulk_updates.impacto_reavaliacao(self.user, Decimal('5.8000'))
+        self.assertEqual((previa.importacoes, previa.unidades), (len(abertas), sum(i.quantidade for i in abertas)))
+        self.assertEqual(previa.impacto_brl, impacto.quantize(Decimal('0.01')))
+
+        response = self.client.get(reverse('core:configuracoes'))
+        self.assertContains(response, f'{len(abertas)} importações planejadas ou em trânsito')
+
+    def test_reavaliacao_em_um_unico_update_com_historico(self):
+        fechadas = {importacao.pk: importacao.cambio_usdt for importacao in Importacao.objects.exclude(pk__in=self.em_aberto())}
+        previa = bulk_updates.impacto_reavaliacao(self.user, Decimal('5.8000'))
+        sqls = []
+
+        def registrar(execute, sql, params, many, context):
+            sqls.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(registrar):
+            response = self.client.post(reverse('core:reavaliar_cambio'))
+        self.assertRedirects(response, reverse('core:configuracoes'), fetch_redirect_response=False)
+        updates = [sql for sql in sqls if sql.startswith('UPDATE "core_importacao"')]
+        self.assertEqual(len(updates), 1)
+        # O UPDATE filtra pelo status, sem a lista de pks (sem limite de parâmetros)
+        self.assertNotIn('"id" IN', updates[0])
+
+        self.assertFalse(self.em_aberto().exclude(cambio_usdt=Decimal('5.8000')).exists())
+        # Recebidas, vendidas e as de outro usuário mantêm o câmbio
+        self.assertEqual(dict(Importacao.objects.filter(pk__in=fechadas).values_list('pk', 'cambio_usdt')), fechadas)
+        reavaliacao = ReavaliacaoCambio.objects.get(user=self.user)
+        self.assertEqual(
+            (reavaliacao.cambio_usdt, reavaliacao.importacoes, reavaliacao.impacto_brl),
+            (Decimal('5.8000'), previa.importacoes, previa.impacto_brl),
+        )
+        cache = RelatorioCache.objects.get(user=self.user, tipo='grupos')
+        self.assertEqual(cache.versao, versao_dados(self.user).token)
+        self.assertEqual(sorted(report_store._decodificar('grupos', cache.dados)), sorted(DadosRelatorio(self.user).grupos))
+
+        # Nada mais a reavaliar: nenhum UPDATE nem nova entrada no histórico
+        self.client.post(reverse('core:reavaliar_cambio'))
+        self.assertEqual(ReavaliacaoCambio.objects.filter(user=self.user).count(), 1)
+
+
+class CambioTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='usuario', password='senha')
+        criar_importacoes(cls.user, 10)
+        Cambio.objects.bulk_create([
+            Cambio(data=date(2026, 1, 1), cambio_usdt=Decimal('5.0000')),
+            Cambio(data=date(2026, 2, 1), cambio_usdt=Decimal('5.5000')),
+        ])
+
+    def test_carga_do_csv_substitui_datas_existentes(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        caminho = f'{diretorio.name}/cotacoes.csv'
+        with open(caminho, 'w', encoding='utf-8') as arquivo:
+            arquivo.write('data;cambio_usdt\n01/02/2026;5,6000\n2026-03-01;5,7000\n2026-03-01;5,7100\n')
+        saida = io.StringIO()
+        call_command('importar_cambios', caminho, stdout=saida)
+        self.assertIn('2 cotação(ões) carregada(s)', saida.getvalue())
+        self.assertEqual(
+            list(Cambio.objects.order_by('data').values_list('cambio_usdt', flat=True)),
+            [Decimal('5.0000'), Decimal('5.6000'), Decimal('5.7100')],
+        )
+
+    def test_carteira_avaliada_pela_cotacao_vigente_em_uma_query(self):
+        importacoes = list(Importacao.objects.filter(user=self.user))
+        with self.assertNumQueries(1):
+            cambio, linhas = cambios.avaliar_carteira(self.user, date(2026, 1, 31))
+        self.assertEqual(cambio, Decimal('5.0000'))
+        self.assertEqual(sum(linha.importacoes for linha in linhas), len(importacoes))
+        for linha in linhas:
+            do_status = [importacao for importacao in importacoes if importacao.status == linha.status_key]
+            usd = sum(importacao.custo_total_quantidade_usd for importacao in do_status)
+            self.assertEqual(linha.custo_brl_na_data, (usd * Decimal('5.0')).quantize(Decimal('0.01')))
+
+        # Antes da primeira cotação não há câmbio vigente
+        cambio, linhas = cambios.avaliar_carteira(self.user, date(2025, 12, 31))
+        self.assertIsNone(cambio)
+        self.assertTrue(all(linha.custo_brl_na_data is None for linha in linhas))
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('core:avaliacao_cambio'), {'data': '2026-02-10'})
+        self.assertEqual(response.context['cambio'], Decimal('5.5000'))
+
+        # Sem importações, a cotação vigente continua resolvida
+        sem_importacoes = User.objects.create_user(username='novo', password='senha')
+        with self.assertNumQueries(1):
+            self.assertEqual(cambios.avaliar_carteira(sem_importacoes, date(2026, 2, 10)), (Decimal('5.5000'), []))
+
+    def test_cada_importacao_pela_cotacao_da_data_de_compra(self):
+        primeira, segunda, terceira = Importacao.objects.filter(user=self.user).order_by('pk')[:3]
+        Importacao.objects.filter(pk=primeira.pk).update(data_importacao=date(2026, 1, 20))
+        Importacao.objects.filter(pk=segunda.pk).update(data_importacao=date(2026, 2, 1))
+        Importacao.objects.filter(pk=terceira.pk).update(data_importacao=date(2025, 6, 1))
+
+        avaliadas = cambios.avaliar_importacoes(Importacao.objects.filter(pk__in=[primeira.pk, segunda.pk, terceira.pk]))
+        self.assertEqual(
+            dict(avaliadas.values_list('pk', 'cambio_na_data')),
+            {primeira.pk: Decimal('5.0000'), segunda.pk: Decimal('5.5000'), terceira.pk: None},
+        )
+        avaliada = avaliadas.get(pk=segunda.pk)
+        self.assertEqual(
+            Decimal(avaliada.custo_total_brl_na_data).quantize(Decimal('0.01')),
+            (avaliada.custo_total_quantidade_usd * Decimal('5.5')).quantize(Decimal('0.01')),
+        )
+
+
+class PriceHistoryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='usuario', password='senha')
+        criar_importacoes(cls.user, 6)
+
+    def setUp(self):
+        # Descarta observações que outros testes deixaram no buffer do processo
+        price_history._retirar()
+        self.addCleanup(price_history._retirar)
+
+    def salvar(self, importacao, **campos):
+        for campo, valor in campos.items():
+            setattr(importacao, campo, valor)
+        with self.captureOnCommitCallbacks(execute=True):
+            importacao.save()
+
+    def test_uma_observacao_por_produto_e_dia_vale_a_ultima(self):
+        importacao = Importacao.objects.filter(user=self.user).first()
+        self.salvar(importacao, valor_eua_unitario=Decimal('650.00'))
+        self.salvar(importacao, valor_eua_unitario=Decimal('640.00'))
+        self.assertEqual(price_history.pendentes(), 1)
+        with self.assertNumQueries(1):
+            price_history.flush()
+
+        # Uma correção no mesmo dia substitui o preço; o valor é o da escrita, não o da gravação
+        self.salvar(importacao, valor_eua_unitario=Decimal('630.00'))
+        Importacao.objects.filter(pk=importacao.pk).update(valor_eua_unitario=Decimal('999.00'))
+        price_history.flush()
+        with mock.patch.object(price_history.timezone, 'localdate', return_value=date(2099, 1, 1)):
+            self.salvar(importacao, valor_eua_unitario=Decimal('620.00'))
+        price_history.flush()
+        self.assertEqual(
+            list(HistoricoPreco.objects.filter(modelo=importacao.modelo).order_by('data_registro')
+                 .values_list('preco_eua', flat=True)),
+            [Decimal('630.00'), Decimal('620.00')],
+        )
+
+    def test_acoes_em_massa_observam_todas_as_linhas(self):
+        pks = list(Importacao.objects.filter(user=self.user).values_list('pk', flat=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_updates.registrar_venda(self.user, pks, Decimal('4500.00'))
+        self.assertEqual(price_history.flush(), len(pks))
+        self.assertEqual(
+            set(HistoricoPreco.objects.filter(user=self.user).values_list('preco_venda_brl', flat=True)),
+            {Decimal('4500.00')},
+        )
+
+    def test_gravado_depois_da_resposta_quando_devido(self):
+        self.client.force_login(self.user)
+        importacao = Importacao.objects.filter(user=self.user).first()
+        self.salvar(importacao)
+        sqls = []
+
+        def registrar(execute, sql, params, many, context):
+            sqls.append(sql)
+            return execute(sql, params, many, context)
+
+        with override_settings(PRICE_HISTORY_FLUSH_SECONDS=60), connection.execute_wrapper(registrar):
+            self.client.get(reverse('core:importacao_list'))
+        self.assertFalse([sql for sql in sqls if 'core_historicopreco' in sql])
+        self.assertEqual(price_history.pendentes(), 1)
+
+        # A view termina antes da gravação: o INSERT só acontece no request_finished
+        with override_settings(PRICE_HISTORY_FLUSH_SECONDS=0), connection.execute_wrapper(registrar):
+            response = self.client.get(reverse('core:importacao_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(price_history.pendentes(), 0)
+        self.assertTrue(HistoricoPreco.objects.filter(user=self.user, modelo=importacao.modelo).exists())
+
+        with override_settings(PRICE_HISTORY_BATCH_SIZE=2, PRICE_HISTORY_FLUSH_SECONDS=60):
+            for importacao in Importacao.objects.filter(user=self.user)[:2]:
+                self.salvar(importacao)
+            self.client.get(reverse('core:importacao_list'))
+        self.assertEqual(price_history.pendentes(), 0)
+
+
+class ReportStoreTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='usuario', password='senha')
+        criar_importacoes(cls.user, 8)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_pagina_e_exportacoes_reutilizam_o_mesmo_calculo(self):
+        with mock.patch.object(DadosRelatorio, 'geral', autospec=True, side_effect=DadosRelatorio.geral) as geral:
+            self.client.get(reverse('core:relatorios'))
+            self.client.get(reverse('core:export_relatorio_pdf', kwargs={'tipo_relatorio': 'completo'}))
+            self.client.get(reverse('core:export_relatorio_excel', kwargs={'tipo_relatorio': 'completo'}))
+            self.client.get(reverse('core:relatorio_rentabilidade'))
+        self.assertEqual(geral.call_count, 1)
+
+    def test_resultado_lido_preserva_tipos(self):
+        report_store.obter_relatorios(self.user, ['geral', 'recentes'])
+        dados = report_store.obter_relatorios(self.user, ['geral', 'recentes'])
+        self.assertIsInstance(dados['geral'], EstatisticasGerais)
+        self.assertIsInstance(dados['recentes'][0], Detalhe)
+        self.assertIsInstance(dados['geral'].total_investido_brl, Decimal)
+        self.assertIsInstance(dados['recentes'][0].created_at, datetime)
+        self.assertAlmostEqual(
+            dados['geral'].total_investido_brl,
+            sum(imp.custo_total_quantidade_brl for imp in Importacao.objects.filter(user=self.user)),
+            delta=Decimal('0.05'),
+        )
+
+    def test_custos_no_banco_coincidem_com_as_properties(self):
+        detalhes = {linha.pk: linha for linha in DadosRelatorio(self.user).detalhes}
+        for imp in Importacao.objects.filter(user=self.user):
+            self.assertAlmostEqual(detalhes[imp.pk].custo_eua_brl, imp.custo_eua_brl, delta=Decimal('0.01'))
+            self.assertAlmostEqual(detalhes[imp.pk].custo_total_py_brl, imp.custo_total_py_brl, delta=Decimal('0.01'))
+
+    def test_uma_query_agrupada_para_todos_os_totais(self):
+        dados = DadosRelatorio(self.user)
+        with self.assertNumQueries(1):
+            dados.geral()
+            dados.rentabilidade_por_modelo()
+            dados.rentabilidade_por_grade()
+            dados.status()
+
+    def test_renderizacao_nao_consulta_o_banco(self):
+        tipos = set(report_renderers.TIPOS_PAGINA) | {'detalhes'}
+        dados = report_store.obter_relatorios(self.user, sorted(tipos))
+        with self.assertNumQueries(0):
+            report_renderers.contexto_relatorios(dados)
+            for tipo in report_renderers.TIPOS_PDF:
+                self.assertTrue(report_renderers.pdf_temporario(tipo, dados).read().startswith(b'%PDF'))
+            for tipo in report_renderers.TIPOS_EXCEL:
+                self.assertTrue(report_renderers.render_xlsx(tipo, dados).startswith(b'PK'))
+
+    def test_escrita_invalida_e_proxima_leitura_recalcula(self):
+        antes = report_store.obter_relatorio(self.user, 'geral')
+        self.assertTrue(RelatorioCache.objects.filter(user=self.user).exists())
+
+        importacao = Importacao.objects.filter(user=self.user).first()
+        importacao.quantidade += 10
+        importacao.save()
+        self.assertFalse(RelatorioCache.objects.filter(user=self.user).exists())
+
+        depois = report_store.obter_relatorio(self.user, 'geral')
+        self.assertEqual(depois.total_unidades, antes.total_unidades + 10)
+
+    def test_versao_diferente_recalcula_sem_sinal(self):
+        report_store.obter_relatorio(self.user, 'geral')
+        # QuerySet.update() não dispara sinais; a versão dos dados muda pelo updated_at
+        Importacao.objects.filter(user=self.user).update(quantidade=1, updated_at=timezone.now())
+        self.assertEqual(report_store.obter_relatorio(self.user, 'geral').total_unidades, 8)
+
+
+class PdfExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='usuario', password='senha')
+        criar_importacoes(cls.user, 600)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_completo_inclui_todas_as_importacoes_em_blocos(self):
+        with mock.patch.object(report_renderers, 'LongTable', wraps=report_renderers.LongTable) as long_table:
+            response = self.client.get(reverse('core:export_relatorio_pdf', kwargs={'tipo_relatorio': 'completo'}))
+            conteudo = b''.join(response.streaming_content)
+        self.assertTrue(conteudo.startswith(b'%PDF'))
+        self.assertIn('attachment', response['Content-Disposition'])
+        blocos = [chamada.args[0] for chamada in long_table.call_args_list]
+        # Resumo + 600 linhas de detalhe em blocos de LINHAS_POR_BLOCO, cada um com cabeçalho
+        self.assertEqual(len(blocos), 1 + 3)
+        self.assertEqual(sum(len(bloco) - 1 for bloco in blocos[1:]), 600)
+        self.assertTrue(all(len(bloco) - 1 <= report_renderers.LINHAS_POR_BLOCO for bloco in blocos))
+
+    def test_detalhes_grandes_sao_paginados_sem_materializar_as_linhas(self):
+        lidas = []
+
+        def detalhes(total):
+            for numero in range(total):
+                lidas.append(numero)
+                yield Detalhe(
+                    numero, f'iPhone {numero}', 128, 'A', 1, 'planejado', Decimal('500.00'),
+                    Decimal('2500.00'), Decimal('2800.00'), None, timezone.now(),
+                )
+
+        geral = EstatisticasGerais(5000, 5000, Decimal('2500000.00'), Decimal('14000000.00'), Decimal('500.00'), 5000, 1)
+        lidas_por_pagina = []
+        with mock.patch.object(
+            report_renderers._DocumentoIncremental, 'afterPage', autospec=True,
+            side_effect=lambda doc: lidas_por_pagina.append(len(lidas)),
+        ):
+            with report_renderers.pdf_temporario('completo', {'geral': geral, 'detalhes': detalhes(5000)}) as arquivo:
+                self.assertEqual(arquivo.read(4), b'%PDF')
+        self.assertEqual(len(lidas), 5000)
+        # Cada página só puxou o bloco que estava desenhando (e, no máximo, o seguinte)
+        self.assertGreater(len(lidas_por_pagina), 5000 // report_renderers.LINHAS_POR_BLOCO)
+        self.assertLessEqual(lidas_por_pagina[0], 2 * report_renderers.LINHAS_POR_BLOCO)
+
+    def test_tipo_que_o_formato_nao_exporta_responde_404(self):
+        for nome, tipo in [('export_relatorio_pdf', 'grade'), ('export_relatorio_pdf', 'foo'), ('export_relatorio_excel', 'foo')]:
+            response = self.client.get(reverse(f'core:{nome}', kwargs={'tipo_relatorio': tipo}), HTTP_IF_NONE_MATCH='*')
+            self.assertEqual(response.status_code, 404)
+
+
+class ExcelExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='usuario', password='senha')
+        criar_importacoes(cls.user, 12)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def graficos(self, tipo):
+        response = self.client.get(reverse('core:export_relatorio_excel', kwargs={'tipo_relatorio': tipo}))
+        with zipfile.ZipFile(io.BytesIO(response.content)) as xlsx:
+            return [
+                xlsx.read(nome).decode() for nome in sorted(xlsx.namelist())
+                if nome.startswith('xl/charts/chart')
+            ]
+
+    def test_graficos_nativos_referenciam_as_celulas(self):
+        status = self.graficos('status')
+        self.assertEqual(len(status), 1)
+        self.assertIn('<c:pieChart>', status[0])
+        # Uma linha por status presente (4 status nas importações de teste)
+        self.assertIn("'Status das Importações'!$D$2:$D$5", status[0])
+
+        grade = self.graficos('grade')
+        self.assertEqual(len(grade), 1)
+        self.assertIn("'Rentabilidade por Grade'!$F$2", grade[0])
+
+    def test_completo_inclui_todas_as_abas_com_graficos(self):
+        self.assertEqual(len(self.graficos('completo')), 3)
+        self.assertEqual(len(self.graficos('rentabilidade')), 1)
+
+
+class ReportBundleTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='usuario', password='senha')
+        criar_importacoes(cls.user, 12)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_zip_com_todos_os_relatorios_em_pdf_e_excel(self):
+        response = self.client.get(reverse('core:export_relatorios_zip'))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        blocos = list(response.streaming_content)
+        # Um bloco por arquivo concluído, mais o diretório central no final
+        self.assertEqual(len(blocos), len(report_bundle.ARQUIVOS) + 1)
+
+        with zipfile.ZipFile(io.BytesIO(b''.join(blocos))) as pacote:
+            self.assertIsNone(pacote.testzip())
+            nomes = set(pacote.namelist())
+            self.assertEqual(nomes, {arquivo for arquivo, _nome in report_bundle.ARQUIVOS})
+            for nome in nomes:
+                assinatura = b'%PDF' if nome.endswith('.pdf') else b'PK'
+                self.assertTrue(pacote.read(nome).startswith(assinatura), nome)
+
+    def test_dados_lidos_uma_vez_e_renderizados_em_paralelo(self):
+        threads = set()
+        original = report_bundle.exportacao
+
+        def renderizar(*args):
+            threads.add(threading.current_thread().name)
+            return original(*args)
+
+        with mock.patch.object(report_bundle, 'exportacao', side_effect=renderizar), \
+                mock.patch.object(report_store, 'obter_relatorios', wraps=report_store.obter_relatorios) as obter:
+            response = self.client.get(reverse('core:export_relatorios_zip'))
+            b''.join(response.streaming_content)
+        self.assertEqual(obter.call_count, 1)
+        self.assertTrue(all(nome.startswith('relatorios-zip') for nome in threads))
+
+    def test_exportacoes_pre_geradas_nao_sao_renderizadas_de_novo(self):
+        precompute.precomputar_usuario(self.user.pk)
+        ExportacaoCache.objects.filter(user=self.user, nome='pdf:completo').delete()
+        with mock.patch.object(report_bundle, 'exportacao', wraps=report_bundle.exportacao) as exportacao, \
+                mock.patch.object(report_store, 'obter_relatorios', wraps=report_store.obter_relatorios) as obter:
+            response = self.client.get(reverse('core:export_relatorios_zip'))
+            conteudo = b''.join(response.streaming_content)
+        # Só o arquivo que faltava no cache é renderizado, com os dados que ele usa
+        self.assertEqual([chamada.args[0] for chamada in exportacao.call_args_list], ['pdf:completo'])
+        self.assertEqual(obter.call_args.args[1], ['detalhes', 'geral'])
+        with zipfile.ZipFile(io.BytesIO(conteudo)) as pacote:
+            self.assertEqual(len(pacote.namelist()), len(report_bundle.ARQUIVOS))
+            self.assertTrue(pacote.read('relatorio_completo.pdf').startswith(b'%PDF'))
+
+
+class PrecomputeTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='usuario', password='senha')
+        criar_importacoes(cls.user, 10)
+        cls.inativo = User.objects.create_user(username='inativo', password='senha', is_active=False)
+
+    def test_comando_grava_relatorios_e_exportacoes_dos_usuarios_ativos(self):
+        call_command('precompute_relatorios', workers=1, stdout=io.StringIO())
+        self.assertEqual(
+            set(RelatorioCache.objects.filter(user=self.user).values_list('tipo', flat=True)),
+            set(report_store.TIPOS),
+        )
+        self.assertEqual(
+            set(ExportacaoCache.objects.filter(user=self.user).values_list('nome', flat=True)),
+            set(report_renderers.EXPORTACOES),
+        )
+        self.assertFalse(RelatorioCache.objects.filter(user=self.inativo).exists())
+
+    def test_incremental_pula_quem_nao_mudou(self):
+        self.assertEqual(precompute.precomputar_usuario(self.user.pk), (self.user.pk, True))
+        self.assertEqual(precompute.precomputar_usuario(self.user.pk), (self.user.pk, False))
+
+        importacao = Importacao.objects.filter(user=self.user).first()
+        importacao.quantidade += 1
+        importacao.save()
+        self.assertEqual(precompute.precomputar_usuario(self.user.pk), (self.user.pk, True))
+
+    def test_exportacao_pre_gerada_e_servida_sem_renderizar(self):
+        precompute.precomputar_usuario(self.user.pk)
+        self.client.force_login(self.user)
+        with mock.patch.object(report_renderers, 'render_pdf') as render_pdf, \
+                mock.patch.object(report_renderers, 'render_xlsx') as render_xlsx:
+            pdf = self.client.get(reverse('core:export_relatorio_pdf', kwargs={'tipo_relatorio': 'completo'}))
+            xlsx = self.client.get(reverse('core:export_relatorio_excel', kwargs={'tipo_relatorio': 'completo'}))
+        render_pdf.assert_not_called()
+        render_xlsx.assert_not_called()
+        self.assertTrue(b''.join(pdf.streaming_content).startswith(b'%PDF'))
+        self.assertTrue(xlsx.content.startswith(b'PK'))
+
+    def test_widgets_do_dashboard_usam_os_agregados_pre_calculados(self):
+        precompute.precomputar_usuario(self.user.pk, exportar=False)
+        self.client.force_login(self.user)
+        with mock.patch.object(report_store, 'DadosRelatorio') as dados_relatorio:
+            totais, lucro = (
+                self.client.get(reverse('core:dashboard_widget', kwargs={'widget': widget}))
+                for widget in ('totais', 'lucro')
+            )
+        dados_relatorio.assert_not_called()
+        importacoes = list(Importacao.objects.filter(user=self.user))
+        self.assertEqual(totais.context['total_importacoes'], 10)
+        self.assertAlmostEqual(
+            totais.context['total_investido_brl'],
+            sum(imp.custo_total_quantidade_brl for imp in importacoes),
+            delta=Decimal('0.05'),
+        )
+        self.assertAlmostEqual(
+            lucro.context['lucro_total'],
+            sum(imp.lucro_total for imp in importacoes if imp.status == 'vendido' and imp.lucro_total),
+            delta=Decimal('0.05'),
+        )
+
+
+class AsyncViewsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='usuario', password='senha')
+        criar_importacoes(cls.user, 10)
+
+    def requisicao(self, user=None, headers=None):
+        request = AsyncRequestFactory().get('/', headers=headers)
+        request.user = user or self.user
+        request.session = self.client.session
+        request._messages = default_storage(request)
+        # Mesmo segredo CSRF entre requisições, como faria o cookie do navegador
+        request.META['CSRF_COOKIE'] = 'a' * 32
+        return request
+
+    def test_widget_e_relatorios_async_renderizam_os_mesmos_totais(self):
+        self.client.force_login(self.user)
+        for view, url_name, kwargs in [
+            (views_async.dashboard_widget, 'dashboard_widget', {'widget': 'totais'}),
+            (views_async.relatorios, 'relatorios', {}),
+        ]:
+            with self.subTest(url_name=url_name):
+                response = async_to_sync(view)(self.requisicao(), **kwargs)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('no-cache', response['Cache-Control'])
+                sincrona = self.client.get(reverse(f'core:{url_name}', kwargs=kwargs))
+                total = sincrona.context['total_importacoes'] if kwargs else \
+                    sincrona.context['estatisticas_gerais'].total_importacoes
+                self.assertEqual(total, 10)
+                self.assertIn(f'>{total}<'.encode(), response.content.replace(b' ', b'').replace(b'\n', b''))
+
+        response = async_to_sync(views_async.dashboard_widget)(self.requisicao(), widget='recentes')
+        self.assertContains(response, 'iPhone', count=5)
+
+    def test_304_e_redirecionamento_para_login(self):
+        etag = async_to_sync(views_async.dashboard)(self.requisicao())['ETag']
+        response = async_to_sync(views_async.dashboard)(self.requisicao(headers={'If-None-Match': etag}))
+        self.assertEqual(response.status_code, 304)
+
+        response = async_to_sync(views_async.relatorios)(self.requisicao(user=AnonymousUser()))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('login', response['Location'])
+
+    @override_settings(ASYNC_PARALLEL_QUERIES=True)
+    def test_consultas_paralelas_rodam_em_threads_proprios(self):
+        async def duas():
+            return await asyncio.gather(
+                async_db.consultar(lambda: threading.current_thread()),
+                async_db.consultar(lambda: threading.current_thread()),
+            )
+
+        with mock.patch.object(async_db, 'close_old_connections') as fechar:
+            threads = async_to_sync(duas)()
+        self.assertNotIn(threading.main_thread(), threads)
+        self.assertEqual(fechar.call_count, 2)
+
+
+@override_settings(DASHBOARD_SSE_POLL_SECONDS=60, DASHBOARD_SSE_MAX_SECONDS=60)
+@mock.patch.object(views_async, 'consultar_isolada', async_db.consultar)
+class DashboardAoVivoTests(TestCase):
+    # consultar_isolada usaria outra conexão, que não enxerga os dados da transação do teste
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='usuario', password='senha')
+        criar_importacoes(cls.user, 3)
+
+    def requisicao(self, headers=None):
+        request = AsyncRequestFactory().get('/', headers=headers)
+        request.user = self.user
+        request.session = self.client.session
+        request._messages = default_storage(request)
+        return request
+
+    def ler(self, headers=None, depois_de_conectar=None, eventos=1):
+        """Abre o stream e devolve os primeiros `eventos` blocos após o `retry:` inicial.
+
+        A leitura termina como numa desconexão do navegador: o handler ASGI cancela a tarefa.
+        """
+        request = self.requisicao(headers)
+        blocos = []
+
+        async def consumir(response):
+            async for bloco in response:
+                blocos.append(bloco.decode())
+
+        async def ler():
+            response = await views_async.dashboard_eventos(request)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            tarefa = asyncio.create_task(consumir(response))
+            async with asyncio.timeout(5):
+                while not blocos:
+                    await asyncio.sleep(0.01)
+                self.assertTrue(blocos[0].startswith('retry:'))
+                self.assertEqual(live.conexoes(self.user.pk), 1)
+                if depois_de_conectar:
+                    await depois_de_conectar()
+                while len(blocos) <= eventos:
+                    await asyncio.sleep(0.01)
+            tarefa.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await tarefa
+            self.assertEqual(live.conexoes(self.user.pk), 0)
+
+        async_to_sync(ler)()
+        return blocos[1:eventos + 1]
+
+    def test_versao_desatualizada_recebe_os_widgets_na_conexao(self):
+        blocos = self.ler(headers={'Last-Event-ID': 'antiga'}, eventos=len(report_renderers.TIPOS_WIDGETS))
+        self.assertEqual(
+            [bloco.split('\n')[0] for bloco in blocos],
+            [f'event: {widget}' for widget in report_renderers.TIPOS_WIDGETS],
+        )
+        self.assertIn(f'id: {versao_dados(self.user).token}', blocos[0])
+        self.assertIn('>3<', blocos[0].replace(' ', '').replace('\ndata:', ''))
+
+    def test_aviso_do_pubsub_envia_os_widgets_sem_esperar_a_consulta_periodica(self):
+        async def alterar():
+            await async_db.consultar(criar_importacoes, self.user, 1, inicio=3)
+            # Vindo de outro thread, como o on_commit de uma view síncrona
+            await asyncio.to_thread(live.publicar, self.user.pk)
+
+        bloco, = self.ler(depois_de_conectar=alterar)
+        self.assertTrue(bloco.startswith('event: totais'))
+        self.assertIn('>4<', bloco.replace(' ', '').replace('\ndata:', ''))
+
+    @override_settings(DASHBOARD_SSE_POLL_SECONDS=0.01)
+    def test_sem_alteracao_envia_apenas_comentario(self):
+        self.assertEqual(self.ler(eventos=2), [': sem alterações\n\n'] * 2)
+
+    @override_settings(DASHBOARD_SSE_MAX_SECONDS=0)
+    def test_conexao_termina_apos_a_duracao_maxima(self):
+        request = self.requisicao()
+
+        async def ler():
+            response = await views_async.dashboard_eventos(request)
+            return [bloco async for bloco in response]
+        self.assertEqual(len(async_to_sync(ler)()), 1)
+        self.assertEqual(live.conexoes(), 0)
+
+    def test_escrita_publica_apos_o_commit(self):
+        with mock.patch.object(live, 'publicar') as publicar:
+            with self.captureOnCommitCallbacks(execute=True):
+                Importacao.objects.filter(user=self.user).first().save()
+                publicar.assert_not_called()
+        publicar.assert_called_with(self.user.pk)
+
+    def test_servidor_wsgi_recusa_o_stream(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('core:dashboard_eventos')).status_code, 204)
+        self.assertNotContains(self.client.get(reverse('core:dashboard')), 'sse-connect')
+        response = async_to_sync(views_async.dashboard)(self.requisicao())
+        self.assertContains(response, 'sse-connect')
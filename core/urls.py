@@ -1,6 +1,10 @@
+from django.conf import settings
 from django.urls import path
 from django.contrib.auth.views import LoginView, LogoutView
-from . import views
+from . import views, views_async
+
+# Servidor ASGI: dashboard e relatórios com consultas concorrentes (ver core.views_async)
+paginas = views_async if settings.ASYNC_VIEWS else views
 
 app_name = 'core'
 
@@ -10,35 +14,55 @@ urlpatterns = [
     path('logout/', LogoutView.as_view(), name='logout'),
     
     # Dashboard
-    path('', views.dashboard, name='dashboard'),
-    path('dashboard/', views.dashboard, name='dashboard'),
+    path('', paginas.dashboard, name='dashboard'),
+    path('dashboard/', paginas.dashboard, name='dashboard'),
+    path('dashboard/widgets/<str:widget>/', paginas.dashboard_widget, name='dashboard_widget'),
+    path('dashboard/eventos/', paginas.dashboard_eventos, name='dashboard_eventos'),
     
     # Importações
     path('importacoes/', views.importacao_list, name='importacao_list'),
     path('importacoes/nova/', views.importacao_create, name='importacao_create'),
+    path('importacoes/em-massa/', views.importacao_em_massa, name='importacao_em_massa'),
+    path('importacoes/lote/', views.importacao_lote, name='importacao_lote'),
+    path('importacoes/lote/totais/', views.importacao_lote_totais, name='importacao_lote_totais'),
     path('importacoes/<int:pk>/', views.importacao_detail, name='importacao_detail'),
     path('importacoes/<int:pk>/editar/', views.importacao_update, name='importacao_update'),
     path('importacoes/<int:pk>/deletar/', views.importacao_delete, name='importacao_delete'),
     
+    # Lotes (remessas)
+    path('lotes/', views.lote_list, name='lote_list'),
+    path('lotes/novo/', views.lote_create, name='lote_create'),
+    path('lotes/<int:pk>/editar/', views.lote_update, name='lote_update'),
+    
     # HTMX endpoints
     path('htmx/calcular-custos/', views.calcular_custos_htmx, name='calcular_custos_htmx'),
     
     # Relatórios
-    path('relatorios/', views.relatorios, name='relatorios'),
+    path('relatorios/', paginas.relatorios, name='relatorios'),
     path('relatorios/rentabilidade/', views.relatorio_rentabilidade, name='relatorio_rentabilidade'),
+    path('relatorios/cambio/', views.avaliacao_cambio, name='avaliacao_cambio'),
     
     # Export endpoints
     path('relatorios/export/pdf/<str:tipo_relatorio>/', views.export_relatorio_pdf, name='export_relatorio_pdf'),
     path('relatorios/export/excel/<str:tipo_relatorio>/', views.export_relatorio_excel, name='export_relatorio_excel'),
+    path('relatorios/export/zip/', views.export_relatorios_zip, name='export_relatorios_zip'),
     
     # Admin (apenas para admins)
     path('admin-panel/', views.admin_panel, name='admin_panel'),
+    path('admin-panel/perfis/', views.perfil_list, name='perfil_list'),
+    path('admin-panel/perfis/<int:pk>/', views.perfil_detail, name='perfil_detail'),
+    path('admin-panel/queries-lentas/', views.query_lenta_list, name='query_lenta_list'),
+    path('admin-panel/queries-lentas/<int:pk>/explain/', views.query_lenta_explain, name='query_lenta_explain'),
     path('admin-panel/usuarios/', views.user_management, name='user_management'),
     path('admin-panel/usuarios/criar/', views.user_create, name='user_create'),
     path('admin-panel/usuarios/<int:user_id>/editar/', views.user_edit, name='user_edit'),
     path('admin-panel/usuarios/<int:user_id>/deletar/', views.user_delete, name='user_delete'),
     path('admin-panel/usuarios/<int:user_id>/toggle-status/', views.user_toggle_status, name='user_toggle_status'),
     
+    # Métricas Prometheus (admins ou token)
+    path('metrics', views.metricas, name='metricas'),
+    
     # Configurações
     path('configuracoes/', views.configuracoes, name='configuracoes'),
+    path('configuracoes/reavaliar-cambio/', views.reavaliar_cambio, name='reavaliar_cambio'),
 ]
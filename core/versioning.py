@@ -0,0 +1,98 @@
+"""Versão dos dados de um usuário, usada para responder GETs condicionais (ETag/Last-Modified)"""
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.contrib import messages
+from django.db.models import Count, Max
+from django.middleware.csrf import get_token
+
+from .async_db import consultar
+from .models import ConfiguracaoPadrao, Importacao
+
+# Incrementar quando o conteúdo das páginas/exportações mudar sem mudança nos dados
+VERSAO_FORMATO = 5
+
+
+@dataclass(frozen=True)
+class VersaoDados:
+    user_id: int
+    total_importacoes: int
+    ultima_importacao: datetime | None
+    ultima_configuracao: datetime | None
+
+    @property
+    def token(self):
+        """Identificador compacto da versão (muda a cada criação, edição ou exclusão)"""
+        partes = (
+            VERSAO_FORMATO,
+            self.user_id,
+            self.total_importacoes,
+            self.ultima_importacao.isoformat() if self.ultima_importacao else '',
+            self.ultima_configuracao.isoformat() if self.ultima_configuracao else '',
+        )
+        return hashlib.sha1('|'.join(map(str, partes)).encode()).hexdigest()[:20]
+
+    @property
+    def last_modified(self):
+        datas = [data for data in (self.ultima_importacao, self.ultima_configuracao) if data]
+        return max(datas) if datas else None
+
+
+def _agregado_importacoes(user):
+    return Importacao.objects.filter(user=user).aggregate(total=Count('id'), ultima=Max('updated_at'))
+
+
+def _ultima_configuracao(user):
+    return ConfiguracaoPadrao.objects.filter(user=user).values_list('updated_at', flat=True).first()
+
+
+def versao_dados(user):
+    """Versão atual dos dados do usuário em duas queries baratas (agregado + configuração).
+
+    Atualizações em massa via QuerySet.update() precisam atualizar `updated_at` explicitamente.
+    """
+    agregado = _agregado_importacoes(user)
+    return VersaoDados(user.pk, agregado['total'], agregado['ultima'], _ultima_configuracao(user))
+
+
+async def aversao_dados(user):
+    """versao_dados para views async: as duas queries rodam concorrentemente"""
+    agregado, ultima_configuracao = await asyncio.gather(
+        consultar(_agregado_importacoes, user),
+        consultar(_ultima_configuracao, user),
+    )
+    return VersaoDados(user.pk, agregado['total'], agregado['ultima'], ultima_configuracao)
+
+
+def versao_da_requisicao(request):
+    """Versão dos dados do usuário logado, calculada uma vez por requisição"""
+    # etag_func, last_modified_func e a própria view compartilham o mesmo resultado
+    if not hasattr(request, '_versao_dados'):
+        request._versao_dados = versao_dados(request.user)
+    return request._versao_dados
+
+
+def _condicional_permitido(request):
+    # Mensagens pendentes precisam ser renderizadas; um 304 as deixaria para a próxima página
+    return request.user.is_authenticated and not len(messages.get_messages(request))
+
+
+def etag_dados(request, *args, **kwargs):
+    """etag_func para @condition: versão dos dados + role + segredo CSRF da sessão do navegador"""
+    if not _condicional_permitido(request):
+        return None
+    versao = versao_da_requisicao(request)
+    # O HTML em cache contém o token CSRF; se o segredo mudar (novo login), a página é regerada.
+    # get_token garante o segredo já aqui, como faria o {% csrf_token %} durante a renderização.
+    get_token(request)
+    csrf = hashlib.sha1(request.META['CSRF_COOKIE'].encode()).hexdigest()[:8]
+    return f'"{versao.token}-{request.user.role}-{csrf}"'
+
+
+def last_modified_dados(request, *args, **kwargs):
+    """last_modified_func para @condition"""
+    if not _condicional_permitido(request):
+        return None
+    return versao_da_requisicao(request).last_modified
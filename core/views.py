@@ -2,154 +2,211 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
-from django.db.models import Sum, Avg, Count, Q
+from django.http import FileResponse, JsonResponse, HttpResponse, Http404, StreamingHttpResponse
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import Sum, Avg, Count, Max, Q
 from django.core.paginator import Paginator
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_http_methods
+from django.views.decorators.vary import vary_on_headers
 from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
 from decimal import Decimal
-
-# PDF and Excel export imports (conditional)
-REPORTLAB_AVAILABLE = False
-XLSXWRITER_AVAILABLE = False
-MATPLOTLIB_AVAILABLE = False
-
-try:
-    from reportlab.lib.pagesizes import letter, A4
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    from reportlab.lib import colors
-    REPORTLAB_AVAILABLE = True
-except ImportError:
-    pass
-
-try:
-    import xlsxwriter
-    XLSXWRITER_AVAILABLE = True
-except ImportError:
-    pass
-
-try:
-    import matplotlib
-    matplotlib.use('Agg')  # Use non-interactive backend
-    import matplotlib.pyplot as plt
-    import seaborn as sns
-    MATPLOTLIB_AVAILABLE = True
-except ImportError:
-    pass
+from functools import wraps
 
 import json
-from datetime import datetime, timedelta
+import hmac
 import io
-import base64
+import logging
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+from . import bulk_updates, cambios, metrics, price_history, report_bundle, report_renderers, report_store, signals, slow_queries
+from .report_data import DadosRelatorio
+from .report_renderers import EXPORT_AVAILABLE
+from .versioning import etag_dados, last_modified_dados, versao_da_requisicao
+from .models import User, Importacao, Lote, ConfiguracaoPadrao, HistoricoPreco, ReavaliacaoCambio, PerfilRequisicao, QueryLenta
+from .forms import (
+    ImportacaoForm, ImportacaoLinhaForm, LoteCabecalhoForm, LinhasLoteFormSet, AcaoEmMassaForm, LoteForm, AvaliacaoCambioForm,
+    ConfiguracaoForm, UserForm,
+    CustomUserCreationForm,
+)
 
-from .models import User, Importacao, ConfiguracaoPadrao, HistoricoPreco
-from .forms import ImportacaoForm, ConfiguracaoForm, UserForm
+logger = logging.getLogger(__name__)
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=etag_dados, last_modified_func=last_modified_dados)
 def dashboard(request):
-    """Dashboard principal com métricas e gráficos"""
-    user = request.user
-    
-    # Buscar todas as importações do usuário
-    importacoes = Importacao.objects.filter(user=user)
-    
-    # Estatísticas gerais (calculadas manualmente)
-    total_importacoes = importacoes.count()
-    total_investido_usd = sum([imp.custo_total_quantidade_usd for imp in importacoes])
-    total_investido_brl = sum([imp.custo_total_quantidade_brl for imp in importacoes])
-    
-    # Importações por status (calculadas manualmente)
-    status_stats = {}
-    for status_choice in Importacao.STATUS_CHOICES:
-        status_key = status_choice[0]
-        status_importacoes = importacoes.filter(status=status_key)
-        if status_importacoes.exists():
-            status_stats[status_key] = {
-                'count': status_importacoes.count(),
-                'valor_total': sum([imp.custo_total_quantidade_brl for imp in status_importacoes]),
-                'display': status_choice[1]
-            }
-    
-    # Importações recentes
-    importacoes_recentes = importacoes.order_by('-created_at')[:5]
-    
-    # Modelos mais importados (usando agregação em campos reais)
-    modelos_populares = importacoes.values('modelo').annotate(
-        count=Count('id'),
-        total_unidades=Sum('quantidade')
-    ).order_by('-count')[:5]
-    
-    # Lucro total (apenas vendidos)
-    vendidos = importacoes.filter(status='vendido')
-    lucro_total = sum([imp.lucro_total for imp in vendidos if imp.lucro_total])
-    
-    context = {
-        'total_importacoes': total_importacoes,
-        'total_investido_usd': total_investido_usd,
-        'total_investido_brl': total_investido_brl,
-        'status_stats': status_stats,
-        'importacoes_recentes': importacoes_recentes,
-        'modelos_populares': modelos_populares,
-        'lucro_total': lucro_total,
-    }
-    
-    return render(request, 'dashboard/index.html', context)
+    """Dashboard principal: a página sai sem consultar os agregados e cada widget é carregado via HTMX"""
+    return render(request, 'dashboard/index.html')
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=etag_dados, last_modified_func=last_modified_dados)
+def dashboard_widget(request, widget):
+    """Um widget do dashboard (fragmento HTMX), revalidado por ETag independentemente dos demais"""
+    if widget not in report_renderers.TIPOS_WIDGETS:
+        raise Http404("Widget não encontrado")
+    # Agregados persistidos por versão dos dados (pré-calculados por precompute_relatorios)
+    dados = report_store.obter_relatorios(
+        request.user, report_renderers.TIPOS_WIDGETS[widget], versao_da_requisicao(request),
+    )
+    context = report_renderers.contexto_widget(widget, dados)
+    if widget == 'recentes':
+        context['importacoes_recentes'] = Importacao.objects.filter(user=request.user).order_by('-created_at')[:5]
+    return render(request, f'dashboard/widgets/{widget}.html', context)
+
+@login_required
+def dashboard_eventos(request):
+    """Dashboard ao vivo só existe no servidor ASGI (core.views_async.dashboard_eventos).
+
+    Sob WSGI cada conexão SSE prenderia um worker; o 204 faz o EventSource desistir de reconectar.
+    """
+    return HttpResponse(status=204)
+
+def _totais_lista(dados):
+    """Totais da lista de importações (os mesmos cards de totais e lucro do dashboard)"""
+    return {**report_renderers.contexto_widget('totais', dados), **report_renderers.contexto_widget('lucro', dados)}
+
+def _fragmento_htmx(request):
+    # Restaurações de histórico sem snapshot pedem a página inteira
+    return bool(request.htmx) and not request.htmx.history_restore_request
+
+def _etag_lista(request, *args, **kwargs):
+    """etag_dados, distinguindo o fragmento HTMX da página inteira (mesma URL)"""
+    etag = etag_dados(request)
+    if etag and _fragmento_htmx(request):
+        return f'{etag[:-1]}-htmx"'
+    return etag
+
+def _filtros_lista(dados, prefixo=''):
+    """Filtros da lista de importações (querystring da lista ou campos ocultos da ação em massa)"""
+    return {campo: dados.get(prefixo + campo) for campo in ('modelo', 'status', 'grade')}
+
+def _filtrar_importacoes(importacoes, filtros):
+    if filtros['modelo']:
+        importacoes = importacoes.filter(modelo__icontains=filtros['modelo'])
+    if filtros['status']:
+        importacoes = importacoes.filter(status=filtros['status'])
+    if filtros['grade']:
+        importacoes = importacoes.filter(grade=filtros['grade'])
+    return importacoes
+
+@login_required
+@vary_on_headers('HX-Request')
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_etag_lista, last_modified_func=last_modified_dados)
 def importacao_list(request):
     """Lista todas as importações do usuário"""
-    importacoes = Importacao.objects.filter(user=request.user)
-    
-    # Filtros
-    modelo = request.GET.get('modelo')
-    status = request.GET.get('status')
-    grade = request.GET.get('grade')
-    
-    if modelo:
-        importacoes = importacoes.filter(modelo__icontains=modelo)
-    if status:
-        importacoes = importacoes.filter(status=status)
-    if grade:
-        importacoes = importacoes.filter(grade=grade)
+    filtros = _filtros_lista(request.GET)
+    importacoes = _filtrar_importacoes(Importacao.objects.filter(user=request.user), filtros)
     
     # Paginação
     paginator = Paginator(importacoes, 20)
+    if not any(filtros.values()):
+        # Sem filtros, o total já veio da versão dos dados (calculada pelo ETag)
+        paginator.count = versao_da_requisicao(request).total_importacoes
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
-    # Opções para filtros
-    modelos_disponiveis = Importacao.objects.filter(user=request.user).values_list('modelo', flat=True).distinct()
-    
     context = {
         'page_obj': page_obj,
-        'modelos_disponiveis': modelos_disponiveis,
+        'filtros': filtros,
+        # Links de paginação mantêm os filtros ativos
+        'url_pagina': '?' + urlencode({**{campo: valor for campo, valor in filtros.items() if valor}, 'page': ''}),
+    }
+    
+    # Filtros e paginação via HTMX: só a tabela (o formulário de filtros continua na página)
+    if _fragmento_htmx(request):
+        return render(request, 'partials/importacoes_tabela.html', context)
+    
+    # Totais da carteira e opções para filtros (sugestões de modelo), persistidos por versão dos dados
+    dados = report_store.obter_relatorios(
+        request.user, ['modelos', 'geral', 'rentabilidade'], versao_da_requisicao(request),
+    )
+    context.update({
+        **_totais_lista(dados),
+        'modelos_disponiveis': [item.modelo for item in dados['modelos']],
         'status_choices': Importacao.STATUS_CHOICES,
         'grade_choices': Importacao.GRADE_CHOICES,
-        'filtros': {
-            'modelo': modelo,
-            'status': status,
-            'grade': grade,
-        }
-    }
+    })
     
     return render(request, 'importacoes/list.html', context)
 
+@login_required
+@require_http_methods(["POST"])
+def importacao_em_massa(request):
+    """Novo status ou registro de venda para as importações marcadas (ou todas as do filtro)
+    com um único UPDATE; volta para a lista com os mesmos filtros"""
+    form = AcaoEmMassaForm(request.POST)
+    # Campos ocultos da tabela: o filtro de status não se confunde com o novo status
+    filtros = _filtros_lista(request.POST, prefixo='filtro_')
+    
+    if form.is_valid():
+        dados = form.cleaned_data
+        if dados['todas_do_filtro']:
+            importacoes = _filtrar_importacoes(Importacao.objects.filter(user=request.user), filtros)
+            pks = list(importacoes.values_list('pk', flat=True)[:bulk_updates.MAX_IMPORTACOES + 1])
+        else:
+            pks = dados['selecionadas']
+        
+        if len(pks) > bulk_updates.MAX_IMPORTACOES:
+            messages.error(request, f'Selecione no máximo {bulk_updates.MAX_IMPORTACOES} importações por vez.')
+        else:
+            if dados['status'] == 'vendido':
+                alteradas = bulk_updates.registrar_venda(
+                    request.user, pks, dados['preco_venda_unitario'], dados['data_venda'],
+                )
+            else:
+                alteradas = bulk_updates.alterar_status(request.user, pks, dados['status'])
+            messages.success(request, f'{alteradas} importações atualizadas com sucesso!')
+    else:
+        for erros in form.errors.values():
+            messages.error(request, ' '.join(erros))
+    
+    querystring = urlencode({campo: valor for campo, valor in filtros.items() if valor})
+    return redirect(f"{reverse('core:importacao_list')}{'?' + querystring if querystring else ''}")
+
+def _importacao_alterada(request, importacao, grupos):
+    """Linha criada/editada (nada na exclusão) + totais da lista via hx-swap-oob"""
+    if grupos is None:
+        dados = report_store.obter_relatorios(request.user, ['geral', 'rentabilidade'])
+    else:
+        # Grupos já atualizados pelo delta: os totais saem deles sem consultar o banco
+        dados_relatorio = DadosRelatorio(request.user, grupos=grupos)
+        dados = {'geral': dados_relatorio.geral(), 'rentabilidade': dados_relatorio.rentabilidade_por_modelo()}
+    context = {'importacao': importacao, **_totais_lista(dados)}
+    return render(request, 'partials/importacao_alterada.html', context)
+
 @login_required
 def importacao_create(request):
     """Criar nova importação"""
+    # Na lista (HTMX) o formulário ocupa a linha e não tem o painel de custos
+    form_class = ImportacaoLinhaForm if request.htmx else ImportacaoForm
     if request.method == 'POST':
-        form = ImportacaoForm(request.POST, user=request.user)
+        form = form_class(request.POST, user=request.user)
         if form.is_valid():
             importacao = form.save(commit=False)
             importacao.user = request.user
-            importacao.save()
+            
+            def escrever():
+                importacao.save()
+                return importacao
+            
+            importacao, grupos = report_store.registrar_alteracao(request.user, None, escrever)
+            if request.htmx:
+                return _importacao_alterada(request, importacao, grupos)
             
             messages.success(request, 'Importação criada com sucesso!')
             return redirect('core:importacao_detail', pk=importacao.pk)
     else:
-        form = ImportacaoForm(user=request.user)
+        form = form_class(user=request.user)
+    
+    if request.htmx:
+        return render(request, 'partials/importacao_linha_form.html', {'form': form})
     
     return render(request, 'importacoes/form.html', {
         'form': form,
@@ -159,7 +216,14 @@ def importacao_create(request):
 @login_required
 def importacao_detail(request, pk):
     """Detalhes de uma importação"""
-    importacao = get_object_or_404(Importacao, pk=pk, user=request.user)
+    # Câmbio de mercado na data da compra e hoje, na mesma query da importação
+    importacoes = cambios.avaliar_importacoes(Importacao.objects.filter(user=request.user), timezone.localdate())
+    importacoes = importacoes.annotate(cambio_na_compra=cambios.cambio_na_compra())
+    importacao = get_object_or_404(importacoes, pk=pk)
+    
+    # Cancelar a edição na lista volta à linha
+    if request.htmx:
+        return render(request, 'partials/importacao_linha.html', {'importacao': importacao})
     
     context = {
         'importacao': importacao,
@@ -171,15 +235,22 @@ def importacao_detail(request, pk):
 def importacao_update(request, pk):
     """Editar importação"""
     importacao = get_object_or_404(Importacao, pk=pk, user=request.user)
+    form_class = ImportacaoLinhaForm if request.htmx else ImportacaoForm
     
     if request.method == 'POST':
-        form = ImportacaoForm(request.POST, instance=importacao, user=request.user)
+        form = form_class(request.POST, instance=importacao, user=request.user)
         if form.is_valid():
-            form.save()
+            importacao, grupos = report_store.registrar_alteracao(request.user, importacao.pk, form.save)
+            if request.htmx:
+                return _importacao_alterada(request, importacao, grupos)
+            
             messages.success(request, 'Importação atualizada com sucesso!')
             return redirect('core:importacao_detail', pk=importacao.pk)
     else:
-        form = ImportacaoForm(instance=importacao, user=request.user)
+        form = form_class(instance=importacao, user=request.user)
+    
+    if request.htmx:
+        return render(request, 'partials/importacao_linha_form.html', {'form': form, 'importacao': importacao})
     
     return render(request, 'importacoes/form.html', {
         'form': form,
@@ -193,7 +264,13 @@ def importacao_delete(request, pk):
     importacao = get_object_or_404(Importacao, pk=pk, user=request.user)
     
     if request.method == 'POST':
-        importacao.delete()
+        def excluir():
+            importacao.delete()
+        
+        _importacao, grupos = report_store.registrar_alteracao(request.user, importacao.pk, excluir)
+        if request.htmx:
+            return _importacao_alterada(request, None, grupos)
+        
         messages.success(request, 'Importação deletada com sucesso!')
         return redirect('core:importacao_list')
     
@@ -201,22 +278,125 @@ def importacao_delete(request, pk):
         'importacao': importacao
     })
 
+def _formularios_lote(request, user=None):
+    """Cabeçalho (campos compartilhados) e linhas de uma compra em lote"""
+    data = request.POST if request.method == 'POST' else None
+    cabecalho = LoteCabecalhoForm(data, user=user)
+    linhas = LinhasLoteFormSet(data, queryset=Importacao.objects.none(), prefix='linhas')
+    return cabecalho, linhas
+
+def _importacoes_do_lote(cabecalho, linhas, user=None):
+    """Importações (não gravadas) das linhas válidas e preenchidas, com os campos do cabeçalho"""
+    if not cabecalho.is_valid():
+        return []
+    importacoes = []
+    for form in linhas.forms:
+        if form.has_changed() and form.is_valid():
+            importacao = cabecalho.aplicar(form.save(commit=False))
+            importacao.user = user
+            importacoes.append(importacao)
+    return importacoes
+
+def _totais_lote(importacoes):
+    return {
+        'total_linhas': len(importacoes),
+        'total_unidades': sum(importacao.quantidade for importacao in importacoes),
+        'total_usd': sum((importacao.custo_total_quantidade_usd for importacao in importacoes), Decimal('0')),
+        'total_brl': sum((importacao.custo_total_quantidade_brl for importacao in importacoes), Decimal('0')),
+    }
+
+@login_required
+def importacao_lote(request):
+    """Compra com várias linhas: câmbio, fretes e taxas informados uma vez e todas as linhas
+    validadas juntas e gravadas com um único bulk_create"""
+    cabecalho, linhas = _formularios_lote(request, user=request.user)
+    
+    if request.method == 'POST' and cabecalho.is_valid() and linhas.is_valid():
+        novas = _importacoes_do_lote(cabecalho, linhas, user=request.user)
+        
+        def escrever():
+            criadas = Importacao.objects.bulk_create(novas)
+            # bulk_create não dispara post_save: invalida, avisa os dashboards e observa os preços
+            # uma vez para o lote
+            signals.dados_alterados(request.user.pk)
+            price_history.observar(criadas)
+            return criadas
+        
+        criadas, _grupos = report_store.registrar_alteracoes(request.user, [], escrever)
+        messages.success(request, f'{len(criadas)} importações criadas com sucesso!')
+        return redirect('core:importacao_list')
+    
+    return render(request, 'importacoes/lote.html', {
+        'cabecalho': cabecalho,
+        'linhas': linhas,
+        **_totais_lote(_importacoes_do_lote(cabecalho, linhas)),
+    })
+
+@login_required
+@require_http_methods(["POST"])
+def importacao_lote_totais(request):
+    """Endpoint HTMX com os totais do lote inteiro, recalculados a cada alteração no formulário"""
+    cabecalho, linhas = _formularios_lote(request)
+    return render(request, 'partials/lote_totais.html', _totais_lote(_importacoes_do_lote(cabecalho, linhas)))
+
+@login_required
+def lote_list(request):
+    """Remessas com frete, taxas e custos rateados, numa única query agrupada"""
+    return render(request, 'lotes/list.html', {'lotes': DadosRelatorio(request.user).lotes()})
+
+def _lote_form(request, lote, title):
+    """Criação/edição de uma remessa: grava o lote, define suas importações e rateia os custos"""
+    form = LoteForm(request.POST or None, instance=lote)
+    
+    if request.method == 'POST' and form.is_valid():
+        lote = form.save(commit=False)
+        lote.user = request.user
+        with transaction.atomic():
+            lote.save()
+            rateadas = bulk_updates.definir_importacoes_do_lote(lote, form.cleaned_data['importacoes'])
+        messages.success(request, f'Lote salvo: frete e taxas rateados entre {rateadas} importações.')
+        return redirect('core:lote_list')
+    
+    # Candidatas: as importações do lote e as ainda sem lote que não foram recebidas
+    candidatas = Q(lote__isnull=True, status__in=bulk_updates.STATUS_EM_ABERTO)
+    if lote.pk:
+        candidatas |= Q(lote=lote)
+    importacoes = list(Importacao.objects.filter(user=request.user).filter(candidatas))
+    if request.method == 'POST':
+        selecionadas = set(form.cleaned_data.get('importacoes') or [])
+    else:
+        selecionadas = {importacao.pk for importacao in importacoes if lote.pk and importacao.lote_id == lote.pk}
+    
+    return render(request, 'lotes/form.html', {
+        'form': form,
+        'object': lote if lote.pk else None,
+        'importacoes': importacoes,
+        'selecionadas': selecionadas,
+        'title': title,
+    })
+
+@login_required
+def lote_create(request):
+    """Nova remessa"""
+    return _lote_form(request, Lote(user=request.user), 'Novo Lote')
+
+@login_required
+def lote_update(request, pk):
+    """Editar remessa (custos, critério de rateio e importações)"""
+    lote = get_object_or_404(Lote.objects.select_related('user'), pk=pk, user=request.user)
+    return _lote_form(request, lote, 'Editar Lote')
+
 @login_required
 @require_http_methods(["POST"])
 def calcular_custos_htmx(request):
     """Endpoint HTMX para cálculos em tempo real"""
     try:
-        # DEBUG TEMPORÁRIO - Valores do usuário
-        print("\n=== DEBUG CÁLCULOS HTMX ===")
-        print(f"POST data completo: {dict(request.POST)}")
-        
         # Extrai dados do formulário com valores padrão mais robustos
         valor_eua_str = request.POST.get('valor_eua_unitario', '0')
         try:
             valor_eua = Decimal(str(valor_eua_str).replace(',', '.')) if valor_eua_str and valor_eua_str != '' else Decimal('0')
         except (ValueError, TypeError):
             valor_eua = Decimal('0')
-        print(f"Valor EUA String: '{valor_eua_str}' -> Decimal: {valor_eua}")
         
         taxa_adm_fixa_str = request.POST.get('taxa_adm_fixa', '1.90')
         try:
@@ -272,17 +452,6 @@ def calcular_custos_htmx(request):
         quantidade_str = request.POST.get('quantidade', '1')
         quantidade = int(quantidade_str) if quantidade_str and quantidade_str != '' else 1
         
-        # DEBUG - Todos os valores extraídos
-        print(f"Taxa ADM Fixa: '{taxa_adm_fixa_str}' -> {taxa_adm_fixa}")
-        print(f"Taxa ADM Perc Raw: '{taxa_adm_perc_str}' -> {taxa_adm_perc_raw}")
-        print(f"Taxa ADM Perc Final: {taxa_adm_perc} (conversão aplicada)")
-        print(f"Frete EUA: '{frete_eua_str}' -> {frete_eua}")
-        print(f"POL EUA: '{pol_eua_str}' -> {pol_eua}")
-        print(f"Câmbio: '{cambio_str}' -> {cambio}")
-        print(f"Frete PY USD/kg: '{frete_py_usd_kg_str}' -> {frete_py_usd_kg}")
-        print(f"KG PY USD: '{kg_py_usd_str}' -> {kg_py_usd}")
-        print(f"Quantidade: '{quantidade_str}' -> {quantidade}")
-        
         # Cálculos baseados na lógica EXATA da planilha
         # 1. CUSTO EUA = (VALOR EUA + TAXA ADM + FRETE EUA + POL EUA) * (1 + taxa_percentual)
         custo_eua_base = valor_eua + taxa_adm_fixa + frete_eua + pol_eua
@@ -308,18 +477,23 @@ def calcular_custos_htmx(request):
         custo_total_quantidade_usd = custo_total_py_usd_unitario * quantidade
         custo_total_quantidade_brl = custo_total_py_brl_unitario * quantidade
         
-        # DEBUG - Cálculos intermediários e finais
-        print(f"\nCÁLCULOS INTERMEDIÁRIOS:")
-        print(f"Custo EUA Base: {custo_eua_base}")
-        print(f"Custo EUA Total: {custo_eua_total}")
-        print(f"Custo EUA BRL: {custo_eua_brl}")
-        print(f"Frete PY USD Unitário: {frete_py_usd_unitario}")
-        print(f"Frete PY BRL Unitário: {frete_py_brl_unitario}")
-        print(f"Custo Total PY USD Unitário: {custo_total_py_usd_unitario}")
-        print(f"Custo Total PY BRL Unitário: {custo_total_py_brl_unitario}")
-        print(f"Custo Total Quantidade USD: {custo_total_quantidade_usd}")
-        print(f"Custo Total Quantidade BRL: {custo_total_quantidade_brl}")
-        print("=== FIM DEBUG ===")
+        # Chamado a cada tecla: o dict só é montado se o nível DEBUG estiver ativo
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Cálculo de custos HTMX', extra={'calculo': {
+                'valor_eua': valor_eua,
+                'taxa_adm_fixa': taxa_adm_fixa,
+                'taxa_adm_percentual': taxa_adm_perc,
+                'frete_eua': frete_eua,
+                'pol_eua': pol_eua,
+                'cambio': cambio,
+                'frete_py_usd_kg': frete_py_usd_kg,
+                'kg_py_usd': kg_py_usd,
+                'quantidade': quantidade,
+                'custo_eua_base': custo_eua_base,
+                'custo_eua_total': custo_eua_total,
+                'custo_total_py_brl_unitario': custo_total_py_brl_unitario,
+                'custo_total_quantidade_brl': custo_total_quantidade_brl,
+            }})
         
         context = {
             'custo_eua_total': custo_eua_total,
@@ -335,504 +509,129 @@ def calcular_custos_htmx(request):
         return render(request, 'partials/custos_calculados.html', context)
     
     except (ValueError, TypeError) as e:
+        logger.debug('Valores inválidos no cálculo de custos HTMX: %s', e)
         return HttpResponse('<div class="text-red-500">Erro nos cálculos. Verifique os valores.</div>')
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=etag_dados, last_modified_func=last_modified_dados)
 def relatorios(request):
     """Página principal de relatórios com múltiplos relatórios úteis"""
-    user = request.user
-    importacoes = Importacao.objects.filter(user=user)
-    
-    # 1. Relatório de Rentabilidade por Modelo
-    rentabilidade_modelo = []
-    modelos = importacoes.values('modelo').distinct()
-    
-    for modelo_dict in modelos:
-        modelo = modelo_dict['modelo']
-        modelo_importacoes = importacoes.filter(modelo=modelo)
-        
-        total_investido = sum([imp.custo_total_quantidade_brl for imp in modelo_importacoes])
-        vendidos = modelo_importacoes.filter(status='vendido')
-        total_vendido = sum([imp.preco_venda_unitario * imp.quantidade for imp in vendidos if imp.preco_venda_unitario])
-        lucro_total = sum([imp.lucro_total for imp in vendidos if imp.lucro_total])
-        
-        rentabilidade_modelo.append({
-            'modelo': modelo,
-            'total_importacoes': modelo_importacoes.count(),
-            'total_unidades': sum([imp.quantidade for imp in modelo_importacoes]),
-            'total_investido': total_investido,
-            'total_vendido': total_vendido,
-            'lucro_total': lucro_total,
-            'margem_media': (lucro_total / total_investido * 100) if total_investido > 0 else 0
-        })
-    
-    # 2. Relatório de Status de Importações
-    status_report = []
-    for status_choice in Importacao.STATUS_CHOICES:
-        status_key = status_choice[0]
-        status_importacoes = importacoes.filter(status=status_key)
-        if status_importacoes.exists():
-            total_valor = sum([imp.custo_total_quantidade_brl for imp in status_importacoes])
-            total_unidades = sum([imp.quantidade for imp in status_importacoes])
-            status_report.append({
-                'status': status_choice[1],
-                'status_key': status_key,
-                'count': status_importacoes.count(),
-                'total_unidades': total_unidades,
-                'total_valor': total_valor,
-                'valor_medio': total_valor / status_importacoes.count() if status_importacoes.count() > 0 else 0
-            })
-    
-    # 3. Relatório de Análise de Custos (EUA vs Paraguay)
-    analise_custos = []
-    for imp in importacoes[:10]:  # Top 10 para não sobrecarregar
-        diferenca_custo = imp.custo_total_py_brl - imp.custo_eua_brl
-        percentual_diferenca = (diferenca_custo / imp.custo_eua_brl * 100) if imp.custo_eua_brl > 0 else 0
-        
-        analise_custos.append({
-            'modelo': imp.modelo,
-            'capacidade': imp.capacidade_gb,
-            'grade': imp.grade,
-            'custo_eua': imp.custo_eua_brl,
-            'custo_py': imp.custo_total_py_brl,
-            'diferenca': diferenca_custo,
-            'percentual_diferenca': percentual_diferenca
-        })
-    
-    # 4. Relatório de Performance por Grade
-    performance_grade = []
-    grades = importacoes.values('grade').distinct()
-    
-    for grade_dict in grades:
-        grade = grade_dict['grade']
-        grade_importacoes = importacoes.filter(grade=grade)
-        
-        total_investido = sum([imp.custo_total_quantidade_brl for imp in grade_importacoes])
-        vendidos = grade_importacoes.filter(status='vendido')
-        total_vendido = sum([imp.preco_venda_unitario * imp.quantidade for imp in vendidos if imp.preco_venda_unitario])
-        lucro_total = sum([imp.lucro_total for imp in vendidos if imp.lucro_total])
-        
-        performance_grade.append({
-            'grade': grade,
-            'total_importacoes': grade_importacoes.count(),
-            'total_unidades': sum([imp.quantidade for imp in grade_importacoes]),
-            'total_investido': total_investido,
-            'total_vendido': total_vendido,
-            'lucro_total': lucro_total,
-            'margem_media': (lucro_total / total_investido * 100) if total_investido > 0 else 0
-        })
-    
-    # 5. Estatísticas Gerais
-    estatisticas_gerais = {
-        'total_importacoes': importacoes.count(),
-        'total_unidades': sum([imp.quantidade for imp in importacoes]),
-        'total_investido_usd': sum([imp.custo_total_quantidade_usd for imp in importacoes]),
-        'total_investido_brl': sum([imp.custo_total_quantidade_brl for imp in importacoes]),
-        'valor_medio_unitario': sum([imp.custo_total_py_brl for imp in importacoes]) / importacoes.count() if importacoes.count() > 0 else 0,
-        'modelos_unicos': modelos.count(),
-        'grades_unicas': grades.count()
-    }
-    
-    # 6. Importações Recentes
-    importacoes_recentes = importacoes.order_by('-created_at')[:10]
-    
-    # 7. Totais para o resumo geral de rentabilidade
-    rentabilidade_totals = {
-        'total_investido': sum([item['total_investido'] for item in rentabilidade_modelo]),
-        'total_vendido': sum([item['total_vendido'] for item in rentabilidade_modelo]),
-        'total_lucro': sum([item['lucro_total'] for item in rentabilidade_modelo])
-    }
-    
-    # 8. Métricas de performance para análise
-    performance_metrics = {
-        'modelos_lucrativos': len([item for item in rentabilidade_modelo if item['lucro_total'] > 0]),
-        'modelos_prejuizo': len([item for item in rentabilidade_modelo if item['lucro_total'] < 0]),
-        'melhor_modelo': max(rentabilidade_modelo, key=lambda x: x['margem_media']) if rentabilidade_modelo else None,
-        'pior_modelo': min(rentabilidade_modelo, key=lambda x: x['margem_media']) if rentabilidade_modelo else None
-    }
-    
-    context = {
-        'rentabilidade_modelo': sorted(rentabilidade_modelo, key=lambda x: x['margem_media'], reverse=True),
-        'rentabilidade_totals': rentabilidade_totals,
-        'performance_metrics': performance_metrics,
-        'status_report': status_report,
-        'analise_custos': analise_custos,
-        'performance_grade': sorted(performance_grade, key=lambda x: x['margem_media'], reverse=True),
-        'estatisticas_gerais': estatisticas_gerais,
-        'importacoes_recentes': importacoes_recentes,
-    }
-    
-    return render(request, 'relatorios/index.html', context)
+    # Resultados persistidos por versão dos dados (compartilhados com as exportações)
+    dados = report_store.obter_relatorios(
+        request.user, report_renderers.TIPOS_PAGINA, versao_da_requisicao(request),
+    )
+    return render(request, 'relatorios/index.html', report_renderers.contexto_relatorios(dados))
 
-# Export Functions
-def generate_chart_base64(data, chart_type='bar', title='Chart', xlabel='X', ylabel='Y'):
-    """Generate a base64 encoded chart for PDF reports"""
-    plt.figure(figsize=(10, 6))
-    
-    if chart_type == 'bar':
-        plt.bar(range(len(data)), [item['value'] for item in data])
-        plt.xticks(range(len(data)), [item['label'] for item in data], rotation=45)
-    elif chart_type == 'pie':
-        plt.pie([item['value'] for item in data], labels=[item['label'] for item in data], autopct='%1.1f%%')
-    
-    plt.title(title)
-    plt.xlabel(xlabel)
-    plt.ylabel(ylabel)
-    plt.tight_layout()
-    
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format='png', dpi=300, bbox_inches='tight')
-    buffer.seek(0)
-    image_base64 = base64.b64encode(buffer.getvalue()).decode()
-    plt.close()
-    
-    return image_base64
+def _tipo_exportavel(tipos):
+    """404 para tipos de relatório que o formato não exporta; vem antes do ETag para que um
+    tipo inválido não vire 304 nem um arquivo vazio"""
+    def decorator(view):
+        @wraps(view)
+        def verificar(request, tipo_relatorio):
+            if tipo_relatorio not in tipos:
+                raise Http404("Relatório não encontrado")
+            return view(request, tipo_relatorio)
+        return verificar
+    return decorator
 
 @login_required
+@_tipo_exportavel(report_renderers.TIPOS_PDF)
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=etag_dados, last_modified_func=last_modified_dados)
 def export_relatorio_pdf(request, tipo_relatorio):
     """Export reports to PDF"""
     if not EXPORT_AVAILABLE:
-        messages.error(request, 'Bibliotecas de exportação não estão instaladas. Execute: pip install reportlab xlsxwriter matplotlib seaborn')
+        messages.error(request, 'Bibliotecas de exportação não estão instaladas. Execute: pip install reportlab xlsxwriter')
         return redirect('core:relatorios')
     
-    user = request.user
-    importacoes = Importacao.objects.filter(user=user)
-    
-    # Create PDF buffer
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Title style
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        spaceAfter=30,
-        alignment=1  # Center alignment
+    versao = versao_da_requisicao(request)
+    # Arquivo pré-gerado por precompute_relatorios, se a versão dos dados ainda for a mesma
+    conteudo = report_store.obter_exportacao(request.user, f'pdf:{tipo_relatorio}', versao)
+    if conteudo is not None:
+        arquivo = io.BytesIO(conteudo)
+    else:
+        dados = report_store.obter_relatorios(request.user, report_renderers.TIPOS_PDF[tipo_relatorio], versao)
+        # Gerado em arquivo temporário e enviado em blocos (relatórios grandes vão para o disco)
+        arquivo = report_renderers.pdf_temporario(tipo_relatorio, dados)
+    
+    return FileResponse(
+        arquivo,
+        as_attachment=True,
+        filename=f'relatorio_{tipo_relatorio}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf',
+        content_type='application/pdf',
     )
-    
-    if tipo_relatorio == 'rentabilidade':
-        # Rentability Report
-        elements.append(Paragraph("Relatório de Rentabilidade por Modelo", title_style))
-        elements.append(Spacer(1, 12))
-        
-        # Generate data
-        rentabilidade_modelo = []
-        modelos = importacoes.values('modelo').distinct()
-        
-        for modelo_dict in modelos:
-            modelo = modelo_dict['modelo']
-            modelo_importacoes = importacoes.filter(modelo=modelo)
-            
-            total_investido = sum([imp.custo_total_quantidade_brl for imp in modelo_importacoes])
-            vendidos = modelo_importacoes.filter(status='vendido')
-            total_vendido = sum([imp.preco_venda_unitario * imp.quantidade for imp in vendidos if imp.preco_venda_unitario])
-            lucro_total = sum([imp.lucro_total for imp in vendidos if imp.lucro_total])
-            
-            rentabilidade_modelo.append({
-                'modelo': modelo,
-                'total_importacoes': modelo_importacoes.count(),
-                'total_investido': total_investido,
-                'lucro_total': lucro_total,
-                'margem_media': (lucro_total / total_investido * 100) if total_investido > 0 else 0
-            })
-        
-        # Create table
-        data = [['Modelo', 'Importações', 'Investido (R$)', 'Lucro (R$)', 'Margem (%)']]
-        for item in sorted(rentabilidade_modelo, key=lambda x: x['margem_media'], reverse=True):
-            data.append([
-                item['modelo'],
-                str(item['total_importacoes']),
-                f"R$ {item['total_investido']:,.2f}",
-                f"R$ {item['lucro_total']:,.2f}",
-                f"{item['margem_media']:.1f}%"
-            ])
-        
-        table = Table(data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(table)
-        
-    elif tipo_relatorio == 'status':
-        # Status Report
-        elements.append(Paragraph("Relatório de Status das Importações", title_style))
-        elements.append(Spacer(1, 12))
-        
-        # Generate data
-        status_report = []
-        for status_choice in Importacao.STATUS_CHOICES:
-            status_key = status_choice[0]
-            status_importacoes = importacoes.filter(status=status_key)
-            if status_importacoes.exists():
-                total_valor = sum([imp.custo_total_quantidade_brl for imp in status_importacoes])
-                total_unidades = sum([imp.quantidade for imp in status_importacoes])
-                status_report.append({
-                    'status': status_choice[1],
-                    'count': status_importacoes.count(),
-                    'total_unidades': total_unidades,
-                    'total_valor': total_valor
-                })
-        
-        # Create table
-        data = [['Status', 'Importações', 'Unidades', 'Valor Total (R$)']]
-        for item in status_report:
-            data.append([
-                item['status'],
-                str(item['count']),
-                str(item['total_unidades']),
-                f"R$ {item['total_valor']:,.2f}"
-            ])
-        
-        table = Table(data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(table)
-    
-    elif tipo_relatorio == 'completo':
-        # Complete Report
-        elements.append(Paragraph("Relatório Completo de Importações", title_style))
-        elements.append(Spacer(1, 12))
-        
-        # Summary statistics
-        total_importacoes = importacoes.count()
-        total_unidades = sum([imp.quantidade for imp in importacoes])
-        total_investido = sum([imp.custo_total_quantidade_brl for imp in importacoes])
-        
-        summary_data = [
-            ['Métrica', 'Valor'],
-            ['Total de Importações', str(total_importacoes)],
-            ['Total de Unidades', str(total_unidades)],
-            ['Total Investido', f"R$ {total_investido:,.2f}"]
-        ]
-        
-        summary_table = Table(summary_data)
-        summary_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(summary_table)
-        elements.append(Spacer(1, 20))
-        
-        # Detailed importations
-        elements.append(Paragraph("Detalhes das Importações", styles['Heading2']))
-        elements.append(Spacer(1, 12))
-        
-        detail_data = [['Modelo', 'Capacidade', 'Grade', 'Qtd', 'Status', 'Custo Unit. (R$)']]
-        for imp in importacoes.order_by('-created_at')[:20]:  # Last 20 imports
-            detail_data.append([
-                imp.modelo,
-                f"{imp.capacidade_gb}GB",
-                imp.grade,
-                str(imp.quantidade),
-                dict(Importacao.STATUS_CHOICES)[imp.status],
-                f"R$ {imp.custo_total_py_brl:,.2f}"
-            ])
-        
-        detail_table = Table(detail_data)
-        detail_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('FONTSIZE', (0, 1), (-1, -1), 8),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(detail_table)
-    
-    # Build PDF
-    doc.build(elements)
-    buffer.seek(0)
-    
-    # Return PDF response
-    response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="relatorio_{tipo_relatorio}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf"'
-    return response
 
 @login_required
+@_tipo_exportavel(report_renderers.TIPOS_EXCEL)
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=etag_dados, last_modified_func=last_modified_dados)
 def export_relatorio_excel(request, tipo_relatorio):
     """Export reports to Excel"""
     if not EXPORT_AVAILABLE:
-        messages.error(request, 'Bibliotecas de exportação não estão instaladas. Execute: pip install reportlab xlsxwriter matplotlib seaborn')
+        messages.error(request, 'Bibliotecas de exportação não estão instaladas. Execute: pip install reportlab xlsxwriter')
         return redirect('core:relatorios')
     
-    user = request.user
-    importacoes = Importacao.objects.filter(user=user)
-    
-    # Create Excel buffer
-    buffer = io.BytesIO()
-    workbook = xlsxwriter.Workbook(buffer)
-    
-    # Define formats
-    header_format = workbook.add_format({
-        'bold': True,
-        'bg_color': '#D7E4BC',
-        'border': 1
-    })
-    
-    currency_format = workbook.add_format({
-        'num_format': 'R$ #,##0.00',
-        'border': 1
-    })
+    versao = versao_da_requisicao(request)
+    conteudo = report_store.obter_exportacao(request.user, f'xlsx:{tipo_relatorio}', versao)
+    if conteudo is None:
+        dados = report_store.obter_relatorios(request.user, report_renderers.TIPOS_EXCEL[tipo_relatorio], versao)
+        conteudo = report_renderers.render_xlsx(tipo_relatorio, dados)
     
-    percent_format = workbook.add_format({
-        'num_format': '0.0%',
-        'border': 1
-    })
-    
-    number_format = workbook.add_format({
-        'border': 1
-    })
-    
-    if tipo_relatorio == 'rentabilidade':
-        worksheet = workbook.add_worksheet('Rentabilidade por Modelo')
-        
-        # Headers
-        headers = ['Modelo', 'Total Importações', 'Total Unidades', 'Total Investido (R$)', 'Total Vendido (R$)', 'Lucro Total (R$)', 'Margem Média (%)']
-        for col, header in enumerate(headers):
-            worksheet.write(0, col, header, header_format)
-        
-        # Data
-        modelos = importacoes.values('modelo').distinct()
-        row = 1
-        
-        for modelo_dict in modelos:
-            modelo = modelo_dict['modelo']
-            modelo_importacoes = importacoes.filter(modelo=modelo)
-            
-            total_investido = sum([imp.custo_total_quantidade_brl for imp in modelo_importacoes])
-            vendidos = modelo_importacoes.filter(status='vendido')
-            total_vendido = sum([imp.preco_venda_unitario * imp.quantidade for imp in vendidos if imp.preco_venda_unitario])
-            lucro_total = sum([imp.lucro_total for imp in vendidos if imp.lucro_total])
-            margem_media = (lucro_total / total_investido) if total_investido > 0 else 0
-            
-            worksheet.write(row, 0, modelo, number_format)
-            worksheet.write(row, 1, modelo_importacoes.count(), number_format)
-            worksheet.write(row, 2, sum([imp.quantidade for imp in modelo_importacoes]), number_format)
-            worksheet.write(row, 3, float(total_investido), currency_format)
-            worksheet.write(row, 4, float(total_vendido), currency_format)
-            worksheet.write(row, 5, float(lucro_total), currency_format)
-            worksheet.write(row, 6, margem_media, percent_format)
-            row += 1
-        
-        # Auto-adjust column widths
-        worksheet.set_column('A:A', 15)
-        worksheet.set_column('B:C', 12)
-        worksheet.set_column('D:F', 18)
-        worksheet.set_column('G:G', 15)
-    
-    elif tipo_relatorio == 'completo':
-        # Summary sheet
-        summary_sheet = workbook.add_worksheet('Resumo')
-        
-        summary_data = [
-            ['Métrica', 'Valor'],
-            ['Total de Importações', importacoes.count()],
-            ['Total de Unidades', sum([imp.quantidade for imp in importacoes])],
-            ['Total Investido (R$)', float(sum([imp.custo_total_quantidade_brl for imp in importacoes]))],
-            ['Modelos Únicos', importacoes.values('modelo').distinct().count()],
-            ['Grades Únicas', importacoes.values('grade').distinct().count()]
-        ]
-        
-        for row, (metric, value) in enumerate(summary_data):
-            if row == 0:
-                summary_sheet.write(row, 0, metric, header_format)
-                summary_sheet.write(row, 1, value, header_format)
-            else:
-                summary_sheet.write(row, 0, metric, number_format)
-                if 'Investido' in metric:
-                    summary_sheet.write(row, 1, value, currency_format)
-                else:
-                    summary_sheet.write(row, 1, value, number_format)
-        
-        summary_sheet.set_column('A:A', 20)
-        summary_sheet.set_column('B:B', 15)
-        
-        # Detailed sheet
-        detail_sheet = workbook.add_worksheet('Detalhes das Importações')
-        
-        detail_headers = [
-            'Modelo', 'Capacidade (GB)', 'Grade', 'Quantidade', 'Status',
-            'Valor EUA (USD)', 'Custo Total EUA (R$)', 'Custo Total PY (R$)',
-            'Preço Venda (R$)', 'Lucro (R$)', 'Data Criação'
-        ]
-        
-        for col, header in enumerate(detail_headers):
-            detail_sheet.write(0, col, header, header_format)
-        
-        for row, imp in enumerate(importacoes.order_by('-created_at'), 1):
-            detail_sheet.write(row, 0, imp.modelo, number_format)
-            detail_sheet.write(row, 1, imp.capacidade_gb, number_format)
-            detail_sheet.write(row, 2, imp.grade, number_format)
-            detail_sheet.write(row, 3, imp.quantidade, number_format)
-            detail_sheet.write(row, 4, dict(Importacao.STATUS_CHOICES)[imp.status], number_format)
-            detail_sheet.write(row, 5, float(imp.valor_eua_unitario), currency_format)
-            detail_sheet.write(row, 6, float(imp.custo_eua_brl), currency_format)
-            detail_sheet.write(row, 7, float(imp.custo_total_py_brl), currency_format)
-            detail_sheet.write(row, 8, float(imp.preco_venda_unitario or 0), currency_format)
-            detail_sheet.write(row, 9, float(imp.lucro_unitario or 0), currency_format)
-            detail_sheet.write(row, 10, imp.created_at.strftime('%d/%m/%Y %H:%M'), number_format)
-        
-        # Auto-adjust column widths
-        detail_sheet.set_column('A:A', 15)
-        detail_sheet.set_column('B:E', 12)
-        detail_sheet.set_column('F:J', 18)
-        detail_sheet.set_column('K:K', 16)
-    
-    workbook.close()
-    buffer.seek(0)
-    
-    # Return Excel response
     response = HttpResponse(
-        buffer.getvalue(),
+        conteudo,
         content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     )
     response['Content-Disposition'] = f'attachment; filename="relatorio_{tipo_relatorio}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx"'
     return response
 
 @login_required
-def relatorio_rentabilidade(request):
-    """Relatório detalhado de rentabilidade"""
-    user = request.user
-    importacoes = Importacao.objects.filter(user=user)
-    
-    # Detailed rentability analysis
-    rentabilidade_detalhada = []
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=etag_dados, last_modified_func=last_modified_dados)
+def export_relatorios_zip(request):
+    """Todos os relatórios em PDF e Excel em um único ZIP, enviado conforme os arquivos ficam prontos"""
+    if not EXPORT_AVAILABLE:
+        messages.error(request, 'Bibliotecas de exportação não estão instaladas. Execute: pip install reportlab xlsxwriter')
+        return redirect('core:relatorios')
     
-    for imp in importacoes:
-        if imp.preco_venda_unitario and imp.lucro_unitario:
-            rentabilidade_detalhada.append({
-                'importacao': imp,
-                'roi': (imp.lucro_unitario / imp.custo_total_py_brl * 100) if imp.custo_total_py_brl > 0 else 0,
-                'markup': ((imp.preco_venda_unitario - imp.custo_total_py_brl) / imp.custo_total_py_brl * 100) if imp.custo_total_py_brl > 0 else 0
-            })
+    versao = versao_da_requisicao(request)
+    # Arquivos pré-gerados por precompute_relatorios entram direto; só os que faltam são renderizados
+    prontas = report_store.obter_exportacoes(request.user, report_renderers.EXPORTACOES, versao)
+    tipos = report_bundle.tipos_faltantes(prontas)
+    # Uma única leitura dos dados para todos os arquivos renderizados
+    dados = report_store.obter_relatorios(request.user, tipos, versao) if tipos else {}
     
-    context = {
-        'rentabilidade_detalhada': sorted(rentabilidade_detalhada, key=lambda x: x['roi'], reverse=True),
-        'total_importacoes': importacoes.count(),
-        'importacoes_vendidas': len(rentabilidade_detalhada)
-    }
+    response = StreamingHttpResponse(
+        report_bundle.gerar_zip(dados, prontas, max_workers=settings.REPORT_BUNDLE_WORKERS),
+        content_type='application/zip',
+    )
+    response['Content-Disposition'] = f'attachment; filename="relatorios_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip"'
+    return response
+
+@login_required
+def avaliacao_cambio(request):
+    """Custo da carteira pelo câmbio registrado em cada importação e pela cotação de uma data"""
+    form = AvaliacaoCambioForm(request.GET or None)
+    data = (form.cleaned_data['data'] if form.is_valid() else None) or timezone.localdate()
+    cambio, linhas = cambios.avaliar_carteira(request.user, data)
+    return render(request, 'relatorios/cambio.html', {
+        'form': form,
+        'data': data,
+        'cambio': cambio,
+        'linhas': linhas,
+        'total_registrado': sum((linha.custo_brl_registrado for linha in linhas), Decimal('0.00')),
+        'total_na_data': sum((linha.custo_brl_na_data for linha in linhas), Decimal('0.00')) if cambio else None,
+    })
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=etag_dados, last_modified_func=last_modified_dados)
+def relatorio_rentabilidade(request):
+    """Relatório detalhado de rentabilidade"""
+    dados = report_store.obter_relatorios(
+        request.user, report_renderers.TIPOS_RENTABILIDADE, versao_da_requisicao(request),
+    )
+    context = report_renderers.contexto_rentabilidade(dados)
     
     return render(request, 'relatorios/rentabilidade_detalhada.html', context)
     pass
@@ -848,13 +647,106 @@ def admin_panel(request):
     total_usuarios = User.objects.count()
     total_importacoes_sistema = Importacao.objects.count()
     
+    # Perfis de requisição mais recentes (?_profile=1)
+    perfis_recentes = PerfilRequisicao.objects.defer('funcoes', 'queries')[:5]
+    
+    # Queries acima de SLOW_QUERY_THRESHOLD_MS
+    queries_lentas = QueryLenta.objects.defer('params', 'stack')[:5]
+    
     context = {
         'total_usuarios': total_usuarios,
         'total_importacoes_sistema': total_importacoes_sistema,
+        'perfis_recentes': perfis_recentes,
+        'queries_lentas': queries_lentas,
     }
     
     return render(request, 'admin/panel.html', context)
 
+@login_required
+def perfil_list(request):
+    """Perfis de requisição gravados pelo profiler (apenas para admins)"""
+    if request.user.role != 'admin':
+        messages.error(request, 'Acesso negado.')
+        return redirect('core:dashboard')
+    
+    perfis = PerfilRequisicao.objects.select_related('user').defer('funcoes', 'queries')
+    
+    return render(request, 'admin/perfis.html', {
+        'perfis': perfis,
+    })
+
+@login_required
+def perfil_detail(request, pk):
+    """Funções mais custosas e SQL de um perfil de requisição (apenas para admins)"""
+    if request.user.role != 'admin':
+        messages.error(request, 'Acesso negado.')
+        return redirect('core:dashboard')
+    
+    perfil = get_object_or_404(PerfilRequisicao.objects.select_related('user'), pk=pk)
+    
+    return render(request, 'admin/perfil_detail.html', {
+        'perfil': perfil,
+    })
+
+@login_required
+def query_lenta_list(request):
+    """Queries lentas registradas, com as mais custosas agrupadas por SQL (apenas para admins)"""
+    if request.user.role != 'admin':
+        messages.error(request, 'Acesso negado.')
+        return redirect('core:dashboard')
+    
+    # order_by() remove a ordenação padrão, que quebraria o agrupamento
+    mais_custosas = (
+        QueryLenta.objects.order_by()
+        .values('sql')
+        .annotate(ocorrencias=Count('id'), total_ms=Sum('duracao_ms'), max_ms=Max('duracao_ms'), ultima=Max('id'))
+        .order_by('-total_ms')[:10]
+    )
+    queries = QueryLenta.objects.select_related('user').defer('params')[:100]
+    
+    return render(request, 'admin/queries_lentas.html', {
+        'mais_custosas': mais_custosas,
+        'queries': queries,
+        'limite_ms': settings.SLOW_QUERY_THRESHOLD_MS,
+    })
+
+@login_required
+def query_lenta_explain(request, pk):
+    """Fragmento HTMX com o EXPLAIN de uma query lenta (apenas para admins)"""
+    if request.user.role != 'admin':
+        return HttpResponse('Acesso negado.', status=403)
+    
+    query = get_object_or_404(QueryLenta, pk=pk)
+    try:
+        plano = slow_queries.explain(query)
+        erro = None
+    except (ValueError, DatabaseError) as e:
+        plano = None
+        erro = str(e)
+    
+    return render(request, 'partials/explain.html', {
+        'query': query,
+        'plano': plano,
+        'erro': erro,
+    })
+
+def metricas(request):
+    """Métricas no formato Prometheus (admins ou token em Authorization: Bearer)"""
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    
+    token = settings.METRICS_TOKEN
+    autorizado = request.user.is_authenticated and request.user.role == 'admin'
+    if not autorizado and token:
+        autorizado = hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not autorizado:
+        return HttpResponse('Acesso negado.', status=403, content_type='text/plain; charset=utf-8')
+    
+    return HttpResponse(
+        metrics.render_prometheus(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
 @login_required
 def user_management(request):
     """Gestão de usuários (apenas para admins)"""
@@ -995,6 +887,8 @@ def user_toggle_status(request, user_id):
 def configuracoes(request):
     """Configurações do usuário"""
     config, created = ConfiguracaoPadrao.objects.get_or_create(user=request.user)
+    # Gravado: um POST inválido altera config sem salvar
+    cambio_padrao = config.cambio_usdt_padrao
     
     if request.method == 'POST':
         form = ConfiguracaoForm(request.POST, instance=config)
@@ -1007,6 +901,9 @@ def configuracoes(request):
     
     context = {
         'form': form,
+        'cambio_padrao': cambio_padrao,
+        'reavaliacao': bulk_updates.impacto_reavaliacao(request.user, cambio_padrao),
+        'reavaliacoes': ReavaliacaoCambio.objects.filter(user=request.user)[:5],
     }
     
     # Adicionar estatísticas para administradores
@@ -1017,3 +914,19 @@ def configuracoes(request):
         })
     
     return render(request, 'configuracoes/index.html', context)
+
+@login_required
+@require_http_methods(["POST"])
+def reavaliar_cambio(request):
+    """Aplica o câmbio padrão atual às importações em aberto (planejadas e em trânsito)"""
+    config, created = ConfiguracaoPadrao.objects.get_or_create(user=request.user)
+    reavaliacao = bulk_updates.reavaliar_cambio(request.user, config.cambio_usdt_padrao)
+    if reavaliacao:
+        messages.success(
+            request,
+            f'{reavaliacao.importacoes} importações reavaliadas com câmbio {reavaliacao.cambio_usdt:.4f} '
+            f'(impacto de R$ {reavaliacao.impacto_brl:.2f}).',
+        )
+    else:
+        messages.info(request, 'Nenhuma importação em aberto com câmbio diferente do padrão.')
+    return redirect('core:configuracoes')
@@ -0,0 +1,165 @@
+"""Versões async (ASGI) do dashboard, dos seus widgets e da página de relatórios.
+
+As consultas independentes de cada página (versão dos dados, agregados e linhas recentes) são
+disparadas juntas com asyncio.gather; ver core.async_db. Usadas por core.urls quando
+ASYNC_VIEWS=True, com o projeto servido por ASGI (uvicorn), que também mantém as conexões SSE
+do dashboard ao vivo (dashboard_eventos) sem ocupar um worker por navegador.
+"""
+import asyncio
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from . import live, report_renderers, report_store
+from .async_db import consultar, consultar_isolada
+from .models import Importacao
+from .versioning import aversao_dados, etag_dados, last_modified_dados, versao_dados
+
+# Tipos da página de relatórios: totais (query agrupada) e linhas recentes, calculados em paralelo
+TIPOS_TOTAIS = ['rentabilidade', 'status', 'grade', 'geral']
+TIPOS_RECENTES = ['recentes', 'custos']
+
+# Tipos de report_store de todos os widgets, lidos de uma vez a cada atualização ao vivo
+TIPOS_AO_VIVO = sorted({tipo for tipos in report_renderers.TIPOS_WIDGETS.values() for tipo in tipos})
+# Espera sugerida ao navegador antes de reconectar o SSE
+RECONEXAO_MS = 5000
+
+
+def _carregar_sessao(request):
+    # Usuário e mensagens vêm da sessão (banco): resolvidos aqui, ficam em cache no request
+    # para etag_dados/last_modified_dados, que o @condition chama de forma síncrona
+    if not request.user.is_authenticated:
+        return False
+    len(messages.get_messages(request))
+    return True
+
+
+def preparar(view):
+    """login_required para views async, que também carrega a versão dos dados do usuário"""
+    @wraps(view)
+    async def inner(request, *args, **kwargs):
+        if not await sync_to_async(_carregar_sessao)(request):
+            return redirect_to_login(request.get_full_path())
+        # Memoizado como em versioning.versao_da_requisicao
+        request._versao_dados = await aversao_dados(request.user)
+        return await view(request, *args, **kwargs)
+    return inner
+
+
+def _importacoes_recentes(user):
+    return list(Importacao.objects.filter(user=user).order_by('-created_at')[:5])
+
+
+@preparar
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=etag_dados, last_modified_func=last_modified_dados)
+async def dashboard(request):
+    """Dashboard principal: a página sai sem consultar os agregados e cada widget é carregado via HTMX.
+
+    Aberto, o dashboard recebe os widgets atualizados por SSE (dashboard_eventos).
+    """
+    return await sync_to_async(render)(request, 'dashboard/index.html', {'ao_vivo': True})
+
+
+@preparar
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=etag_dados, last_modified_func=last_modified_dados)
+async def dashboard_widget(request, widget):
+    """Um widget do dashboard (fragmento HTMX), revalidado por ETag independentemente dos demais"""
+    if widget not in report_renderers.TIPOS_WIDGETS:
+        raise Http404("Widget não encontrado")
+    if widget == 'recentes':
+        context = {'importacoes_recentes': await consultar(_importacoes_recentes, request.user)}
+    else:
+        dados = await consultar(
+            report_store.obter_relatorios, request.user, report_renderers.TIPOS_WIDGETS[widget],
+            request._versao_dados,
+        )
+        context = report_renderers.contexto_widget(widget, dados)
+    return await sync_to_async(render)(request, f'dashboard/widgets/{widget}.html', context)
+
+
+@preparar
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=etag_dados, last_modified_func=last_modified_dados)
+async def relatorios(request):
+    """Página principal de relatórios com múltiplos relatórios úteis"""
+    totais, recentes = await asyncio.gather(
+        consultar(report_store.obter_relatorios, request.user, TIPOS_TOTAIS, request._versao_dados),
+        consultar(report_store.obter_relatorios, request.user, TIPOS_RECENTES, request._versao_dados),
+    )
+    context = report_renderers.contexto_relatorios({**totais, **recentes})
+    return await sync_to_async(render)(request, 'relatorios/index.html', context)
+
+
+def _token_atual(user):
+    return versao_dados(user).token
+
+
+def _widgets_atualizados(user):
+    """HTML de cada widget do dashboard na versão atual dos dados: (token da versão, {widget: html})"""
+    versao = versao_dados(user)
+    dados = report_store.obter_relatorios(user, TIPOS_AO_VIVO, versao)
+    widgets = {}
+    for widget in report_renderers.TIPOS_WIDGETS:
+        if widget == 'recentes':
+            context = {'importacoes_recentes': _importacoes_recentes(user)}
+        else:
+            context = report_renderers.contexto_widget(widget, dados)
+        widgets[widget] = render_to_string(f'dashboard/widgets/{widget}.html', context)
+    return versao.token, widgets
+
+
+def _evento(nome, dados, id=None):
+    """Um evento no formato text/event-stream (cada linha do HTML vira uma linha `data:`)"""
+    linhas = [f'event: {nome}'] + ([f'id: {id}'] if id else [])
+    linhas += [f'data: {linha}' for linha in dados.splitlines() or ['']]
+    return '\n'.join(linhas) + '\n\n'
+
+
+async def _eventos(user, token):
+    """Envia os widgets sempre que a versão dos dados de `user` deixa de ser `token`.
+
+    Acorda com o aviso do pub/sub (core.live) ou a cada DASHBOARD_SSE_POLL_SECONDS, o que vier
+    primeiro; sem alteração, envia só um comentário, que mantém proxies com a conexão aberta.
+    """
+    fim = time.monotonic() + settings.DASHBOARD_SSE_MAX_SECONDS
+    with live.assinar(user.pk) as assinatura:
+        yield f'retry: {RECONEXAO_MS}\n\n'
+        # Lida já com a assinatura ativa: uma escrita anterior a ela não passa despercebida
+        atual = await consultar_isolada(_token_atual, user)
+        while True:
+            if atual != token:
+                token, widgets = await consultar_isolada(_widgets_atualizados, user)
+                for widget, html in widgets.items():
+                    # O id volta no Last-Event-ID da reconexão: nada se perde entre conexões
+                    yield _evento(widget, html, id=token)
+            restante = fim - time.monotonic()
+            if restante <= 0:
+                return
+            if not await assinatura.aguardar(min(settings.DASHBOARD_SSE_POLL_SECONDS, restante)):
+                yield ': sem alterações\n\n'
+            atual = await consultar_isolada(_token_atual, user)
+
+
+@preparar
+async def dashboard_eventos(request):
+    """Widgets do dashboard atualizados ao vivo (Server-Sent Events) a cada alteração dos dados.
+
+    O navegador reconecta sozinho ao fim de cada conexão, informando a versão que já exibe.
+    """
+    token = request.headers.get('Last-Event-ID') or request._versao_dados.token
+    response = StreamingHttpResponse(_eventos(request.user, token), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Proxies (nginx) repassam cada evento sem esperar o buffer encher
+    response['X-Accel-Buffering'] = 'no'
+    return response
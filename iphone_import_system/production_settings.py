@@ -54,6 +54,13 @@ else:
         }
     }
 
+# Conexões persistentes com o Postgres (segundos; 0 fecha a conexão ao fim de cada requisição).
+# Necessárias antes de ligar ASYNC_PARALLEL_QUERIES: os threads do pool das views async mantêm
+# suas conexões em vez de abrir uma nova no pooler a cada consulta.
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    DATABASES['default']['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=0, cast=int)
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
 # Session configuration for production
 SESSION_COOKIE_SECURE = config('SESSION_COOKIE_SECURE', default=True, cast=bool)
 SESSION_COOKIE_HTTPONLY = True
@@ -66,12 +73,33 @@ CSRF_COOKIE_HTTPONLY = True
 CSRF_COOKIE_SAMESITE = 'Lax'
 
 # Logging configuration
+# Logs em JSON (um objeto por linha, com request_id) escritos por um thread dedicado,
+# para que o stdout nunca bloqueie a requisição. LOG_FORMAT=text para leitura humana.
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {
+            '()': 'core.log.RequestIdFilter',
+        },
+        'sampling': {
+            '()': 'core.log.SamplingFilter',
+            'rates': LOG_SAMPLING,
+        },
+    },
+    'formatters': {
+        'json': {
+            '()': 'core.log.JsonFormatter',
+        },
+        'text': {
+            'format': '%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s',
+        },
+    },
     'handlers': {
         'console': {
-            'class': 'logging.StreamHandler',
+            'class': 'core.log.AsyncStreamHandler',
+            'formatter': config('LOG_FORMAT', default='json'),
+            'filters': ['request_id', 'sampling'],
         },
     },
     'root': {
@@ -83,5 +111,10 @@ LOGGING = {
             'level': config('DJANGO_LOG_LEVEL', default='INFO'),
             'propagate': False,
         },
+        'core': {
+            'handlers': ['console'],
+            'level': config('CORE_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
     },
 }
@@ -80,11 +80,17 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.RequestIdMiddleware',
+    'core.middleware.SlowQueryMiddleware',
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ServerTimingMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django_htmx.middleware.HtmxMiddleware',
+    'core.middleware.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -93,7 +99,8 @@ ROOT_URLCONF = 'iphone_import_system.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Backend padrão do Django, com medição de renderização para o Server-Timing
+        'BACKEND': 'core.template_backends.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -264,3 +271,61 @@ ALLOWED_HOSTS = ['localhost', '127.0.0.1', '*']
 # Configurações de sessão
 SESSION_COOKIE_AGE = 86400  # 24 horas
 SESSION_SAVE_EVERY_REQUEST = True
+
+# Performance
+# Em DEBUG, avisa no log quando uma view excede seu limite em core.middleware.QUERY_BUDGETS
+QUERY_BUDGET_WARNINGS = config('QUERY_BUDGET_WARNINGS', default=True, cast=bool)
+
+# Header Server-Timing + linha de log com tempos de banco, view e renderização por requisição.
+# Desligado, o middleware é removido da cadeia (custo zero).
+SERVER_TIMING_ENABLED = config('SERVER_TIMING_ENABLED', default=False, cast=bool)
+
+# Endpoint /metrics (formato Prometheus), acessível por admins ou com
+# "Authorization: Bearer <METRICS_TOKEN>". Cada worker grava seu snapshot em
+# METRICS_DIR (padrão: <tmp>/iphone-import-metrics) a cada METRICS_FLUSH_INTERVAL segundos.
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=5, cast=int)
+
+# Profiler sob demanda: admins adicionam ?_profile=1 (ou o header X-Profile: 1) a qualquer
+# página e o resultado aparece em Administração > Perfis de Requisição. Ligado só em DEBUG;
+# em produção, PROFILER_ENABLED=True habilita.
+PROFILER_ENABLED = config('PROFILER_ENABLED', default=DEBUG, cast=bool)
+PROFILER_MAX_PROFILES = config('PROFILER_MAX_PROFILES', default=50, cast=int)
+
+# Log de queries lentas (Administração > Queries Lentas), mantido como buffer circular. Ligado só
+# em DEBUG; em produção, SLOW_QUERY_LOG_ENABLED=True habilita. O EXPLAIN sob demanda roda na
+# conexão da requisição do admin e também precisa de opt-in (SLOW_QUERY_EXPLAIN_ENABLED).
+SLOW_QUERY_LOG_ENABLED = config('SLOW_QUERY_LOG_ENABLED', default=DEBUG, cast=bool)
+SLOW_QUERY_EXPLAIN_ENABLED = config('SLOW_QUERY_EXPLAIN_ENABLED', default=DEBUG, cast=bool)
+SLOW_QUERY_THRESHOLD_MS = config('SLOW_QUERY_THRESHOLD_MS', default=200, cast=float)
+SLOW_QUERY_MAX_ENTRIES = config('SLOW_QUERY_MAX_ENTRIES', default=500, cast=int)
+
+# Amostragem de logs abaixo de WARNING por logger (fração mantida), ex.: LOG_SAMPLING=core.views=0.1,django.db=0.01
+LOG_SAMPLING = {
+    nome.strip(): float(taxa)
+    for nome, taxa in (item.split('=') for item in config('LOG_SAMPLING', default='', cast=Csv()))
+}
+
+# Threads usados para renderizar os arquivos do pacote ZIP de relatórios
+REPORT_BUNDLE_WORKERS = config('REPORT_BUNDLE_WORKERS', default=4, cast=int)
+
+# Dashboard e relatórios em versão async (servir via ASGI: ver Procfile). Com
+# ASYNC_PARALLEL_QUERIES as consultas independentes rodam em conexões paralelas. Desligado por
+# padrão: cada consulta paralela usa a conexão do seu thread e, sem conexões persistentes
+# (DB_CONN_MAX_AGE em production_settings), abre uma conexão TLS nova com o Postgres, o que custa
+# mais do que o paralelismo economiza. Só ligar depois de medir contra o banco de produção.
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+ASYNC_PARALLEL_QUERIES = config('ASYNC_PARALLEL_QUERIES', default=False, cast=bool)
+
+# Dashboard ao vivo (SSE, com ASYNC_VIEWS): intervalo da consulta da versão dos dados, que
+# percebe escritas feitas em outros processos, e duração máxima de cada conexão (o navegador
+# reconecta sozinho, revalidando a sessão)
+DASHBOARD_SSE_POLL_SECONDS = config('DASHBOARD_SSE_POLL_SECONDS', default=15, cast=float)
+DASHBOARD_SSE_MAX_SECONDS = config('DASHBOARD_SSE_MAX_SECONDS', default=1800, cast=float)
+
+# Histórico de preços (core.price_history): observações gravadas em lote depois da resposta,
+# quando juntam PRICE_HISTORY_BATCH_SIZE ou a mais antiga passa de PRICE_HISTORY_FLUSH_SECONDS
+PRICE_HISTORY_FLUSH_SECONDS = config('PRICE_HISTORY_FLUSH_SECONDS', default=5, cast=float)
+PRICE_HISTORY_BATCH_SIZE = config('PRICE_HISTORY_BATCH_SIZE', default=500, cast=int)
@@ -48,6 +48,9 @@ except Exception as e:
 echo "=== Testing Django setup ==="
 python manage.py check || echo "Django check failed, continuing anyway..."
 
+# Reset per-worker metric snapshots from previous runs (see METRICS_DIR)
+rm -rf "${METRICS_DIR:-/tmp/iphone-import-metrics}"
+
 # Start the application with Gunicorn
 echo "=== Starting Gunicorn server ==="
 echo "Binding to 0.0.0.0:${PORT:-8000}"